@@ -0,0 +1,241 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+"""
+Graph operation benchmarks.
+
+Builds synthetic notebooks of several shapes and sizes and times the graph operations that scale with them:
+    build - creating the cells
+    link - linking the cells, every link is checked for cycles
+    layers - computing every cell's layer from scratch
+    execute - running the whole graph, with cells that do nothing, which measures scheduling overhead
+    save_satx, load_satx, save_satb, load_satb - writing the notebook to a file and reading it back
+
+Shapes:
+    wide - the root is linked to every other cell
+    deep - the cells form one chain
+    diamond - repeated diamonds, one cell fanning out to DIAMOND_WIDTH cells that all link to the next cell
+    random - every cell links to up to RANDOM_PARENTS random earlier cells. Cells are created in a random order, so
+             links also arrive out of order
+
+Results are written as JSON in a format that stays the same between versions, so two result files can be compared with
+--compare. Random graphs use a fixed seed, so every run measures the same graphs.
+
+Run from the repository root:
+    python benchmarks/graphs.py --output results.json
+    python benchmarks/graphs.py --sizes 10 100 1000 10000 100000 --compare results.json
+"""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from satyrn_python.interpreter import Cell, Interpreter  # noqa: E402
+from satyrn_python.output import OutputLog, install_router  # noqa: E402
+
+# Version of the results format, only changes when existing fields change meaning
+RESULTS_FORMAT = 1
+
+SHAPES = ("wide", "deep", "diamond", "random")
+OPERATIONS = ("build", "link", "layers", "execute", "save_satx", "load_satx", "save_satb", "load_satb")
+SIZES = (10, 100, 1000, 10000)
+
+DIAMOND_WIDTH = 4
+RANDOM_PARENTS = 3
+SEED = 20787
+
+# Results that changed by less than this fraction, or by less than NOISE_SECONDS, are reported as unchanged by --compare
+NOISE = 0.1
+NOISE_SECONDS = 0.001
+
+
+def make_edges(shape, size):
+    """
+    :param shape: One of SHAPES
+    :param size: Number of cells
+    :return: (order to create the cells in, list of (parent, child) links), cells are numbered 0 to size - 1
+    """
+    order = list(range(size))
+
+    if shape == "wide":
+        edges = [(0, child) for child in range(1, size)]
+
+    elif shape == "deep":
+        edges = [(parent, parent + 1) for parent in range(size - 1)]
+
+    elif shape == "diamond":
+        edges = []
+        top = 0
+        while top < size - 1:
+            middle = list(range(top + 1, min(size - 1, top + 1 + DIAMOND_WIDTH)))
+            bottom = middle[-1] + 1 if middle else top + 1
+            edges += [(top, cell) for cell in middle] + [(cell, bottom) for cell in middle]
+            if not middle:
+                edges.append((top, bottom))
+            top = bottom
+
+    elif shape == "random":
+        rng = random.Random(SEED + size)
+        edges = [(0, 1)] if size > 1 else []
+        for child in range(2, size):
+            edges += [(parent, child) for parent in sorted(set(rng.randrange(child) for _ in range(RANDOM_PARENTS)))]
+        # The root has to be created first, the rest are shuffled
+        rest = order[1:]
+        rng.shuffle(rest)
+        order = [0] + rest
+
+    else:
+        raise ValueError("Unknown shape " + shape)
+
+    return order, edges
+
+
+def timed(function):
+    """:return: (seconds `function` took, what it returned)."""
+    gc.collect()
+    start = time.perf_counter()
+    value = function()
+    return time.perf_counter() - start, value
+
+
+def run_case(shape, size, directory):
+    """
+    :param shape: One of SHAPES
+    :param size: Number of cells
+    :param directory: Directory for the files written by the save operations
+    :return: Dict of operation to seconds
+    """
+    order, edges = make_edges(shape, size)
+    names = ["c" + str(cell) for cell in range(size)]
+    seconds = {}
+
+    interpreter = Interpreter()
+    graph = interpreter.graph
+
+    def build():
+        for cell in order:
+            graph.add_cell(Cell(names[cell], "python", "pass"))
+
+    def link():
+        lookup = graph.names_to_indeces
+        for parent, child in edges:
+            graph.connect_cells(lookup[names[parent]], lookup[names[child]])
+
+    def layers():
+        graph.layers = None
+        return graph.get_layers()
+
+    def execute():
+        graph.bfs_traversal_execute()
+
+    seconds["build"], _ = timed(build)
+    seconds["link"], _ = timed(link)
+    seconds["layers"], _ = timed(layers)
+
+    # Cell announcements aren't part of what's measured
+    with install_router().route(OutputLog()):
+        seconds["execute"], _ = timed(execute)
+
+    for extension in ("satx", "satb"):
+        path = os.path.join(directory, shape + str(size) + "." + extension)
+        seconds["save_" + extension], _ = timed(lambda: graph.save_graph(path))
+
+        loader = Interpreter()
+        with install_router().route(OutputLog()):
+            seconds["load_" + extension], _ = timed(lambda: loader.load_notebook(path, run_commands=False))
+
+        if len(loader.graph.graph) != size or len(loader.graph.graph.edges) != len(graph.graph.edges):
+            raise RuntimeError(shape + " graph with " + str(size) + " cells didn't survive a ." + extension +
+                               " round trip")
+
+    return seconds
+
+
+def compare(results, baseline):
+    """
+    Prints how each result changed since the baseline.
+
+    :param results: Results dict from this run
+    :param baseline: Results dict from an earlier run
+    :return: Whether any result got slower by more than the noise thresholds
+    """
+    old = {(entry["shape"], entry["cells"], entry["operation"]): entry["seconds"] for entry in baseline["results"]}
+    slower = False
+
+    for entry in results["results"]:
+        key = (entry["shape"], entry["cells"], entry["operation"])
+        if key not in old or not old[key]:
+            continue
+        ratio = entry["seconds"] / old[key]
+        if abs(entry["seconds"] - old[key]) < NOISE_SECONDS:
+            continue
+        if ratio > 1 + NOISE:
+            verdict = "slower"
+            slower = True
+        elif ratio < 1 - NOISE:
+            verdict = "faster"
+        else:
+            continue
+        print("{:8} {:>7} {:10} {:.4f}s -> {:.4f}s ({:.2f}x, {})".format(key[0], key[1], key[2], old[key],
+                                                                         entry["seconds"], ratio, verdict))
+
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time graph operations on synthetic notebooks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="numbers of cells to test")
+    parser.add_argument("--shapes", nargs="+", default=SHAPES, choices=SHAPES, help="graph shapes to test")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the fastest one is kept")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    parser.add_argument("--compare", help="results file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    results = {"format": RESULTS_FORMAT,
+               "python": platform.python_version(),
+               "platform": platform.platform(),
+               "cpus": os.cpu_count(),
+               "results": []}
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for shape in args.shapes:
+            for size in sorted(args.sizes):
+                best = None
+                # Large cases take long enough that one run is representative
+                for _ in range(args.repeat if size <= 10000 else 1):
+                    seconds = run_case(shape, size, directory)
+                    best = seconds if best is None else {op: min(best[op], seconds[op]) for op in OPERATIONS}
+
+                edges = len(make_edges(shape, size)[1])
+                for operation in OPERATIONS:
+                    results["results"].append({"shape": shape, "cells": size, "edges": edges,
+                                               "operation": operation, "seconds": round(best[operation], 6)})
+
+                print("{:8} {:>7} ".format(shape, size) +
+                      " ".join("{}={:.4f}".format(op, best[op]) for op in OPERATIONS), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4, sort_keys=True)
+            file.write("\n")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline.get("format") != RESULTS_FORMAT:
+            print("Results formats differ, not comparing", file=sys.stderr)
+            return 0
+        return 1 if compare(results, baseline) else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
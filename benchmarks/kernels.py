@@ -0,0 +1,71 @@
+import argparse
+import importlib
+import os
+import sys
+import time
+
+"""
+Kernel pool benchmark.
+
+Measures the time to the first result of a fresh notebook whose root cell imports a heavy module, executed with the
+process backend. Cold, the kernel imports the module while the cell waits, which every execution paid when worker
+processes were started for it, on top of starting them. Warm, the kernel was started with the module preloaded, as
+`--preload` does, and had time to import it before the execution.
+
+The module is imported in this process before anything is timed, as `--preload` does for the Satyrn process, so only
+the worker's import is measured. The cold kernel is started before that, since kernels started by forking this process
+would inherit the module.
+
+Run from the repository root:
+    python benchmarks/kernels.py --module numpy
+"""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from satyrn_python.interpreter import Interpreter  # noqa: E402
+from satyrn_python.kernels import KernelPool  # noqa: E402
+from satyrn_python.output import OutputLog, install_router  # noqa: E402
+
+
+def first_result(kernels, module):
+    """:return: Seconds from starting the execution of a fresh notebook in `kernels` until all of its cells ran."""
+    interpreter = Interpreter(backend="process", kernels=kernels)
+
+    with install_router().route(OutputLog()):
+        interpreter.run_string("cell root python y:\nimport {0}\n;\n"
+                               "cell use python y:\nname = {0}.__name__\n;\nlink root use\n".format(module))
+
+        start = time.perf_counter()
+        interpreter.graph.bfs_traversal_execute(1, "process")
+        elapsed = time.perf_counter() - start
+
+    if interpreter.graph.get_cell("use").status != "succeeded":
+        raise RuntimeError("The notebook failed, is " + module + " installed?")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the time to the first result with cold and warm kernels")
+    parser.add_argument("--module", default="numpy", help="module the notebook's root cell imports")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds the warm kernel gets to preload the module")
+    args = parser.parse_args()
+
+    cold_pool = KernelPool(1)
+    importlib.import_module(args.module)
+
+    cold = first_result(cold_pool, args.module)
+    cold_pool.shutdown()
+
+    warm_pool = KernelPool(1, [args.module])
+    time.sleep(args.warmup)
+    warm = first_result(warm_pool, args.module)
+    warm_pool.shutdown()
+
+    print("cold kernel: {:.3f}s".format(cold))
+    print("warm kernel: {:.3f}s ({:.1f}x)".format(warm, cold / warm))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
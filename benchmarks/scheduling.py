@@ -0,0 +1,96 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+"""
+Scheduling benchmark.
+
+Builds an unbalanced notebook: one slow cell and many short chains of quick cells, all children of the root. When
+fewer workers than cells are allowed, the slow cell has to start early or it ends up running alone after everything
+else has finished. Before any cell has run, the scheduler only knows how many cells each chain has, so it starts the
+quick chains first. Once the notebook has duration history, the slow cell starts first.
+
+The notebook is executed once to record durations, saved and opened again, so the second execution only knows what was
+saved with the notebook. Both makespans are printed along with the lower bound, the larger of the critical path and
+the total duration divided by the number of workers.
+
+Cells sleep instead of computing, so the result doesn't depend on how many cores the machine has.
+
+Run from the repository root:
+    python benchmarks/scheduling.py
+"""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from satyrn_python.interpreter import Interpreter  # noqa: E402
+from satyrn_python.output import OutputLog, install_router  # noqa: E402
+
+
+def make_notebook(slow, quick, chains, length):
+    """
+    :param slow: Seconds the slow cell takes
+    :param quick: Seconds each quick cell takes
+    :param chains: Number of chains of quick cells
+    :param length: Number of quick cells in each chain
+    :return: The notebook as .satx text
+    """
+    text = "cell root python y:\nimport time\n;\n"
+    text += "cell slow python y:\ntime.sleep({})\n;\nlink root slow\n".format(slow)
+
+    for chain in range(chains):
+        previous = "root"
+        for position in range(length):
+            name = "quick{}_{}".format(chain, position)
+            text += "cell {} python y:\ntime.sleep({})\n;\nlink {} {}\n".format(name, quick, previous, name)
+            previous = name
+
+    return text
+
+
+def makespan(interpreter, jobs):
+    """:return: Seconds a whole graph execution of `interpreter` takes with at most `jobs` cells running at once."""
+    with install_router().route(OutputLog()):
+        start = time.perf_counter()
+        interpreter.graph.bfs_traversal_execute(jobs)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare makespans before and after cells have duration history")
+    parser.add_argument("-j", "--jobs", type=int, default=2, help="maximum number of cells running at once")
+    parser.add_argument("--slow", type=float, default=1.0, help="seconds the slow cell takes")
+    parser.add_argument("--quick", type=float, default=0.05, help="seconds each quick cell takes")
+    parser.add_argument("--chains", type=int, default=8, help="number of chains of quick cells")
+    parser.add_argument("--length", type=int, default=3, help="number of quick cells in each chain")
+    args = parser.parse_args()
+
+    interpreter = Interpreter()
+    with install_router().route(OutputLog()):
+        interpreter.run_string(make_notebook(args.slow, args.quick, args.chains, args.length))
+
+    cold = makespan(interpreter, args.jobs)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "unbalanced.satx")
+        interpreter.graph.save_graph(path)
+
+        reopened = Interpreter()
+        with install_router().route(OutputLog()):
+            reopened.load_notebook(path, run_commands=False)
+
+    warm = makespan(reopened, args.jobs)
+
+    total = args.slow + args.quick * args.chains * args.length
+    bound = max(args.slow, args.quick * args.length, total / args.jobs)
+
+    print("without history: {:.3f}s".format(cold))
+    print("with history:    {:.3f}s ({:.2f}x)".format(warm, cold / warm))
+    print("lower bound:     {:.3f}s".format(bound))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+"""
+Startup benchmark.
+
+Measures how long a fresh Python process takes to import Satyrn, create an Interpreter and run a small notebook, which
+is what scripted and batch invocations pay on every run. Each sample is a new process so that nothing is already
+imported. The benchmark fails if the median is over the target, or if any module in DEFERRED_MODULES was imported,
+since those should only load when a command needs them.
+
+Run from the repository root:
+    python benchmarks/startup.py
+"""
+
+# Median startup time to stay under, in milliseconds
+TARGET_MS = 300
+
+# Modules that running a notebook from the CLI must not import
+DEFERRED_MODULES = ["matplotlib", "tkinter", "flask", "cheroot", "nbformat"]
+
+SCRIPT = """
+import json, sys
+from satyrn_python.interpreter import Interpreter
+Interpreter().run_string("cell a python y:\\nx = 1\\n;\\ncell b python y:\\ny = x + 1\\n;\\nlink a b\\n")
+print(json.dumps(sorted(name for name in {deferred} if name in sys.modules)))
+"""
+
+
+def sample(repository):
+    """
+    :param repository: Path of the repository root
+    :return: (seconds the process took, list of deferred modules it imported)
+    """
+    env = dict(os.environ, PYTHONPATH=repository + os.pathsep + os.environ.get("PYTHONPATH", ""))
+
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", SCRIPT.format(deferred=DEFERRED_MODULES)], env=env,
+                            stdout=subprocess.PIPE, check=True, universal_newlines=True)
+    elapsed = time.perf_counter() - start
+
+    return elapsed, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def baseline():
+    # Time a bare interpreter takes to start, so results can be compared between machines
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how long Satyrn takes to start")
+    parser.add_argument("-n", "--runs", type=int, default=15, help="number of processes to start")
+    parser.add_argument("--target", type=float, default=TARGET_MS, help="median to stay under, in milliseconds")
+    args = parser.parse_args()
+
+    repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    # The first run warms the disk cache and isn't counted
+    sample(repository)
+
+    times = []
+    imported = set()
+    for _ in range(args.runs):
+        elapsed, modules = sample(repository)
+        times.append(elapsed * 1000)
+        imported.update(modules)
+
+    python_ms = statistics.median(baseline() * 1000 for _ in range(5))
+    median = statistics.median(times)
+
+    print("python startup:  {:.1f} ms".format(python_ms))
+    print("satyrn startup:  {:.1f} ms median, {:.1f} ms min, {:.1f} ms max over {} runs".format(
+        median, min(times), max(times), args.runs))
+    print("target:          {:.1f} ms".format(args.target))
+
+    failed = False
+    if imported:
+        print("deferred modules imported: " + ", ".join(sorted(imported)))
+        failed = True
+    if median > args.target:
+        print("over target")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
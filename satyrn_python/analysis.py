@@ -0,0 +1,170 @@
+import ast
+import builtins
+import symtable
+import threading
+from collections import OrderedDict
+
+"""
+Static analysis of the variables cells read and write.
+
+Every Python cell is summarized by three sets of names:
+    reads - variables the cell looks up in its namespace, including globals used by functions and classes it defines
+    writes - variables the cell assigns, deletes, imports or defines
+    mutates - variables whose objects the cell modifies in place through item or attribute assignment, or by calling
+              one of the methods in MUTATING_METHODS on them
+
+Builtins are left out of reads unless the cell also writes them. The analysis is syntactic, so it can't see through
+exec, getattr or calls to other methods and functions that modify their arguments, but it is enough to find branches
+that step on each other and cells that depend on variables they have no link to. Cells whose mutates include variables
+they didn't create aren't added to the result cache, since replaying them can't modify their parents' objects.
+
+Results are cached by the hash of the cell's content, on each cell and in a cache shared by all cells.
+"""
+
+BUILTINS = frozenset(dir(builtins))
+
+CACHE_SIZE = 4096
+
+# Methods of the builtin containers and collections.deque that modify the object they are called on
+MUTATING_METHODS = frozenset(("append", "appendleft", "clear", "difference_update", "discard", "extend", "extendleft",
+                              "insert", "intersection_update", "pop", "popitem", "popleft", "remove", "reverse",
+                              "rotate", "setdefault", "sort", "symmetric_difference_update", "update"))
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class CellAccess:
+
+    def __init__(self, reads=frozenset(), writes=frozenset(), mutates=frozenset()):
+        """
+        :param reads: Names the cell reads from its namespace
+        :param writes: Names the cell binds or unbinds in its namespace
+        :param mutates: Names whose objects the cell modifies in place
+        """
+        self.reads = frozenset(reads)
+        self.writes = frozenset(writes)
+        self.mutates = frozenset(mutates)
+
+
+class _ModuleLevelVisitor(ast.NodeVisitor):
+
+    def __init__(self):
+        """Finds reads and in-place modifications that symtable doesn't report, without entering nested scopes."""
+        self.reads = set()
+        self.mutates = set()
+
+    def visit_FunctionDef(self, node):
+        # Decorators and defaults run at module level, the body doesn't
+        for child in node.decorator_list + node.args.defaults + node.args.kw_defaults:
+            if child is not None:
+                self.visit(child)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        for child in node.args.defaults + node.args.kw_defaults:
+            if child is not None:
+                self.visit(child)
+
+    def visit_AugAssign(self, node):
+        # x += 1 reads x, which symtable only reports as an assignment
+        if isinstance(node.target, ast.Name):
+            self.reads.add(node.target.id)
+        self.generic_visit(node)
+
+    def visit_Subscript(self, node):
+        self._record_mutation(node)
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        self._record_mutation(node)
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        # lst.append(1) modifies lst
+        if isinstance(node.func, ast.Attribute) and node.func.attr in MUTATING_METHODS:
+            self._record_base(node.func.value)
+        self.generic_visit(node)
+
+    def _record_mutation(self, node):
+        if isinstance(node.ctx, (ast.Store, ast.Del)):
+            self._record_base(node.value)
+
+    def _record_base(self, base):
+        # The variable an expression like a.b[0] starts from
+        while isinstance(base, (ast.Subscript, ast.Attribute)):
+            base = base.value
+        if isinstance(base, ast.Name):
+            self.mutates.add(base.id)
+
+
+def _global_reads_and_writes(table, reads, writes):
+    # Globals used or declared inside of functions and classes
+    for child in table.get_children():
+        for symbol in child.get_symbols():
+            if symbol.is_global() and symbol.is_referenced():
+                reads.add(symbol.get_name())
+            if symbol.is_declared_global() and symbol.is_assigned():
+                writes.add(symbol.get_name())
+        _global_reads_and_writes(child, reads, writes)
+
+
+def analyze(content):
+    """
+    :param content: Python code of a cell
+    :return: CellAccess describing the code. Code that doesn't parse reads and writes nothing
+    """
+    try:
+        tree = ast.parse(content)
+        table = symtable.symtable(content, "<cell>", "exec")
+    except (SyntaxError, ValueError):
+        return CellAccess()
+
+    reads = set()
+    writes = set()
+
+    for symbol in table.get_symbols():
+        if symbol.is_referenced():
+            reads.add(symbol.get_name())
+        if symbol.is_assigned() or symbol.is_imported():
+            writes.add(symbol.get_name())
+
+    _global_reads_and_writes(table, reads, writes)
+
+    visitor = _ModuleLevelVisitor()
+    visitor.visit(tree)
+    reads.update(visitor.reads)
+
+    reads = {name for name in reads if name not in BUILTINS or name in writes}
+
+    return CellAccess(reads, writes, visitor.mutates)
+
+
+def analyze_cell(cell):
+    """
+    :param cell: Cell to analyze
+    :return: CellAccess for the cell's content, empty for markdown cells
+    """
+    if not cell.content_type == "python":
+        return CellAccess()
+
+    key = cell.get_hash()
+    if cell.access is not None and cell.access[0] == key:
+        return cell.access[1]
+
+    with _cache_lock:
+        access = _cache.get(key)
+        if access is not None:
+            _cache.move_to_end(key)
+
+    if access is None:
+        access = analyze(cell.content)
+        with _cache_lock:
+            _cache[key] = access
+            if len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    # Graphs with more cells than the shared cache holds would otherwise analyze them all again every time
+    cell.access = (key, access)
+    return access
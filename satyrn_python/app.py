@@ -1,15 +1,24 @@
+import json
 import os
 import random
+import secrets
 import string
-import networkx as nx
 
-from contextlib import redirect_stdout
-from io import StringIO
+from flask import Flask, Response, abort, g, make_response, render_template, request, send_file
+from werkzeug.local import LocalProxy
 
-from flask import Flask, render_template, request, send_file
+from .asgi import POLL_KEY
+from .output import PAGE_SIZE, install_router
+from .profiling import SLOWEST_LIMIT
+from .sessions import DEFAULT_SESSION, IDLE_TIMEOUT, SessionManager, valid_session_id
 
 language = ""
 
+# Where requests name their session, see requested_session
+SESSION_ARGUMENT = "session"
+SESSION_HEADER = "X-Satyrn-Session"
+SESSION_COOKIE = "satyrn_session"
+
 
 def new_name():
     letters_and_digits = string.ascii_letters + string.digits
@@ -17,7 +26,34 @@ def new_name():
     return result_str
 
 
-def create_app(interpreter, lang):
+def with_root(interpreter):
+    """:return: `interpreter`, after adding the root cell the UI expects."""
+    interpreter.create_cell(["create_cell", "root", "python", "n"])
+    return interpreter
+
+
+def requested_session():
+    """:return: Id of the session the current request names, or None if it names none. Aborts if the id is invalid."""
+    session_id = (request.args.get(SESSION_ARGUMENT) or request.headers.get(SESSION_HEADER) or
+                  request.cookies.get(SESSION_COOKIE))
+
+    if session_id is not None and not valid_session_id(session_id):
+        abort(400, "Session ids may only contain letters, digits, - and _")
+    return session_id
+
+
+def create_app(interpreter, lang, factory=None, idle_timeout=IDLE_TIMEOUT, max_sessions=None, memory_limit=None,
+               session_dir=None):
+    """
+    :param interpreter: Interpreter of the default session, used by requests that don't name a session
+    :param lang: UI language
+    :param factory: Callable taking no arguments that returns an Interpreter for a new session. If None, the app only
+                    hosts `interpreter` and every request uses it
+    :param idle_timeout: Seconds a session may go unused before it is closed, see sessions
+    :param max_sessions: Maximum number of sessions, None for no limit
+    :param memory_limit: Bytes the variables of all sessions may use, None for no limit
+    :param session_dir: Directory to save the notebooks of closed sessions in, None to discard them
+    """
     # create and configure the app
     app = Flask(__name__, instance_relative_config=True)
     app.root_path = os.path.dirname(os.path.abspath(__file__)[:-6])
@@ -25,7 +61,51 @@ def create_app(interpreter, lang):
     global language
     language = lang
 
-    interpreter.create_cell(["create_cell", "root", "python", "n"])
+    keyed = factory is not None
+    if keyed:
+        sessions = SessionManager(lambda: with_root(factory()), idle_timeout, max_sessions, memory_limit, session_dir,
+                                  default=with_root(interpreter))
+    else:
+        sessions = SessionManager(None, None, default=with_root(interpreter))
+
+    def current_session():
+        """:return: Session of the current request, created if it doesn't exist yet. Aborts if there is no room."""
+        if "satyrn_session" not in g:
+            session = sessions.get((requested_session() if keyed else None) or DEFAULT_SESSION)
+            if session is None:
+                abort(503, "The server is hosting as many sessions as it can")
+            g.satyrn_session = session
+        return g.satyrn_session
+
+    # The routes below work on the session of the request they handle. Work that outlives a request, like jobs and
+    # streamed responses, has to hold on to the Session itself
+    interpreter = LocalProxy(lambda: current_session().interpreter)
+    jobs = LocalProxy(lambda: current_session().jobs)
+
+    def submit_execution(command, new_log=False):
+        """
+        Executions run in the background, in the session's JobQueue, so requests return right away.
+
+        :param command: execute command for the interpreter
+        :param new_log: Whether to start a new output log when the execution starts
+        :return: Response with the job's status. If the request asks to wait, it is sent once the job has finished
+        """
+        session = current_session()
+
+        def run(cancel):
+            target = session.interpreter
+            if new_log:
+                target.std_capture = target.new_output_log()
+            with install_router().route(target.std_capture):
+                target.execute(command, cancel)
+            sessions.check_memory()
+            with target.lock.read():
+                return {'failed': [cell['name'] for cell in target.graph.get_profile(0)['failed']]}
+
+        job = session.jobs.submit("execute", run)
+        if (request.get_json(silent=True) or {}).get('wait'):
+            job.wait()
+        return job.to_dict()
 
     # ensure the instance folder exists
     try:
@@ -35,7 +115,12 @@ def create_app(interpreter, lang):
 
     @app.route("/")
     def index():
-        return render_template("index.html")
+        response = make_response(render_template("index.html"))
+        if keyed:
+            # Browsers keep their session in a cookie, so every request the UI makes goes to it. Opening the UI with
+            # ?session=[id] joins that session instead
+            response.set_cookie(SESSION_COOKIE, requested_session() or secrets.token_urlsafe(12), samesite="Strict")
+        return response
 
     @app.route("/canvas.html")
     def canvas():
@@ -97,7 +182,7 @@ def create_app(interpreter, lang):
         old = data['old_name'].strip()
         new = data['new_name'].strip()
 
-        if new in interpreter.graph.get_all_cells_edges()[0]:
+        if interpreter.graph.has_cell(new):
             return "500"
 
         interpreter.rename_cell(['edit_cell', old, new])
@@ -110,30 +195,25 @@ def create_app(interpreter, lang):
         first = data['first'].strip()
         second = data['second'].strip()
 
-        nodes, _, edge_names = interpreter.graph.get_all_cells_edges()
+        with interpreter.lock.read():
+            first_idx = interpreter.graph.name_to_idx(first)
+            second_idx = interpreter.graph.name_to_idx(second)
 
-        if interpreter.graph.name_to_idx(second) == 0:
-            return "Can't link to root cell"
+            if second_idx == interpreter.graph.get_root_idx():
+                return "Can't link to root cell"
 
-        if interpreter.graph.name_to_idx(second) in \
-                nx.ancestors(interpreter.graph.graph, interpreter.graph.name_to_idx(first)):
-            return "Cycles are not allowed"
+            if interpreter.graph.would_create_cycle(first_idx, second_idx):
+                return "Cycles are not allowed"
 
         return "200"
 
     @app.route("/root_has_outputs/", methods=["POST"])
     def root_output_check():
-        c = 0
-
-        nodes, _, edge_names = interpreter.graph.get_all_cells_edges()
-        root_cell_name = interpreter.graph.get_cell("", 0).name
-
-        for e in edge_names:
-            if e[0] == root_cell_name:
-                c += 1
+        with interpreter.lock.read():
+            root_idx = interpreter.graph.get_root_idx()
 
-        if c > 0:
-            return "200"
+            if root_idx is not None and interpreter.graph.graph.out_degree(root_idx) > 0:
+                return "200"
 
         return "500"
 
@@ -150,11 +230,67 @@ def create_app(interpreter, lang):
 
     @app.route("/bfs_execute/", methods=["POST"])
     def bfs_execute():
-        interpreter.std_capture = StringIO()
-        with redirect_stdout(interpreter.std_capture):
-            interpreter.execute(["execute"])
+        data = request.get_json(silent=True) or {}
+
+        command = ["execute"]
+        if data.get('incremental'):
+            command.append("--incremental")
+
+        return submit_execution(command, new_log=True)
+
+    @app.route("/jobs/", methods=["GET"])
+    def list_jobs():
+        return {'jobs': [job.to_dict() for job in jobs.list()]}
+
+    @app.route("/jobs/<string:job_id>/", methods=["GET"])
+    def job_status(job_id):
+        job = jobs.get(job_id)
+        if not job:
+            return "500"
+
+        return job.to_dict()
+
+    @app.route("/jobs/<string:job_id>/cancel/", methods=["POST"])
+    def cancel_job(job_id):
+        job = jobs.get(job_id)
+        if not job:
+            return "500"
+
+        return {'cancelled': job.cancel(), 'job': job.to_dict()}
+
+    # Knowing a session's id is all it takes to use it, so clients only ever see and close their own session
+    @app.route("/session/", methods=["GET"])
+    def get_session():
+        return current_session().to_dict()
+
+    @app.route("/session/close/", methods=["POST"])
+    def close_session():
+        session_id = requested_session() if keyed else None
+        if not session_id or not sessions.close(session_id):
+            return "500"
         return "200"
 
+    @app.route("/analyze/", methods=["GET"])
+    def analyze():
+        with interpreter.lock.read():
+            accesses, conflicts, suggestions = interpreter.graph.analyze_access()
+            names = interpreter.graph.get_lookup_table()
+
+        return {'cells': {names[idx]: {'reads': sorted(access.reads),
+                                       'writes': sorted(access.writes),
+                                       'mutates': sorted(access.mutates)} for idx, access in accesses.items()},
+                'conflicts': [{'variable': name, 'first': names[a], 'second': names[b], 'kind': kind}
+                              for name, a, b, kind in conflicts],
+                'suggested_links': [{'first': names[parent], 'second': names[child], 'variable': name}
+                                    for parent, child, name in suggestions]}
+
+    @app.route("/profile/", methods=["GET"])
+    def profile():
+        limit = request.args.get('limit', SLOWEST_LIMIT, type=int)
+
+        with interpreter.lock.read():
+            return interpreter.graph.get_profile(limit)
+
     @app.route("/shutdown/", methods=["POST"])
     def shutdown():
         exit(0)
@@ -166,7 +302,8 @@ def create_app(interpreter, lang):
         lefts = data['lefts']
         tops = data['tops']
 
-        satx_text = interpreter.graph.get_satx_as_txt()
+        with interpreter.lock.read():
+            satx_text = interpreter.graph.get_satx_as_txt()
         satx_text += "\n<!--SATYRN_POSITIONING_START-->"
 
         for i, _ in enumerate(names):
@@ -187,11 +324,12 @@ def create_app(interpreter, lang):
         data = request.get_json()
         cell_name = data['cell_name'].strip()
 
-        og_cell = interpreter.graph.get_cell(cell_name)
+        with interpreter.editing():
+            og_cell = interpreter.graph.get_cell(cell_name)
 
-        interpreter.create_cell(['cell', og_cell.name + "-copy", og_cell.content_type, "n"])
-        interpreter.graph.get_cell(og_cell.name + "-copy").content = og_cell.content
-        interpreter.graph.get_cell(og_cell.name + "-copy").stdout = og_cell.stdout
+            interpreter.create_cell(['cell', og_cell.name + "-copy", og_cell.content_type, "n"])
+            interpreter.graph.get_cell(og_cell.name + "-copy").content = og_cell.content
+            interpreter.graph.get_cell(og_cell.name + "-copy").output = og_cell.output
 
         return {'cell_name': og_cell.name + "-copy",
                 'content': og_cell.content,
@@ -201,28 +339,96 @@ def create_app(interpreter, lang):
     def check_for_graph_has_name():
         cell_name = request.get_json().strip()
 
-        if cell_name in interpreter.graph.get_all_cells_edges()[0]:
+        if interpreter.graph.has_cell(cell_name):
             return "200"
         return "500"
 
     @app.route("/dynamic_cell_output/", methods=["GET"])
     def get_dynamic_cell_output():
-        if interpreter.graph.executing:
-            a = interpreter.std_capture.getvalue()
-            return a
-        return "<!--SATYRN_DONE_EXECUTING-->" + interpreter.std_capture.getvalue()
+        if current_session().busy():
+            return interpreter.std_capture.summary()
+        return "<!--SATYRN_DONE_EXECUTING-->" + interpreter.std_capture.summary()
+
+    @app.route("/cell_output/", methods=["POST"])
+    def get_cell_output():
+        cell_name = request.get_json()['cell_name'].strip()
+
+        cell = interpreter.graph.get_cell(cell_name)
+        if not cell:
+            return "500"
+
+        return {'output': cell.output,
+                'dropped': cell.output_buffer.dropped}
+
+    def read_output(session, offset, log_id, limit=PAGE_SIZE):
+        """
+        :param session: Session whose output to read
+        :param offset: Number of bytes of output the client already has
+        :param log_id: Id of the OutputLog the offset refers to
+        :param limit: Maximum number of bytes of output to return
+        :return: Dict of the output after `offset`, the offset to ask for next, the log's id, whether the client must
+                 discard what it has because the log was replaced, whether more output is available right away, and
+                 whether execution has finished
+        """
+        log = session.interpreter.std_capture
+        reset = log.id != log_id
+        # Jobs that are queued count too, so clients don't take the moment before a job starts as the end of it
+        done = not session.busy()
+
+        if reset and log.length > limit:
+            # Clients that start over get a summary instead of paging through the whole log
+            offset = log.length
+            text = log.summary()
+        else:
+            text, offset = log.read(0 if reset else offset, limit)
+
+        return {'output': text, 'offset': offset, 'log': log.id, 'reset': reset, 'more': offset < log.length,
+                'done': done and offset >= log.length}
+
+    @app.route("/output_since/", methods=["GET"])
+    def get_output_since():
+        return read_output(current_session(), request.args.get('offset', 0, type=int), request.args.get('log', ''),
+                           min(PAGE_SIZE, request.args.get('limit', PAGE_SIZE, type=int)))
+
+    @app.route("/output_page/", methods=["GET"])
+    def get_output_page():
+        # Any page of the current output log, including parts that were spilled to disk
+        log = interpreter.std_capture
+        offset = request.args.get('offset', 0, type=int)
+        text, end = log.read(offset, min(PAGE_SIZE, request.args.get('limit', PAGE_SIZE, type=int)))
+
+        return {'output': text, 'offset': end, 'log': log.id, 'length': log.length}
+
+    @app.route("/output_stream/", methods=["GET"])
+    def stream_output():
+        # Server-Sent Events version of /output_since/, the stream closes once execution is done and all output is sent
+        session = current_session()
+        poll = request.environ.get(POLL_KEY, False)
+
+        def events(offset, log_id):
+            while True:
+                chunk = read_output(session, offset, log_id)
+                offset, log_id = chunk['offset'], chunk['log']
+
+                if chunk['output'] or chunk['reset'] or chunk['done']:
+                    yield "data: " + json.dumps(chunk) + "\n\n"
+                    if chunk['done']:
+                        return
+                elif poll:
+                    # The server asks again later instead of holding a thread while there is nothing to send
+                    yield ""
+                else:
+                    session.interpreter.std_capture.wait(offset, timeout=1)
+
+        return Response(events(request.args.get('offset', 0, type=int), request.args.get('log', '')),
+                        mimetype="text/event-stream")
 
     @app.route("/load_graph/", methods=["POST"])
     def load_graph():
         if request.get_json()['load_from_file']:
             interpreter.reset_graph(False)
-            raw = request.get_json()['file_contents']
-            content = raw.split("\n")
             interpreter.filename = request.get_json()['filename']
-            interpreter.run_string(content)
-
-        cell_names = interpreter.graph.get_all_cells_edges()[0]
-        links = interpreter.graph.get_all_cells_edges()[1]
+            interpreter.run_string(request.get_json()['file_contents'])
 
         names = []
         contents = []
@@ -231,7 +437,8 @@ def create_app(interpreter, lang):
         lefts = []
         tops = []
 
-        with interpreter.lock:
+        with interpreter.lock.read():
+            cell_names, links, _ = interpreter.graph.get_all_cells_edges()
             for cn in cell_names:
                 cell = interpreter.graph.get_cell(cn)
                 names.append(cn)
@@ -252,7 +459,7 @@ def create_app(interpreter, lang):
     @app.route("/set_as_md/", methods=["POST"])
     def set_as_md():
         cell_name = request.get_json()['cell_name']
-        with interpreter.lock:
+        with interpreter.editing([cell_name]):
             interpreter.graph.get_cell(cell_name).content_type = "markdown"
 
         return "200"
@@ -260,7 +467,7 @@ def create_app(interpreter, lang):
     @app.route("/set_as_py/", methods=["POST"])
     def set_as_py():
         cell_name = request.get_json()['cell_name']
-        with interpreter.lock:
+        with interpreter.editing([cell_name]):
             interpreter.graph.get_cell(cell_name).content_type = "python"
 
         return "200"
@@ -285,20 +492,34 @@ def create_app(interpreter, lang):
     @app.route("/individual_execute/", methods=["POST"])
     def individual_execute():
         cell_name = request.get_json()['cell_name'].strip()
-        with redirect_stdout(interpreter.std_capture):
-            interpreter.execute(["execute", cell_name])
+        return submit_execution(["execute", cell_name])
 
-        return "200"
+    @app.route("/execute_up_to/", methods=["POST"])
+    def execute_up_to():
+        # Runs the named cells and their ancestors, takes 'cell_name' or a list of 'cell_names'
+        data = request.get_json()
+        cell_names = data.get('cell_names') or [data.get('cell_name', "")]
+        cell_names = [name.strip() for name in cell_names]
+
+        if not all(interpreter.graph.has_cell(name) for name in cell_names):
+            return "500"
+
+        command = ["execute"] + cell_names + ["--up-to"]
+        if data.get('incremental'):
+            command.append("--incremental")
+
+        return submit_execution(command, new_log=True)
 
     @app.route("/clear_output/", methods=["POST"])
     def clear_dco():
-        interpreter.std_capture = StringIO()
+        interpreter.std_capture = interpreter.new_output_log()
 
         return "200"
 
     @app.route("/get_py_text/", methods=["POST"])
     def get_py_text():
-        py_txt = interpreter.graph.get_py_file()
+        with interpreter.lock.read():
+            py_txt = interpreter.graph.get_py_file()
         return py_txt
 
     @app.route("/set_filename/", methods=["POST"])
@@ -317,21 +538,64 @@ def create_app(interpreter, lang):
         top = data['top']
         left = data['left']
 
-        with interpreter.lock:
+        # Positions don't affect executions, so moving a running cell doesn't wait
+        with interpreter.editing():
             cell = interpreter.graph.get_cell(name)
             if not cell:
                 return "201"
             cell.top = top
             cell.left = left
+            interpreter.graph.version += 1
 
         return "200"
 
+    @app.route("/batch/", methods=["POST"])
+    def batch():
+        data = request.get_json(silent=True)
+        operations = data.get('operations') if isinstance(data, dict) else None
+        if not isinstance(operations, list):
+            return {'success': False, 'version': interpreter.graph.version, 'failed': None,
+                    'error': "Expected an object with a list of operations"}, 400
+        for position, operation in enumerate(operations):
+            if not isinstance(operation, dict):
+                return {'success': False, 'version': interpreter.graph.version, 'failed': position,
+                        'error': "Operations must be objects"}, 400
+
+        # Cells created without a name get a random one, which is sent back
+        created = []
+        for operation in operations:
+            if operation.get('op') == "create":
+                if not operation.get('name'):
+                    operation['name'] = new_name()
+                created.append(operation['name'])
+
+        version, failure = interpreter.apply_batch(operations)
+
+        if failure:
+            position, reason = failure
+            return {'success': False, 'version': version, 'failed': position, 'error': reason}
+
+        return {'success': True, 'version': version, 'created': created}
+
+    @app.route("/graph_version/", methods=["GET"])
+    def graph_version():
+        return {'version': interpreter.graph.version}
+
     @app.route("/get_layer/", methods=["POST"])
     def get_layer():
         cell_name = request.get_json()['cell_name']
 
-        out = interpreter.get_layer(cell_name)
+        with interpreter.lock.read():
+            out = interpreter.graph.get_layer(cell_name)
 
         return str(out) if out > 0 else " "
 
+    @app.route("/get_layers/", methods=["GET"])
+    def get_layers():
+        with interpreter.lock.read():
+            layers = interpreter.graph.get_layers()
+            names = interpreter.graph.get_lookup_table()
+
+            return {name: (str(layers[idx]) if layers.get(idx, -1) > 0 else " ") for idx, name in names.items()}
+
     return app
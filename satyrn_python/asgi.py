@@ -0,0 +1,138 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+ASGI serving.
+
+The UI is a Flask app, which speaks WSGI. ASGIAdapter wraps it so that an asyncio server like uvicorn can host it: the
+server's event loop holds every open connection, and each request's WSGI call runs on a thread of a shared pool, as
+does reading each chunk of a streamed response.
+
+Reading a chunk holds a thread until the chunk is ready, so a stream that waits for its next chunk would hold one for
+as long as it stays open, and as many open streams as there are threads would stall every other request. Requests
+served by the adapter have POLL_KEY set in their environ, and streamed responses that see it yield an empty chunk
+instead of waiting. The adapter then asks for the next chunk a little later from the event loop, so open streams only
+cost a thread while a chunk is read, and hundreds of clients following the output stay responsive during long
+executions.
+
+asgiref's WsgiToAsgi is not used because it runs every request on one shared thread, so a single streamed response
+would block all the others.
+"""
+
+# Default number of requests handled at the same time
+HTTP_THREADS = 64
+
+# Environ key that tells streamed responses to yield an empty chunk instead of waiting for the next one
+POLL_KEY = "satyrn.poll"
+
+# Seconds before asking again for the next chunk of a stream that yielded an empty one. The delay doubles up to
+# POLL_MAX while the stream has nothing to send
+POLL_MIN = 0.01
+POLL_MAX = 0.1
+
+
+class ASGIAdapter:
+
+    def __init__(self, app, threads=HTTP_THREADS):
+        """
+        :param app: WSGI application
+        :param threads: Number of requests handled at the same time
+        """
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="satyrn-http")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    self.executor.shutdown(wait=False)
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        if scope["type"] != "http":
+            return
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+            return lambda data: None
+
+        loop = asyncio.get_running_loop()
+        iterable = await loop.run_in_executor(self.executor, self.app, environ(scope, bytes(body)), start_response)
+
+        try:
+            # Reading a chunk runs the response's code, so they are read on the pool too
+            chunks = iter(iterable)
+            started = False
+            delay = POLL_MIN
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+                if not started:
+                    await send({"type": "http.response.start", "status": response["status"],
+                                "headers": response["headers"]})
+                    started = True
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                    delay = POLL_MIN
+                else:
+                    # Nothing to send yet, see POLL_KEY
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, POLL_MAX)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(iterable, "close"):
+                await loop.run_in_executor(self.executor, iterable.close)
+
+
+def environ(scope, body):
+    """
+    :param scope: ASGI scope of an HTTP request
+    :param body: The request's body
+    :return: WSGI environ for the request
+    """
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+
+    result = {"REQUEST_METHOD": scope["method"],
+              "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+              "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+              "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+              "SERVER_NAME": server[0],
+              "SERVER_PORT": str(server[1]),
+              "REMOTE_ADDR": client[0],
+              "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+              "wsgi.version": (1, 0),
+              "wsgi.url_scheme": scope.get("scheme", "http"),
+              "wsgi.input": io.BytesIO(body),
+              "wsgi.errors": sys.stderr,
+              "wsgi.multithread": True,
+              "wsgi.multiprocess": False,
+              "wsgi.run_once": False,
+              POLL_KEY: True}
+
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            result[name] = value
+            continue
+        key = "HTTP_" + name
+        result[key] = result[key] + "," + value if key in result else value
+
+    return result
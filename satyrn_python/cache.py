@@ -0,0 +1,111 @@
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+"""
+The ResultCache keeps the results of cell executions on disk so they survive between sessions.
+
+Entries are keyed by a cell's chain hash (see Graph.get_chain_hashes), which covers the cell's content and everything
+upstream of it. An entry holds the variables the cell assigned and deleted, as produced by
+workers.snapshot_namespace, along with the cell's output. When the cache grows past its size limit, the least recently
+used entries are deleted.
+"""
+
+
+class ResultCache:
+
+    def __init__(self, directory, max_bytes=1024 ** 3):
+        """
+        :param directory: Directory to keep cache entries in, created if it doesn't exist
+        :param max_bytes: Total size of entries to keep before evicting the least recently used ones
+        """
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_bytes = max_bytes
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        # Entry key to size in bytes, least recently used first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl") and entry.is_file():
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    def path(self, key):
+        """:return: Path of the file holding the entry for `key`."""
+        return os.path.join(self.directory, key + ".pkl")
+
+    def get(self, key):
+        """
+        :param key: Chain hash of a cell
+        :return: (snapshot of assigned variables, list of deleted variables, output) or None if there is no entry
+        """
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+
+        try:
+            with open(self.path(key), "rb") as file:
+                entry = pickle.load(file)
+            # Eviction after a restart goes by modification time
+            os.utime(self.path(key))
+        except Exception:
+            # Deleted by another process or unreadable, either way it's no use
+            self.remove(key)
+            return None
+
+        return entry["assigned"], entry["deleted"], entry["output"]
+
+    def put(self, key, assigned, deleted, output):
+        """
+        :param key: Chain hash of a cell
+        :param assigned: Snapshot of the variables the cell assigned, from workers.snapshot_namespace
+        :param deleted: List of names of the variables the cell deleted
+        :param output: Everything the cell printed
+        """
+        data = pickle.dumps({"assigned": assigned, "deleted": list(deleted), "output": output})
+
+        if len(data) > self.max_bytes:
+            return
+
+        # Write to a temporary file first so that readers never see half of an entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, self.path(key))
+
+        with self.lock:
+            self.total_bytes += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+
+            while self.total_bytes > self.max_bytes:
+                old_key, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(self.path(old_key))
+                except OSError:
+                    pass
+
+    def remove(self, key):
+        """:param key: Chain hash of the entry to delete."""
+        with self.lock:
+            self.total_bytes -= self.entries.pop(key, 0)
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        # Delete every entry
+        for key in list(self.entries):
+            self.remove(key)
@@ -1,14 +1,19 @@
 import getopt
+import json
 import multiprocessing
 import os
 import sys
+import threading
 import time
 import webbrowser
 
-from cheroot.wsgi import Server as WSGIServer, PathInfoDispatcher
+from .interpreter import BACKENDS, Interpreter
+from .kernels import KERNEL_MAX_RUNS, KernelPool, preload
+from .output import install_router
+from .output import CELL_OUTPUT_LIMIT, SPILL_THRESHOLD
 
-from .app import create_app
-from .interpreter import Interpreter
+# Servers the UI can be hosted with. "asgi" runs the app under uvicorn, see asgi.py
+SERVERS = ("cheroot", "asgi")
 
 
 def delayed_browser_open(openurl, port):
@@ -17,13 +22,27 @@ def delayed_browser_open(openurl, port):
     webbrowser.open("http://" + openurl + ":" + str(port) + "/#loaded")
 
 
-def start_ui(url, port, interpreter, quiet, language):
+def start_ui(url, port, interpreter, quiet, language, server="cheroot", sessions=None):
+    """
+    :param sessions: Keyword arguments for create_app that let the server host many sessions, None to host only
+                     `interpreter`
+    """
+    # The web server is only imported when the UI is used, the CLI starts faster without it
+    from .app import create_app
+
     openurl = "localhost" if url == "0.0.0.0" else url
+    app = create_app(interpreter, language, **(sessions or {}))
+
+    if server == "asgi":
+        start_asgi(app, url, openurl, port, quiet)
+        return
+
+    from cheroot.wsgi import Server as WSGIServer, PathInfoDispatcher
 
     if not quiet:
         print("Booting CherryPy server...")
 
-    d = PathInfoDispatcher({'/': create_app(interpreter, language)})
+    d = PathInfoDispatcher({'/': app})
     server = WSGIServer((url, port), d)
 
     try:
@@ -44,16 +63,106 @@ def start_ui(url, port, interpreter, quiet, language):
             print("Stopped")
 
 
+def start_asgi(app, url, openurl, port, quiet):
+    try:
+        import uvicorn
+    except ImportError as error:
+        raise ImportError("--server=asgi requires uvicorn, install it with pip install uvicorn") from error
+
+    from .asgi import ASGIAdapter
+
+    if not quiet:
+        print("Booting uvicorn server...")
+
+    p = multiprocessing.Process(target=delayed_browser_open, args=(openurl, port))
+    p.start()
+
+    if not quiet:
+        print("Hosting at http://" + openurl + ":" + str(port) + "/#loaded")
+
+    # uvicorn stops by itself on KeyboardInterrupt
+    uvicorn.run(ASGIAdapter(app), host=url, port=port, lifespan="on", log_level="warning" if quiet else "info")
+
+    if not quiet:
+        print("Stopped")
+
+
 def start_cli(interpreter):
     interpreter.run()
 
 
+def start_run(interpreter, notebook, output, quiet):
+    """
+    Runs a notebook without the UI or CLI, for scripts, cron and CI.
+
+    :param interpreter: Interpreter to run the notebook in
+    :param notebook: Path of the notebook, in any format Interpreter.load_notebook reads
+    :param output: Path to write the results to as JSON, "-" for stdout, or None to skip writing them
+    :param quiet: If True, cell output isn't printed
+    :return: Exit code, 0 if every cell succeeded, 1 if any failed, 2 if the notebook couldn't be run
+    """
+    # Results on stdout must not be mixed with cell output
+    targets = (interpreter.std_capture,) if quiet or output == "-" else (interpreter.std_capture, sys.stdout)
+
+    started = time.time()
+
+    with install_router().route(*targets):
+        try:
+            interpreter.load_notebook(notebook, run_commands=False)
+        except Exception as exception:
+            print("Could not load " + notebook + ": " + str(exception), file=sys.stderr)
+            return 2
+
+        interpreter.graph.bfs_traversal_execute(interpreter.max_workers, interpreter.backend)
+
+    cells = interpreter.graph.get_results()
+    failed = [cell["name"] for cell in cells if cell["status"] == "failed"]
+
+    results = {"notebook": notebook,
+               "status": "failed" if failed else "succeeded",
+               "jobs": interpreter.max_workers,
+               "backend": interpreter.backend,
+               "started": started,
+               "duration": time.time() - started,
+               "cells": cells,
+               "profile": interpreter.graph.get_profile()}
+
+    if output == "-":
+        json.dump(results, sys.stdout, indent=4)
+        sys.stdout.write("\n")
+    elif output:
+        with open(output, "w") as file:
+            json.dump(results, file, indent=4)
+
+    if failed:
+        print("Failed cells: " + ", ".join(failed), file=sys.stderr)
+        return 1
+    return 0
+
+
 def main():
-    interpreter = Interpreter()
     cli_mode = False
+    run_mode = False
+    results_path = None
     url = "0.0.0.0"
     port = 20787
     language = "english"
+    max_workers = None
+    backend = "thread"
+    cache_dir = None
+    cache_size = 1024
+    cell_output_limit = CELL_OUTPUT_LIMIT
+    spill_threshold = SPILL_THRESHOLD
+    server = "cheroot"
+    multi_session = False
+    idle_timeout = 60
+    max_sessions = None
+    memory_limit = None
+    session_dir = None
+    kernel_count = None
+    preload_modules = []
+    kernel_runs = KERNEL_MAX_RUNS
+    kernel_memory = None
 
     arguments = sys.argv[1:]
 
@@ -67,6 +176,86 @@ def main():
         if opt in ("q", "quiet", "-q", "--quiet"):
             quiet = True
 
+    opts, args = getopt.gnu_getopt(arguments, "pl:hqj:b:o:",
+                                   ["port=", "lang=", "hidden", "quiet", "jobs=", "backend=", "cache-dir=",
+                                    "cache-size=", "cell-output-limit=",
+                                    "spill-threshold=", "output=", "server=", "sessions", "idle-timeout=",
+                                    "max-sessions=", "memory-limit=", "session-dir=", "kernels=", "preload=",
+                                    "kernel-runs=", "kernel-memory="])
+
+    for opt, arg in opts:
+        if opt in ("-p", "--port"):
+            if len(opt) < 5:
+                port = int(arg)
+            else:
+                port = int(arg[1:])
+        if opt in ("-h", "--hidden"):
+            url = "127.0.0.1"
+        if opt in ("-l", "--lang"):
+            language = arg
+        if opt in ("-j", "--jobs"):
+            max_workers = int(arg)
+        if opt in ("-b", "--backend"):
+            backend = arg
+        if opt == "--cache-dir":
+            cache_dir = arg
+        if opt == "--cache-size":
+            cache_size = int(arg)
+        if opt == "--cell-output-limit":
+            cell_output_limit = int(arg)
+        if opt == "--spill-threshold":
+            spill_threshold = int(arg) * 1024 ** 2
+        if opt in ("-o", "--output"):
+            results_path = arg
+        if opt == "--server":
+            server = arg
+        if opt == "--sessions":
+            multi_session = True
+        if opt == "--idle-timeout":
+            idle_timeout = int(arg)
+        if opt == "--max-sessions":
+            max_sessions = int(arg)
+        if opt == "--memory-limit":
+            memory_limit = int(arg) * 1024 ** 2
+        if opt == "--session-dir":
+            session_dir = arg
+        if opt == "--kernels":
+            kernel_count = int(arg)
+        if opt == "--preload":
+            preload_modules = [name.strip() for name in arg.split(",") if name.strip()]
+        if opt == "--kernel-runs":
+            kernel_runs = int(arg) or None
+        if opt == "--kernel-memory":
+            kernel_memory = int(arg) * 1024 ** 2
+
+    if server not in SERVERS:
+        print("--server must be one of: " + ", ".join(SERVERS), file=sys.stderr)
+        return 2
+
+    if args and args[0] == "run":
+        if len(args) != 2:
+            print("run takes 1 argument: [notebook]", file=sys.stderr)
+            return 2
+        if backend not in BACKENDS:
+            print("-b/--backend must be one of: " + ", ".join(BACKENDS), file=sys.stderr)
+            return 2
+        run_mode = True
+
+    # Kernels start warming up now, unless only executions with -b process will use them
+    if kernel_count is None:
+        kernel_count = (max_workers or os.cpu_count() or 1) if backend == "process" else 0
+    kernels = KernelPool(kernel_count, preload_modules, kernel_runs, kernel_memory)
+
+    if preload_modules and not run_mode:
+        # The thread backend runs cells in this process, and variables holding modules are imported here too
+        threading.Thread(target=preload, args=(preload_modules,), daemon=True).start()
+
+    interpreter = Interpreter(max_workers, backend, cache_dir, cache_size * 1024 ** 2, cell_output_limit,
+                              spill_threshold, kernels)
+
+    if run_mode:
+        return start_run(interpreter, args[1], results_path, quiet)
+
     if not quiet:
         with open(os.path.abspath(__file__)[:(-1 * len(os.path.basename(__file__)))] + "/asciiart.txt") as asciiart:
             print("".join(asciiart.readlines()))
@@ -76,17 +265,21 @@ def main():
 
     if cli_mode:
         start_cli(interpreter)
-    else:
-        opts, args = getopt.getopt(arguments, "pl:hq", ["port=", "lang=", "hidden", "quiet"])
-
-        for opt, arg in opts:
-            if opt in ("-p", "--port"):
-                if len(opt) < 5:
-                    port = int(arg)
-                else:
-                    port = int(arg[1:])
-            if opt in ("-h", "--hidden"):
-                url = "127.0.0.1"
-            if opt in ("-l", "--lang"):
-                language = arg
-        start_ui(url, port, interpreter, quiet, language)
+        return
+
+    sessions = None
+    if multi_session:
+        def factory():
+            session_interpreter = Interpreter(max_workers, backend, None, cache_size * 1024 ** 2, cell_output_limit,
+                                              spill_threshold, kernels)
+            # Sessions share one result cache and one kernel pool, so they reuse each other's results
+            session_interpreter.cache = interpreter.cache
+            return session_interpreter
+
+        sessions = {"factory": factory,
+                    "idle_timeout": idle_timeout * 60,
+                    "max_sessions": max_sessions,
+                    "memory_limit": memory_limit,
+                    "session_dir": session_dir}
+
+    start_ui(url, port, interpreter, quiet, language, server, sessions)
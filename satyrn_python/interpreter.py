@@ -1,17 +1,39 @@
+import hashlib
 import networkx as nx
-import matplotlib.pyplot as plt
-from io import StringIO
-from networkx import algorithms
-
-try:
-    import tkinter as tk
-except ImportError as error:
-    raise ImportError("Your Python installation may not be configured for TKinter, a dependency of Satyrn\n" +
-                      "Visit https://tkdocs.com/tutorial/install.html to install TKinter") from error
-
+import statistics
 import threading
-
-exec_vars = {}
+import time
+
+from .analysis import analyze_cell
+from .cache import ResultCache
+from .kernels import KernelPool
+from .locks import ReadWriteLock
+from .namespace import Namespace
+from .output import CELL_OUTPUT_LIMIT, SPILL_THRESHOLD, OutputLog, RingBuffer, install_router
+from .profiling import SLOWEST_LIMIT, build_profile, cell_profile, describe_exception
+from .notebook import EXTENSIONS, escape_py_line, load_binary, parse_ipynb, parse_py, save_binary
+from .satx import parse_satx
+from .scheduler import Scheduler, bottom_levels
+from .topology import TopologicalOrder
+from .workers import execute_in_worker, restore_namespace, snapshot_namespace
+
+# Ways of running cells during a graph execution
+BACKENDS = ("thread", "process")
+
+# Commands that can't be used as cell names
+KEYWORDS = ["help", "quit", "cell", "link", "sever",
+            "execute", "display", "remove", "reset_runtime",
+            "edit", "swap", "list", "reset_graph", "merge", "save", "analyze", "convert", "profile"]
+
+# "cached" cells had their results replayed from the ResultCache instead of executing, "cancelled" cells were due to run
+# in an execution that was cancelled before they started
+CELL_STATUSES = ("not run", "succeeded", "failed", "cached", "cancelled")
+
+# Number of recent execution durations each cell keeps to predict how long its next execution takes
+DURATION_HISTORY = 5
+
+# Operations accepted by Graph.apply_batch
+BATCH_OPERATIONS = ("move", "edit", "rename", "link", "sever", "create", "delete")
 
 """
 Structure Guide
@@ -25,9 +47,24 @@ The Interpreter is the 'frontend' of the application, and provides a text-based
 the graph and individual nodes.
 
 TextIO is just a handy way of taking multi-line input from users and displaying text back to them.
+
+matplotlib, tkinter and nbformat are only imported by the methods that use them, so that starting Satyrn doesn't wait on
+libraries a session may never need.
 """
 
 
+def check_cell_name(name):
+    """
+    :param name: Name for a new cell
+    :return: Why the name can't be used, or None if it can
+    """
+    if name in KEYWORDS:
+        return "\"" + name + "\" is a restricted keyword and cannot be used for a cell name."
+    if ".satx" in name:
+        return "Cell names cannot include \".satx\""
+    return None
+
+
 class TextIO:
 
     def __init__(self):
@@ -42,6 +79,12 @@ class TextIO:
         self.root.quit()
 
     def text_input(self, existing_text=None):
+        try:
+            import tkinter as tk
+        except ImportError as error:
+            raise ImportError("Your Python installation may not be configured for TKinter, a dependency of Satyrn\n" +
+                              "Visit https://tkdocs.com/tutorial/install.html to install TKinter") from error
+
         self.root = tk.Tk()
         self.root.wm_title("Satyrn Text Editor")
         # Open text input window and return the text
@@ -78,34 +121,145 @@ class Cell:
         """
         self.name = name_
         self.content_type = content_type_
+        # BinaryNotebook that holds this cell's content and output, and where, see attach
+        self.store = None
+        self.content_span = None
+        self.output_span = None
+        self.output_pending = False
+        # (content type, digest) cached by get_hash, cleared whenever the content changes
+        self._hash = None
         self.content = content_
-        self.output = ""
+        # (content hash, CellAccess) of the latest static analysis of the cell, see analysis.analyze_cell
+        self.access = None
+        # Output of the latest execution, see the output property
+        self.output_buffer = RingBuffer()
+        # Outcome of the latest execution, one of CELL_STATUSES, and how many seconds it took
+        self.status = "not run"
+        self.duration = None
+        # Profile of the latest execution, see profiling: CPU seconds, start and finish times as seconds since the
+        # epoch, profiling.describe_exception of what the cell raised, and which of the graph's executions it was
+        self.cpu_time = None
+        self.started = None
+        self.finished = None
+        self.exception = None
+        self.run = None
+        # Seconds taken by the latest DURATION_HISTORY executions that weren't replayed from the cache, oldest first.
+        # Saved with the notebook, so executions of a freshly opened notebook are scheduled from its history
+        self.durations = []
 
         self.top = top_
         self.left = left_
 
+    @property
+    def content(self):
+        """:return: The cell's markdown or python code."""
+        if self._content is None:
+            self._content = self.store.read(self.content_span)
+        return self._content
+
+    @content.setter
+    def content(self, text):
+        self._content = text
+        self._hash = None
+        self.content_span = None
+
+    @property
+    def output(self):
+        """:return: Everything this cell printed in its latest execution, up to its output limit."""
+        if self.output_pending:
+            self.output_pending = False
+            self.output_buffer.write(self.store.read(self.output_span))
+        return self.output_buffer.getvalue()
+
+    @output.setter
+    def output(self, text):
+        self.output_pending = False
+        self.output_span = None
+        self.output_buffer.clear()
+        self.output_buffer.write(text)
+
+    def attach(self, store, content_span, output_span, loaded=False):
+        """
+        :param store: BinaryNotebook holding the cell's content and output
+        :param content_span: (offset, length) of the cell's content in `store`
+        :param output_span: (offset, length) of the cell's output in `store`
+        :param loaded: Whether the cell already holds the same content and output. If not, they're read from `store`
+                       when first used
+        """
+        self.store = store
+        self.content_span = content_span
+        self.output_span = output_span
+        if not loaded:
+            self._content = None
+            self._hash = None
+            self.output_pending = True
+
     def get_copy(self):
         output_cell = Cell(self.name, self.content_type, self.content)
         output_cell.top = self.top
         output_cell.left = self.left
+        output_cell.durations = list(self.durations)
         return output_cell
 
-    def execute(self):
-        # Execute this cell's content
-
+    def expected_duration(self):
+        """:return: Predicted number of seconds the cell's next execution takes, or None if it has no history."""
+        if not self.durations:
+            return None
+        # The median ignores the odd execution that was slowed down by something else
+        return statistics.median(self.durations)
+
+    def get_hash(self):
+        """:return: Hex digest identifying this cell's content type and content."""
+        if self._hash is None or self._hash[0] != self.content_type:
+            digest = hashlib.sha256((self.content_type + "\n" + self.content).encode("utf-8")).hexdigest()
+            self._hash = (self.content_type, digest)
+        return self._hash[1]
+
+    def execute(self, namespace):
+        """
+        :param namespace: Namespace to execute this cell's content in
+        :return: False if the content raised an exception, True otherwise
+        """
         if not self.content_type == "python":
-            return
-
-        global exec_vars
-        ex_vars_copy = exec_vars.copy()
+            return True
 
         try:
-            exec(self.content, ex_vars_copy)
+            exec(self.content, namespace)
         except Exception as exception:
             print("Exception occurred in cell " + self.name)
             print(exception)
+            self.exception = describe_exception(exception)
+            return False
+
+        return True
+
+    def execute_in_process(self, pool, namespace):
+        """
+        :param pool: KernelPool to run this cell's content in
+        :param namespace: Namespace that receives the variables the worker changed
+        :return: False if the content raised an exception, True otherwise
+        """
+        if not self.content_type == "python":
+            return True
+
+        snapshot, _ = snapshot_namespace(namespace.flatten())
+
+        delta, removed, skipped, output, error, cpu_time = pool.submit(execute_in_worker, self.name, self.content,
+                                                                       snapshot).result()
+        self.exception = error
+        self.cpu_time += cpu_time
 
-        exec_vars.update(ex_vars_copy)
+        print(output, end="")
+        if skipped:
+            print("Variables " + ", ".join(skipped) + " from cell " + self.name +
+                  " could not be sent back from its worker process")
+
+        namespace.update(restore_namespace(delta))
+        for name in removed:
+            if namespace.has(name):
+                del namespace[name]
+
+        return error is None
 
 
 class Graph:
@@ -115,19 +269,44 @@ class Graph:
         # Networkx Directed graph
         self.graph = nx.DiGraph()
         self.parent = parent
-        # Dict to keep track of cell names vs networkx node names
+        # Dicts to keep track of cell names vs networkx node names, kept in sync by every method that changes either
         self.names_to_indeces = {}
-        # Dictionaries for variables created by cells
-        global exec_vars
-        exec_vars = {}
+        self.indeces_to_names = {}
+        # Node names are never reused, even after their cell is removed
+        self.next_idx = 0
+        # Cached output of get_layers, None when it has to be recomputed from scratch
+        self.layers = None
+        # Topological order of the cells, kept up to date as cells and links are added
+        self.topology = TopologicalOrder(self.graph)
+        # Variables visible to every cell, and the namespace each cell produced in its latest execution
+        self.runtime = Namespace(owner="runtime")
+        self.namespaces = {}
+        # Chain hash of each cell at its latest successful execution, see get_chain_hashes
+        self.executed_hashes = {}
         # TextIO object
         self.ti = TextIO()
 
         self.executing = False
+        # Increases whenever cells, links or positions change, so clients can tell whether their copy is current
+        self.version = 0
+        # BinaryNotebook the graph was loaded from or last saved to
+        self.notebook = None
+        # Number of executions started, each cell remembers which one it last ran in
+        self.runs = 0
+        # Indices of the cells the current execution hasn't finished running, see claim
+        self.running = set()
 
     def get_lookup_table(self):
-        return {idx: moniker for moniker, idx in
-                zip(list(self.names_to_indeces.keys()), list(self.names_to_indeces.values()))}
+        """:return: Dict of cell index to cell name. Don't modify it."""
+        return self.indeces_to_names
+
+    def has_cell(self, cell_name):
+        """:return: Whether a cell named `cell_name` exists."""
+        return cell_name in self.names_to_indeces
+
+    def get_root_idx(self):
+        """:return: Index of the root cell, which is the oldest cell in the graph, or None if the graph is empty."""
+        return next(iter(self.graph.nodes), None)
 
     def name_to_idx(self, cell_name):
         """
@@ -135,7 +314,7 @@ class Graph:
         :return: Corresponding index of provided cell name
         """
         cell_name = cell_name.strip()
-        if cell_name not in self.get_all_cells_edges()[0]:
+        if cell_name not in self.names_to_indeces:
             print("Cell \"" + cell_name + "\" does not exist")
             return -1
         else:
@@ -145,46 +324,87 @@ class Graph:
         """
         :param cell_name: Name of desired cell
         :param cell_index: If this is set, it'll retrieve the cell at this index
-        :return: Cell object
+        :return: Cell object, or None if it doesn't exist
         """
-        cells = list(nx.get_node_attributes(self.graph, 'data').values())
+        if cell_index is None:
+            cell_index = self.names_to_indeces.get(cell_name)
 
-        if cell_index is not None:
-            output = cells[cell_index]
-            return output
+        if cell_index is None or cell_index not in self.graph:
+            return None
 
-        for cell in cells:
-            if cell.name == cell_name:
-                return cell
+        return self.graph.nodes[cell_index]["data"]
 
     def add_cell(self, new_cell: Cell):
         """:param new_cell: Cell object to be added to graph."""
-        if new_cell.name in list(self.names_to_indeces.keys()):
+        if new_cell.name in self.names_to_indeces:
             print("Cannot use name {}, all cells must have unique names".format(new_cell.name))
             return
         else:
-            self.graph.add_node(len(self.graph.nodes), data=new_cell, name=new_cell.name)
-            self.names_to_indeces.update({new_cell.name: len(self.names_to_indeces)})
+            idx = self.next_idx
+            self.next_idx += 1
+
+            self.graph.add_node(idx, data=new_cell, name=new_cell.name)
+            self.topology.add_node(idx)
+            self.names_to_indeces[new_cell.name] = idx
+            self.indeces_to_names[idx] = new_cell.name
+            self.version += 1
+
+            if self.layers is not None and idx == self.get_root_idx():
+                self.layers[idx] = 1
 
     def remove_cell(self, cell_name, cell_index=None):
         """
         :param cell_name: Name of cell to be removed
         :param cell_index: If this is set, it'll remove the cell at this index
         """
-        if cell_index:
-            cell_name = self.get_cell("", cell_index).name
-
-            self.graph.remove_node(cell_index)
-            del self.names_to_indeces[cell_name]
-        elif self.get_cell(cell_name):
-            idx = self.name_to_idx(cell_name)
+        if cell_index is None:
+            cell_index = self.names_to_indeces.get(cell_name)
 
-            self.graph.remove_node(idx)
-            del self.names_to_indeces[cell_name]
-        else:
+        if cell_index is None or cell_index not in self.graph:
             print("Cell \"" + cell_name + "\" does not exist.")
             return -1
 
+        cell_name = self.indeces_to_names[cell_index]
+        was_root = cell_index == self.get_root_idx()
+        # Only the cached layers of the cell's descendants can change
+        update = self.layers is not None and not was_root
+        affected = nx.descendants(self.graph, cell_index) if update else None
+
+        self.graph.remove_node(cell_index)
+        self.topology.remove_node(cell_index)
+        del self.names_to_indeces[cell_name]
+        del self.indeces_to_names[cell_index]
+        self.namespaces.pop(cell_index, None)
+        self.executed_hashes.pop(cell_index, None)
+        self.version += 1
+
+        if was_root:
+            # Another cell becomes the root, which moves every layer
+            self.layers = None
+        elif update:
+            self.layers.pop(cell_index, None)
+            self.update_layers(affected)
+
+    def rename_cell(self, old_name, new_name):
+        """
+        :param old_name: Current name of the cell
+        :param new_name: Name to give the cell
+        :return: -1 if the rename isn't possible
+        """
+        if old_name not in self.names_to_indeces:
+            print("Cell \"" + old_name + "\" does not exist.")
+            return -1
+        if new_name in self.names_to_indeces:
+            print("Cannot use name {}, all cells must have unique names".format(new_name))
+            return -1
+
+        idx = self.names_to_indeces.pop(old_name)
+        self.names_to_indeces[new_name] = idx
+        self.indeces_to_names[idx] = new_name
+        self.graph.nodes[idx]["name"] = new_name
+        self.graph.nodes[idx]["data"].name = new_name
+        self.version += 1
+
     def connect_cells(self, idx1, idx2):
         """
         :param idx1: Index of first cell
@@ -194,21 +414,51 @@ class Graph:
         if not (self.graph.has_node(idx1) and self.graph.has_node(idx2)):
             return
 
-        if idx2 == 0:
+        if idx2 == self.get_root_idx():
             return "Can't link to root cell"
 
-        if idx2 in nx.ancestors(self.graph, idx1):
+        if not self.topology.add_edge(idx1, idx2):
             return "Cycles are not allowed"
         else:
             self.graph.add_edge(idx1, idx2)
+            self.version += 1
+
+            if self.layers is not None:
+                # A new edge can only push layers further from the root, so only increases need to be propagated
+                candidate = self.layers[idx1] + 1 if self.layers.get(idx1, 0) > 0 else 0
+                if idx2 not in self.layers or candidate > self.layers[idx2]:
+                    self.layers[idx2] = candidate
+                    frontier = [idx2]
+                    while frontier:
+                        node = frontier.pop()
+                        for child in self.graph.successors(node):
+                            candidate = self.layers[node] + 1 if self.layers[node] > 0 else 0
+                            if candidate > self.layers[child]:
+                                self.layers[child] = candidate
+                                frontier.append(child)
+
             return "Safe"
 
+    def would_create_cycle(self, idx1, idx2):
+        """
+        :param idx1: Index of first cell
+        :param idx2: Index of second cell
+        :return: Whether linking the first cell to the second would create a cycle
+        """
+        return self.topology.would_create_cycle(idx1, idx2)
+
     def sever_cells(self, idx1, idx2):
         """
         :param idx1: Index of first cell
         :param idx2: Index of second cell
         """
         self.graph.remove_edge(idx1, idx2)
+        self.version += 1
+
+        if self.layers is not None:
+            affected = nx.descendants(self.graph, idx2)
+            affected.add(idx2)
+            self.update_layers(affected)
 
     def swap_cells(self, name1, name2):
 
@@ -229,6 +479,9 @@ class Graph:
 
         self.names_to_indeces[name1] = idx2
         self.names_to_indeces[name2] = idx1
+        self.indeces_to_names[idx1] = name2
+        self.indeces_to_names[idx2] = name1
+        self.version += 1
 
     def merge_cells(self, idx1, idx2, new_name):
         if not self.graph.has_edge(idx1, idx2):
@@ -238,20 +491,17 @@ class Graph:
         c1 = self.get_cell("", idx1)
         c2 = self.get_cell("", idx2)
 
-        glb = c1.self_globals
-        lcl = c1.self_locals
-
-        glb.update(c2.self_globals)
-        lcl.update(c2.self_locals)
+        # Neither namespace describes the merged cell
+        self.namespaces.pop(idx1, None)
+        self.namespaces.pop(idx2, None)
 
         # make new cell
-        new_cell = Cell(new_name, content_type_=self.get_cell("", idx1).content_type)
-        new_content = self.get_cell("", idx1).content + "\n# merge point\n" + self.get_cell("", idx2).content
-        new_cell.content = new_content
-        self.names_to_indeces[new_name] = self.names_to_indeces[self.get_cell("", idx1).name]
-        del self.names_to_indeces[self.get_cell("", idx1).name]
+        new_cell = Cell(new_name, content_type_=c1.content_type)
+        new_cell.content = c1.content + "\n# merge point\n" + c2.content
+        new_cell.top = c1.top
+        new_cell.left = c1.left
         self.graph.nodes[idx1]["data"] = new_cell
-        self.graph.nodes[idx1]["name"] = new_name
+        self.rename_cell(c1.name, new_name)
 
         # in -> (1 + 2 merged) -> out
         out_edges = list(self.graph.out_edges(idx2))
@@ -262,16 +512,155 @@ class Graph:
             out_node = edge[1]
             self.connect_cells(idx1, out_node)
 
+    def apply_batch(self, operations):
+        """
+        Applies a list of operations in order, either all of them or none of them.
+
+        Every operation is a dict with an "op" key, one of BATCH_OPERATIONS:
+            {"op": "move", "name", "top", "left"}
+            {"op": "edit", "name", "content"}
+            {"op": "rename", "name", "new_name"}
+            {"op": "link", "first", "second"}
+            {"op": "sever", "first", "second"}
+            {"op": "create", "name", "content_type" (default python), "content" (default empty)}
+            {"op": "delete", "name"}
+
+        Each operation is undone if a later one fails, and the graph's version is left as it was. Deleted cells are only
+        detached from the graph until every operation has succeeded, which keeps undoing a deletion as cheap as the
+        deletion itself.
+
+        Moves are the exception: moving a cell that doesn't exist is skipped instead of failing the batch, so a client
+        sending the positions of all of its cells isn't turned away over one that another client deleted.
+
+        :param operations: List of operation dicts
+        :return: None if every operation was applied, otherwise (position of the failed operation, reason)
+        """
+        undo = []
+        detached = []
+        # The undo steps use the same methods as the operations, which count as changes too
+        version = self.version
+
+        def lookup(name):
+            idx = self.names_to_indeces.get(name.strip())
+            if idx is None:
+                raise ValueError("Cell \"" + name + "\" does not exist")
+            return idx
+
+        for position, operation in enumerate(operations):
+            try:
+                kind = operation.get("op")
+                if kind not in BATCH_OPERATIONS:
+                    raise ValueError("Unknown operation \"" + str(kind) + "\"")
+
+                if kind == "move":
+                    idx = self.names_to_indeces.get(operation["name"].strip())
+                    if idx is None:
+                        continue
+                    cell = self.graph.nodes[idx]["data"]
+                    undo.append(lambda cell=cell, top=cell.top, left=cell.left: (setattr(cell, "top", top),
+                                                                                 setattr(cell, "left", left)))
+                    cell.top = operation["top"]
+                    cell.left = operation["left"]
+
+                elif kind == "edit":
+                    cell = self.graph.nodes[lookup(operation["name"])]["data"]
+                    undo.append(lambda cell=cell, content=cell.content: setattr(cell, "content", content))
+                    cell.content = operation["content"]
+
+                elif kind == "rename":
+                    old_name = self.indeces_to_names[lookup(operation["name"])]
+                    new_name = operation["new_name"].strip()
+                    problem = check_cell_name(new_name)
+                    if problem:
+                        raise ValueError(problem)
+                    if new_name in self.names_to_indeces:
+                        raise ValueError("Cannot use name {}, all cells must have unique names".format(new_name))
+                    self.rename_cell(old_name, new_name)
+                    undo.append(lambda old=old_name, new=new_name: self.rename_cell(new, old))
+
+                elif kind == "link":
+                    idx1 = lookup(operation["first"])
+                    idx2 = lookup(operation["second"])
+                    if idx1 == idx2:
+                        raise ValueError("Cells can't be linked to themselves")
+                    if not self.graph.has_edge(idx1, idx2):
+                        result = self.connect_cells(idx1, idx2)
+                        if result != "Safe":
+                            raise ValueError(result)
+                        undo.append(lambda idx1=idx1, idx2=idx2: self.sever_cells(idx1, idx2))
+
+                elif kind == "sever":
+                    idx1 = lookup(operation["first"])
+                    idx2 = lookup(operation["second"])
+                    if not self.graph.has_edge(idx1, idx2):
+                        raise ValueError("Cells \"" + operation["first"] + "\" and \"" + operation["second"] +
+                                         "\" are not linked")
+                    self.sever_cells(idx1, idx2)
+                    undo.append(lambda idx1=idx1, idx2=idx2: self.connect_cells(idx1, idx2))
+
+                elif kind == "create":
+                    name = operation["name"].strip()
+                    problem = check_cell_name(name)
+                    if problem:
+                        raise ValueError(problem)
+                    if name in self.names_to_indeces:
+                        raise ValueError("Cannot use name {}, all cells must have unique names".format(name))
+                    self.add_cell(Cell(name, operation.get("content_type", "python"), operation.get("content", "")))
+                    undo.append(lambda idx=self.names_to_indeces[name]: self.remove_cell("", idx))
+
+                elif kind == "delete":
+                    idx = lookup(operation["name"])
+                    parents = list(self.graph.predecessors(idx))
+                    children = list(self.graph.successors(idx))
+                    for parent in parents:
+                        self.sever_cells(parent, idx)
+                    for child in children:
+                        self.sever_cells(idx, child)
+                    name = self.indeces_to_names[idx]
+                    del self.names_to_indeces[name]
+                    detached.append(idx)
+
+                    def reattach(idx=idx, name=name, parents=parents, children=children):
+                        detached.remove(idx)
+                        self.names_to_indeces[name] = idx
+                        for parent in parents:
+                            self.connect_cells(parent, idx)
+                        for child in children:
+                            self.connect_cells(idx, child)
+
+                    undo.append(reattach)
+
+            except (KeyError, TypeError, AttributeError, ValueError) as error:
+                if isinstance(error, KeyError):
+                    error = "Missing \"" + str(error.args[0]) + "\""
+                for step in reversed(undo):
+                    step()
+                self.version = version
+                return position, str(error)
+
+        for idx in detached:
+            # The cell's name may have been given to a new cell, which remove_cell must not forget
+            name = self.indeces_to_names[idx]
+            replacement = self.names_to_indeces.get(name)
+            self.names_to_indeces[name] = idx
+            self.remove_cell("", idx)
+            if replacement is not None:
+                self.names_to_indeces[name] = replacement
+
+        self.version += 1
+        return None
+
     def update_reverse_lookup_table(self):
-        cell_names, _, _2 = self.get_all_cells_edges()
-        cell_indeces = list(self.graph.nodes)
-        self.names_to_indeces = {name: idx for name, idx in zip(cell_names, cell_indeces)}
+        # Rebuild both name lookups from the graph itself
+        self.names_to_indeces = {name: idx for idx, name in self.graph.nodes(data="name")}
+        self.indeces_to_names = {idx: name for idx, name in self.graph.nodes(data="name")}
 
     def display(self):
         # Display graph in matplotlib
+        import matplotlib.pyplot as plt
+
         pos = nx.spring_layout(self.graph)
 
-        self.update_reverse_lookup_table()
         labels = self.get_lookup_table()
 
         nx.draw_networkx_nodes(self.graph, pos)
@@ -281,9 +670,9 @@ class Graph:
         plt.show()
 
     def get_all_cells_edges(self):
-        lookup_table = self.get_lookup_table()
-        return list(nx.get_node_attributes(self.graph, 'name').values()), list(self.graph.edges), \
-               [(lookup_table[idx1], lookup_table[idx2]) for idx1, idx2 in list(self.graph.edges)]
+        lookup_table = self.indeces_to_names
+        return list(lookup_table.values()), list(self.graph.edges), \
+            [(lookup_table[idx1], lookup_table[idx2]) for idx1, idx2 in self.graph.edges]
 
     def get_in_out_edges(self, cell_name, cell_index=None):
         if not cell_index:
@@ -309,100 +698,485 @@ class Graph:
 
         return in_edges, out_edges
 
+    def get_layers(self):
+        """
+        The root cell is on layer 1 and every other cell is one layer below its deepest parent, so a cell's layer is
+        the length of the longest path to it from the root. Cells with parents that can't be reached from the root are
+        on layer 0, and cells without parents aren't on a layer at all.
+
+        Layers are computed in a single pass over the graph in topological order, and then kept up to date by
+        connect_cells, sever_cells and remove_cell instead of being recomputed.
+
+        :return: Dict of cell index to layer. Don't modify it
+        """
+        if self.layers is None:
+            # Readers may call this at the same time, so the cache is only shared once it is complete
+            layers = {}
+            root_idx = self.get_root_idx()
+            if root_idx is not None:
+                layers[root_idx] = 1
+            self.update_layers(self.graph.nodes, layers)
+            self.layers = layers
+
+        return self.layers
+
+    def update_layers(self, nodes, layers=None):
+        """
+        Recomputes the cached layers of `nodes` from the layers of their parents.
+
+        :param nodes: Indices of cells whose layers may have changed. Their ancestors' layers must be correct
+        :param layers: Dict of layers to update instead of the cache
+        """
+        if layers is None:
+            layers = self.layers
+        root_idx = self.get_root_idx()
+
+        for node in self.topology.sorted(nodes):
+            if node == root_idx:
+                continue
+            parents = list(self.graph.predecessors(node))
+            if not parents:
+                layers.pop(node, None)
+                continue
+            layers[node] = max((layers[p] + 1 for p in parents if layers.get(p, 0) > 0), default=0)
+
     def get_layer(self, cell_name):
-        layer = {}
-        toposorted_ls = list(nx.topological_sort(self.graph))
-        idx = self.name_to_idx(cell_name)
+        """
+        :param cell_name: Name of a cell
+        :return: The cell's layer, see get_layers, or -1 if it isn't on one
+        """
+        idx = self.names_to_indeces.get(cell_name.strip())
 
-        if len(toposorted_ls) < 1:
-            return
+        return self.get_layers().get(idx, -1)
+
+    def analyze_access(self, nodes=None):
+        """
+        Statically checks which variables cells read and write, see analysis.py.
+
+        Two cells conflict if they can run at the same time, meaning neither is an ancestor of the other, and either
+        both assign a variable and later meet at a common descendant ("write"), or one modifies a variable's object in
+        place while the other uses it ("mutate"). A link is suggested when a cell reads a variable that none of its
+        ancestors writes, but another cell that could be linked to it does.
+
+        :param nodes: Indices of the cells to analyze, defaults to every cell. Other cells aren't read, and only links
+                      between these cells are followed, which is exact as long as every cell on a path between two of
+                      them is included too, like in a cell's descendants or ancestors
+        :return: (dict of index to CellAccess, list of (variable, index, index, kind) conflicts,
+                  list of (parent index, child index, variable) suggested links)
+        """
+        order = self.topology.sorted(nodes)
+        nodes = set(order)
+        bit = {idx: 1 << position for position, idx in enumerate(order)}
+
+        # Bitmasks of each cell's ancestors and descendants
+        ancestors = {}
+        for idx in order:
+            ancestors[idx] = 0
+            for parent in self.graph.predecessors(idx):
+                if parent in nodes:
+                    ancestors[idx] |= ancestors[parent] | bit[parent]
+        descendants = {}
+        for idx in reversed(order):
+            descendants[idx] = 0
+            for child in self.graph.successors(idx):
+                if child in nodes:
+                    descendants[idx] |= descendants[child] | bit[child]
+
+        def concurrent(a, b):
+            return a != b and not ancestors[a] & bit[b] and not ancestors[b] & bit[a]
+
+        accesses = {idx: analyze_cell(self.graph.nodes[idx]["data"]) for idx in order}
+
+        writers = {}
+        users = {}
+        mutators = {}
+        for idx in order:
+            for name in accesses[idx].writes:
+                writers.setdefault(name, []).append(idx)
+            for name in accesses[idx].reads | accesses[idx].mutates:
+                users.setdefault(name, []).append(idx)
+            for name in accesses[idx].mutates:
+                mutators.setdefault(name, []).append(idx)
+
+        conflicts = []
+        for name, cells in writers.items():
+            for i, a in enumerate(cells):
+                for b in cells[i + 1:]:
+                    if concurrent(a, b) and descendants[a] & descendants[b]:
+                        conflicts.append((name, a, b, "write"))
+        for name, cells in mutators.items():
+            for a in cells:
+                for b in users.get(name, []):
+                    if concurrent(a, b) and (b not in cells or a < b):
+                        conflicts.append((name, a, b, "mutate"))
+
+        suggestions = []
+        for idx in order:
+            for name in sorted(accesses[idx].reads - accesses[idx].writes):
+                candidates = writers.get(name, [])
+                if any(ancestors[idx] & bit[w] for w in candidates):
+                    continue
+                linkable = [w for w in candidates if w != idx and not descendants[idx] & bit[w]]
+                if linkable:
+                    suggestions.append((linkable[0], idx, name))
+
+        return accesses, conflicts, suggestions
+
+    def reset_runtime(self):
+        # Delete all variables created by cells
+        self.runtime = Namespace(owner="runtime")
+        self.namespaces = {}
+        self.executed_hashes = {}
+
+    def get_chain_hashes(self, nodes=None):
+        """
+        A cell's chain hash covers its own content and the chain hashes of its parents, in link order. It changes
+        whenever the cell or anything upstream of it is edited or relinked.
+
+        :param nodes: Indices of the cells to hash, defaults to every cell. Their ancestors are hashed too, other cells
+                      aren't read
+        :return: Dict of cell index to chain hash
+        """
+        hashes = {}
+
+        for idx in self.topology.sorted(None if nodes is None else self.get_upstream(nodes)):
+            h = hashlib.sha256(self.graph.nodes[idx]["data"].get_hash().encode("utf-8"))
+            for parent in self.graph.predecessors(idx):
+                h.update(hashes[parent].encode("utf-8"))
+            hashes[idx] = h.hexdigest()
+
+        return hashes
 
-        layer[0] = 1
+    def get_dirty_cells(self, nodes=None, hashes=None):
+        """
+        A cell is dirty if it, or anything upstream of it, changed since its last successful execution, or if it has a
+        dirty ancestor. That way a cell is re-run whenever a parent re-runs, even when the parent failed last time.
+
+        :param nodes: Indices to check, defaults to every cell
+        :param hashes: Output of get_chain_hashes, computed if not provided
+        :return: Set of indices of dirty cells within `nodes`
+        """
+        nodes = set(self.graph.nodes if nodes is None else nodes)
+        hashes = hashes or self.get_chain_hashes(nodes)
+
+        dirty = {idx for idx in nodes if idx not in self.namespaces or self.executed_hashes.get(idx) != hashes[idx]}
 
-        for node in toposorted_ls:
-            if node == 0:
+        frontier = list(dirty)
+        while frontier:
+            for child in self.graph.successors(frontier.pop()):
+                if child in nodes and child not in dirty:
+                    dirty.add(child)
+                    frontier.append(child)
+
+        return dirty
+
+    def get_upstream(self, nodes):
+        """
+        :param nodes: Indices of cells
+        :return: Set of `nodes` and all of their ancestors
+        """
+        upstream = set(nodes)
+        frontier = list(upstream)
+        while frontier:
+            for parent in self.graph.predecessors(frontier.pop()):
+                if parent not in upstream:
+                    upstream.add(parent)
+                    frontier.append(parent)
+
+        return upstream
+
+    def create_namespace(self, idx, extra_parents=()):
+        """
+        :param idx: Index of the cell about to execute
+        :param extra_parents: Namespaces to merge in after those of the cell's parents
+        :return: Empty Namespace layer chained to the namespaces of the cell's parents from their latest execution
+        """
+        parents = [self.namespaces[p] for p in self.graph.predecessors(idx) if p in self.namespaces]
+        parents.extend(ns for ns in extra_parents if ns not in parents)
+        if not parents:
+            parents = [self.runtime]
+
+        namespace, conflicts = Namespace.fan_in(parents, self.graph.nodes[idx]["name"])
+
+        # The caller chose the order of extra parents explicitly, so only conflicts between the cell's parents matter
+        explicit = {ns.owner for ns in extra_parents}
+        for name, first, second in conflicts:
+            if second in explicit:
                 continue
-            for parent in algorithms.dag.ancestors(self.graph, node):
-                layer[node] = max((layer[node] if node in layer.keys() else 0),
-                                  (layer[parent] + 1 if parent in layer.keys() else 0))
-        if idx in layer.keys():
-            return layer[idx]
-        return -1
+            print("Variable " + name + " was set by both " + first + " and " + second +
+                  ", using the value from " + second)
 
-    def execute_linear_list_of_cells(self, cells_list):
-        std_file_out = ""
+        return namespace
 
-        for cell_name in cells_list:
-            cell = self.get_cell(cell_name)
+    def execute_cell(self, idx, pool=None, extra_parents=(), chain_hash=None, sink=None):
+        """
+        Executes a cell in a new namespace layer and records that layer for the cell's children.
+
+        :param idx: Index of the cell to execute
+        :param pool: KernelPool to run the cell in. If None, the cell runs in the calling thread
+        :param extra_parents: Namespaces to merge in after those of the cell's parents
+        :param chain_hash: The cell's chain hash, recorded if it executes successfully. Computed if not provided
+        :param sink: Tuple of streams that receive the cell's output along with the cell itself. Defaults to wherever
+                     the calling thread's output goes
+        """
+        router = install_router()
+        if sink is None:
+            sink = router.current_targets()
+
+        if chain_hash is None and not extra_parents:
+            chain_hash = self.get_chain_hashes([idx])[idx]
+
+        cell = self.graph.nodes[idx]["data"]
+        namespace = self.create_namespace(idx, extra_parents)
+        cache = self.parent.cache if chain_hash and cell.content_type == "python" else None
+
+        cached = cache.get(chain_hash) if cache else None
+
+        cell.output_buffer.limit = self.parent.cell_output_limit
+        cell.output = ""
+        cell.exception = None
+        cell.cpu_time = 0
+        cell.started = time.time()
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+
+        with router.route(cell.output_buffer, *sink):
+            if cached:
+                assigned, deleted, output = cached
+                namespace.update(restore_namespace(assigned))
+                for name in deleted:
+                    if namespace.has(name):
+                        del namespace[name]
+                print(output, end="")
+                succeeded = True
+            elif pool:
+                succeeded = cell.execute_in_process(pool, namespace)
+            else:
+                succeeded = cell.execute(namespace)
+
+        cell.duration = time.perf_counter() - started
+        cell.cpu_time += time.thread_time() - cpu_started
+        cell.finished = cell.started + cell.duration
+        cell.status = "cached" if cached else "succeeded" if succeeded else "failed"
+        # Only set once the timings are complete, so a profile taken while cells run leaves this one out until then
+        cell.run = self.runs
+
+        if not cached:
+            cell.durations = (cell.durations + [cell.duration])[-DURATION_HISTORY:]
+
+            # Output that overflowed the cell's buffer is gone, so the result can't be replayed faithfully. Objects the
+            # cell modified in place but didn't create live in its parents' layers, which replaying can't change
+            inherited = [name for name in analyze_cell(cell).mutates if name not in namespace] if cache else []
+            if cache and succeeded and not cell.output_buffer.dropped and not inherited:
+                # A layer only holds what its cell changed, which is exactly what the cache needs
+                assigned, skipped = snapshot_namespace(namespace)
+                if not skipped:
+                    cache.put(chain_hash, assigned, namespace.deleted, cell.output)
+
+        self.namespaces[idx] = namespace
+        if succeeded and not extra_parents:
+            self.executed_hashes[idx] = chain_hash
+        else:
+            self.executed_hashes.pop(idx, None)
 
-            p = threading.Thread(target=cell.execute)
+        if idx in self.running:
+            self.release(idx)
 
-            if cell.content_type == "python":
-                p.start()
-                p.join()
+    def execute_linear_list_of_cells(self, cells_list, cancel=None):
+        """
+        Executes the named cells one after the other. Each listed cell sees its parents' variables and those of the
+        cell listed before it.
 
-            std_file_out += cell.output
+        :param cells_list: Names of the cells to execute
+        :param cancel: Optional threading.Event, no more cells are started once it is set
+        """
+        previous = ()
+        sink = install_router().current_targets()
 
-    def bfs_traversal_execute(self):
-        import time
-        if len(self.get_all_cells_edges()[0]) == 0:
-            return
+        with self.parent.lock.write(lambda: not self.running):
+            indices = [self.name_to_idx(cell_name) for cell_name in cells_list]
+            if -1 in indices:
+                return
+            first_hash = self.get_chain_hashes(indices[:1])[indices[0]]
+            self.claim(indices)
 
-        self.executing = True
+        try:
+            for position, idx in enumerate(indices):
+                if cancel is not None and cancel.is_set():
+                    self.mark_cancelled(indices[position:])
+                    return
 
-        root_cell = self.get_cell("", 0)
+                p = threading.Thread(target=self.execute_cell,
+                                     args=(idx, None, previous, None if previous else first_hash, sink))
+                p.start()
+                p.join()
 
-        root = threading.Thread(target=root_cell.execute)
+                previous = (self.namespaces[idx],)
+        finally:
+            self.release()
 
-        std_file_out = "<" + root_cell.name + ">\n"
-        print("<" + root_cell.name + ">")
+    def bfs_traversal_execute(self, max_workers=None, backend="thread", incremental=False, cancel=None, targets=None):
+        """
+        Executes the root cell and all of its descendants. Each cell runs exactly once, as soon as all of its parents
+        have finished.
+
+        If `targets` are given, only they and their ancestors are executed instead, which is the least that computes
+        the targets' results. Branches that don't lead to a target are skipped.
+
+        The graph is only locked while the cells to run are chosen. From then on the execution works from a copy of the
+        links between them, so the graph can be edited while cells run, apart from the cells that haven't finished.
+
+        :param max_workers: Maximum number of cells executing at once. None lets the scheduler decide
+        :param backend: "thread" runs cells in this process, "process" runs them in a pool of worker processes so that
+                        CPU-bound branches aren't serialized by the GIL
+        :param incremental: If True, only cells that changed since their last successful execution, and their
+                            descendants, are executed. The others keep the namespaces of their last execution
+        :param cancel: Optional threading.Event. Once it is set no more cells are started, the execution returns when
+                       the running ones finish
+        :param targets: Names of the cells to compute, None to execute the whole graph
+        """
+        with self.parent.lock.write(lambda: not self.running):
+            if targets is not None:
+                indices = [self.name_to_idx(cell_name) for cell_name in targets]
+                if -1 in indices:
+                    return
+                to_run = self.get_upstream(indices)
+            else:
+                root_idx = self.get_root_idx()
+                if root_idx is None:
+                    return
 
-        root.start()
-        root.join()
+                to_run = nx.descendants(self.graph, root_idx)
+                to_run.add(root_idx)
+
+            hashes = self.get_chain_hashes(to_run)
+            if incremental:
+                to_run = self.get_dirty_cells(to_run, hashes)
+
+            _, conflicts, _ = self.analyze_access(to_run)
+            exclusive = {}
+            for name, a, b, kind in conflicts:
+                name_a = self.graph.nodes[a]["name"]
+                name_b = self.graph.nodes[b]["name"]
+                if kind == "write":
+                    print("Warning: cells " + name_a + " and " + name_b + " both set " + name +
+                          " and may run at the same time")
+                else:
+                    # Both branches share the object, so these can't overlap
+                    exclusive.setdefault(a, set()).add(b)
+                    exclusive.setdefault(b, set()).add(a)
+                    print("Warning: cell " + name_a + " modifies " + name + " in place while cell " + name_b +
+                          " uses it, they will not run at the same time")
 
-        std_file_out += root_cell.output
+            order = self.topology.sorted(to_run)
+            plan = nx.DiGraph()
+            plan.add_nodes_from(order)
+            plan.add_edges_from((parent, idx) for idx in order for parent in self.graph.predecessors(idx)
+                                if parent in to_run)
 
-        n_ = self.graph.neighbors(0)
-        neighbors = [n for n in n_]
+            # Cells at the head of the longest remaining chains start first
+            priority = bottom_levels(plan, order, self.get_expected_durations(to_run))
 
-        while neighbors:
-            new_neighbors = []
-            processes = []
-            for n in neighbors:
-                neighbor_cell = self.get_cell(self.get_lookup_table()[n].strip())
+            self.claim(to_run)
 
-                neighbor = threading.Thread(target=neighbor_cell.execute)
+        def announce(idx):
+            print("<" + self.graph.nodes[idx]["name"] + ">")
 
-                print("<" + neighbor_cell.name + ">")
+        scheduler = Scheduler(plan, max_workers)
+        sink = install_router().current_targets()
+        pool = self.parent.get_kernels(scheduler.max_workers) if backend == "process" else None
+        skipped = set()
 
-                neighbor.start()
-                processes.append(neighbor)
+        try:
+            skipped = scheduler.run(to_run, lambda idx: self.execute_cell(idx, pool, chain_hash=hashes[idx], sink=sink),
+                                    on_start=announce, exclusive=exclusive, priority=priority, cancel=cancel)
+        finally:
+            self.mark_cancelled(skipped)
+            self.release()
 
-                new_neighbors.extend([i for i in self.graph.neighbors(n)])
+    def claim(self, nodes):
+        """
+        Marks cells as belonging to the execution that is starting, called with write access to the graph. Edits to
+        them wait until they have run, see locks.
 
-            # TODO : check if this is broken
-            for proc in processes:
-                proc.join()
+        :param nodes: Indices of the cells the execution will run
+        """
+        self.running = set(nodes)
+        self.executing = True
+        self.runs += 1
+
+    def release(self, idx=None):
+        """:param idx: Index of a claimed cell that finished running. If None, the execution is over."""
+        def change():
+            if idx is None:
+                self.running = set()
+                self.executing = False
+            else:
+                self.running.discard(idx)
 
-            for n in neighbors:
-                time.sleep(.05)
-                neighbor = self.get_cell(self.get_lookup_table()[n])
-                std_file_out += "<" + neighbor.name + ">\n"
-                std_file_out += neighbor.output
+        self.parent.lock.update(change)
 
-            neighbors = new_neighbors
+    def mark_cancelled(self, nodes):
+        """:param nodes: Indices of cells that a cancelled execution didn't start."""
+        nodes = list(nodes)
+        for idx in nodes:
+            self.graph.nodes[idx]["data"].status = "cancelled"
+        if nodes:
+            print("Execution cancelled, " + str(len(nodes)) + " cells were not run")
 
-        self.executing = False
+    def get_expected_durations(self, nodes):
+        """
+        :param nodes: Iterable of cell indices
+        :return: Dict of each index to the number of seconds its cell is expected to take. Cells that have never run
+                 are expected to take as long as the average of the others, or 1 if none of them have run either, so
+                 that longer chains of them still come first
+        """
+        expected = {idx: self.graph.nodes[idx]["data"].expected_duration() for idx in nodes}
+        known = [duration for duration in expected.values() if duration is not None]
+        fallback = sum(known) / len(known) if known else 1
+        return {idx: fallback if duration is None else duration for idx, duration in expected.items()}
+
+    def get_results(self):
+        """:return: List of dicts with the profile and output of each cell's latest execution."""
+        results = []
+        for idx in self.indeces_to_names:
+            cell = self.graph.nodes[idx]["data"]
+            result = cell_profile(cell)
+            result["output"] = cell.output
+            result["output_dropped"] = cell.output_buffer.dropped
+            results.append(result)
+        return results
+
+    def get_profile(self, limit=SLOWEST_LIMIT):
+        """
+        :param limit: Number of cells to list as the slowest
+        :return: Report on the latest execution, see profiling.build_profile
+        """
+        return build_profile(self, limit)
 
     def save_graph(self, filename):
-        txtout = self.get_satx_as_txt()
-
+        """:param filename: Path to save the graph to, its extension picks the format."""
         filename = filename.replace("\"", "")
 
+        if filename.lower().endswith(".satb"):
+            save_binary(self, filename, self.parent.std_capture.summary())
+            return
+
+        if filename.lower().endswith(".py"):
+            txtout = self.get_py_file()
+        elif filename.lower().endswith(".ipynb"):
+            txtout = self.get_ipynb_file()
+        else:
+            txtout = self.get_satx_as_txt(positions=True)
+
         with open(filename, "w+") as file:
             file.write(txtout)
 
-    def get_satx_as_txt(self):
+    def get_satx_as_txt(self, positions=False):
+        """
+        :param positions: Whether to include the position of each cell
+        :return: The graph in the .satx format
+        """
         txtout = ""
 
         lookup_table = self.get_lookup_table()
@@ -425,11 +1199,26 @@ class Graph:
             name2 = lookup_table[edge[1]]
             txtout += "link " + name1 + " " + name2 + "\n"
 
-        if self.parent.std_capture.getvalue():
+        # Only a summary of the output is saved, so saving doesn't grow with the amount of output
+        summary = self.parent.std_capture.summary()
+        if summary:
             txtout += "<!--SATYRN_DCO_START-->\n"
-            txtout += self.parent.std_capture.getvalue()
+            txtout += summary
             txtout += "\n<!--SATYRN_DCO_END-->"
 
+        if any(c.durations for c in cells):
+            txtout += "\n<!--SATYRN_DURATIONS_START-->"
+            for c in cells:
+                if c.durations:
+                    txtout += "\n" + c.name + "".join(" {:.6f}".format(duration) for duration in c.durations)
+            txtout += "\n<!--SATYRN_DURATIONS_END-->"
+
+        if positions:
+            txtout += "\n<!--SATYRN_POSITIONING_START-->"
+            for c in cells:
+                txtout += "\n" + c.name + " " + str(c.left) + " " + str(c.top)
+            txtout += "\n<!--SATYRN_POSITIONING_END-->"
+
         return txtout
 
     def get_py_file(self):
@@ -439,18 +1228,28 @@ class Graph:
         cells = [self.get_cell(cn) for cn in cell_names]
 
         for c in cells:
-            txtout += "# <" + c.name + ">\n"
+            txtout += "# <" + c.name + " " + c.content_type + ">\n"
+            content = "\n".join(escape_py_line(line) for line in c.content.split("\n"))
             if c.content_type == "python":
-                txtout += c.content + "\n"
+                txtout += content + "\n"
             else:
-                txtout += "\"\"\"\n" + c.content + "\n\"\"\"\n"
+                txtout += "\"\"\"\n" + content + "\n\"\"\"\n"
+
+        # Comments that notebook.parse_py reads back, Python ignores them
+        for c in cells:
+            txtout += "# <position " + c.name + " " + str(c.left) + " " + str(c.top) + ">\n"
+            if c.durations:
+                txtout += ("# <durations " + c.name + "".join(" {:.6f}".format(duration) for duration in c.durations) +
+                           ">\n")
+        for name1, name2 in self.get_all_cells_edges()[2]:
+            txtout += "# <link " + name1 + " " + name2 + ">\n"
 
         txtout += "# <EOF>"
 
         return txtout
 
     def get_ipynb_file(self):
-        from nbformat.v4 import new_notebook, new_code_cell, new_markdown_cell
+        from nbformat.v4 import new_notebook, new_code_cell, new_markdown_cell, new_output
         from nbformat.v4.nbjson import JSONWriter
 
         json_writer = JSONWriter()
@@ -461,93 +1260,160 @@ class Graph:
         cells = [self.get_cell(cn) for cn in cell_names]
 
         for c in cells:
+            metadata = {'name': c.name, 'satyrn': {'top': c.top, 'left': c.left, 'durations': c.durations}}
             if c.content_type == "python":
-                nb.cells.append(new_code_cell(c.content, metadata={'name': c.name}))
+                outputs = [new_output("stream", name="stdout", text=c.output)] if c.output else []
+                nb.cells.append(new_code_cell(c.content, metadata=metadata, outputs=outputs))
             else:
-                nb.cells.append(new_markdown_cell(c.content, metadata={'name': c.name}))
+                nb.cells.append(new_markdown_cell(c.content, metadata=metadata))
+
+        # Jupyter runs cells top to bottom, the graph is kept for Satyrn
+        nb.metadata['satyrn'] = {'links': [list(link) for link in self.get_all_cells_edges()[2]],
+                                 'output': self.parent.std_capture.summary()}
 
         return json_writer.writes(nb)
 
 
 class Interpreter:
 
-    def __init__(self):
-        """Contains Graph object and interprets user input."""
+    def __init__(self, max_workers=None, backend="thread", cache_dir=None, cache_size=1024 ** 3,
+                 cell_output_limit=CELL_OUTPUT_LIMIT, spill_threshold=SPILL_THRESHOLD, kernels=None):
+        """
+        Contains Graph object and interprets user input.
+
+        :param max_workers: Default maximum number of cells executing at once
+        :param backend: Default execution backend, one of BACKENDS
+        :param cache_dir: Directory for the on-disk cell result cache. If None, results aren't cached
+        :param cache_size: Maximum size of the result cache in bytes
+        :param cell_output_limit: Number of characters of output each cell keeps from its latest execution
+        :param spill_threshold: Number of bytes of output kept in memory before they are written to a spill file
+        :param kernels: KernelPool the process backend runs cells in. If None, one is started when it is first needed
+        """
         # Graph object
         self.graph = Graph(self)
-        # Assume live input first
-        self.input_type = "live"
-        # This will be set if the user executes a .satx file
-        self.file = None
+        self.spill_threshold = spill_threshold
         # Start loop
-        self.std_capture = StringIO()
+        self.std_capture = self.new_output_log()
 
         self.filename = "Untitled.SATX"
 
-        self.lock = threading.Lock()
+        # Guards the graph, see locks
+        self.lock = ReadWriteLock()
+
+        # Upper bound on concurrently executing cells, None lets the scheduler decide
+        self.max_workers = max_workers
+        # Whether graph executions run cells in threads or in worker processes
+        self.backend = backend
+        # Results of cell executions that are reused across sessions
+        self.cache = ResultCache(cache_dir, cache_size) if cache_dir else None
+        self.cell_output_limit = cell_output_limit
+        # Worker processes of the process backend, kept between executions
+        self.kernels = kernels
+
+    def get_kernels(self, size):
+        """:return: KernelPool with at least `size` kernels, for executions with the process backend."""
+        if self.kernels is None:
+            self.kernels = KernelPool(size)
+        else:
+            self.kernels.ensure(size)
+        return self.kernels
+
+    def new_output_log(self):
+        """:return: Empty OutputLog using this interpreter's settings."""
+        return OutputLog(self.spill_threshold)
 
     def run_file(self, command):
         """:param command: command to be executed."""
         try:
-            openfile = open(command[0], "r")
-            self.file = openfile.readlines()
-            self.run_string(self.file)
+            self.load_notebook(command[0])
         except Exception as exception:
             print(exception)
 
-    def run_string(self, content):
-        self.file = content
-        self.input_type = "file"
+    def load_notebook(self, path, run_commands=True):
+        """
+        Runs a .satx file, or adds the cells of a .py or .ipynb file to the graph. Opening a .satb file replaces the
+        graph.
 
-        reading_dco_output = False
-        reading_positioning = False
+        :param path: Path of the file, its extension picks the format
+        :param run_commands: Whether to run commands in .satx files other than creating and linking cells
+        """
+        if path.lower().endswith(".satb"):
+            with self.editing(None):
+                self.reset_graph(False)
+                self.std_capture.write(load_binary(self.graph, path))
+        elif path.lower().endswith(".ipynb"):
+            with open(path, "r") as openfile:
+                self.run_statements(parse_ipynb(openfile))
+        else:
+            with open(path, "r") as openfile:
+                if path.lower().endswith(".py"):
+                    self.run_statements(parse_py(openfile))
+                else:
+                    self.run_statements(parse_satx(openfile), run_commands)
 
-        while len(content) > 0:
-            command = content.pop(0).split(" ")
+    def run_string(self, content):
+        """:param content: .satx code as a string, list of lines or file handle."""
+        self.run_statements(parse_satx(content))
 
-            if "<!--SATYRN_DCO_START-->" in command[0]:
-                reading_dco_output = True
-                continue
-            if "<!--SATYRN_DCO_END-->" in command[0]:
-                reading_dco_output = False
-                continue
+    def run_statements(self, statements, run_commands=True):
+        """
+        :param statements: Iterable of statements from satx.parse_satx or the parsers in notebook
+        :param run_commands: Whether to run commands other than link
+        """
+        for statement in statements:
+            kind = statement[0]
 
-            if reading_dco_output:
-                self.std_capture.write(" ".join(command) + "\n")
-                continue
+            if kind == "output":
+                self.std_capture.write(statement[1])
 
-            if "<!--SATYRN_POSITIONING_START-->" in command[0]:
-                reading_positioning = True
-                continue
+            elif kind == "position":
+                _, name, left, top = statement
+                cell = self.graph.get_cell(name)
+                if cell:
+                    cell.left = left
+                    cell.top = top
 
-            if "<!--SATYRN_POSITIONING_END-->" in command[0]:
-                reading_positioning = False
-                continue
+            elif kind == "durations":
+                cell = self.graph.get_cell(statement[1])
+                if cell:
+                    cell.durations = statement[2][-DURATION_HISTORY:]
 
-            if reading_positioning:
-                self.graph.get_cell(command[0]).left = command[1]
-                self.graph.get_cell(command[0]).top = command[2]
-                continue
+            elif kind == "cell_output":
+                cell = self.graph.get_cell(statement[1])
+                if cell:
+                    cell.output = statement[2]
 
-            if len(command) == 0 or command == '':
-                continue
+            elif kind == "cell":
+                self.create_cell(statement[1], statement[2])
 
-            elif command[0] == "help":
-                print(self.help_menu())
+            elif not run_commands and statement[1][0] != "link":
+                print("Skipping command \"" + " ".join(statement[1]) + "\"")
 
-            elif command[0] == "quit":
+            elif self.command_switch(statement[1]) == "break":
                 break
 
-            self.command_switch(command)
+    def convert(self, command):
+        """:param command: command to be executed."""
+        if len(command) != 3:
+            print("convert takes 2 arguments: [input_filename] [output_filename]")
+            return
+
+        for filename in command[1:]:
+            if not filename.lower().endswith(EXTENSIONS):
+                print("Notebooks must be one of " + ", ".join(EXTENSIONS))
+                return
+
+        # Converting never touches the current graph
+        converter = Interpreter(cell_output_limit=self.cell_output_limit, spill_threshold=self.spill_threshold)
+        try:
+            converter.load_notebook(command[1], run_commands=False)
+            converter.graph.save_graph(command[2])
+        except Exception as exception:
+            print(exception)
 
     def read_input(self):
-        # Read input from stdin or external file. Returns list of command params.
-        if self.input_type == "live" or len(self.file) == 0:
-            usr = input(u'\u2644' + ": ").strip()
-            self.input_type = "live"
-        else:
-            usr = self.file.pop(0).strip()
-            print(u'\u2644' + ": " + usr)
+        # Read input from stdin. Returns list of command params.
+        usr = input(u'\u2644' + ": ").strip()
 
         usr = usr.lower()
         return usr.split()
@@ -563,16 +1429,26 @@ class Interpreter:
             "sever [first_cell_name] [second_cell_name]": "Removes link between first_cell and second_cell",
             "merge [first_cell_name] [second_cell_name]": "Merges the two cells if they are adjacent",
             "swap [first_cell_name] [second_cell_name]": "Swaps name, content type, and contents of specified cells",
-            "execute [cell_name_1] [cell_name_2] ...": "Executes graph. If no cell names are provided, "
-                                                       "all will be executed. \n\t\t",
+            "execute [cell_name_1] [cell_name_2] ... (-j max_concurrent_cells) (-b thread/process) (-i) (-u)":
+                "Executes graph. If no cell names are provided, all will be executed. \n\t\t"
+                "-i only re-executes cells that changed since their last execution, and their descendants. \n\t\t"
+                "-u executes the named cells and everything they depend on, in parallel, and nothing else",
             "display [cell_name]": "Displays graph. If cell_name defined, that cell's details will be printed out",
             "list": "Prints out names of all cells in graph",
+            "analyze": "Prints the variables each cell reads and writes, conflicts between branches that may run at "
+                       "the same time, and suggested links",
+            "profile (number_of_cells)": "Prints the slowest cells of the latest execution, its critical path, and how "
+                                         "many cells ran at once compared with how many could have",
             "reset_runtime": "Deletes all variables created within cells",
             "reset_graph": "Deletes all variables and cells. Equivalent to restarting satyrn_python session",
-            "save [filename].satx": "Saves graph to .satx file",
+            "save [filename]": "Saves graph to a .satx, .satb, .py or .ipynb file, depending on the extension",
+            "convert [input_filename] [output_filename]": "Converts a notebook between the .satx, .satb, .py and "
+                                                          ".ipynb formats without running it",
             "[filename].satx": "Executes satyrn_python code in specified file. File must have .satx extension. "
                                "\n\t\tExamples of "
-                               "syntax can be seen at https://github.com/CharlesAverill/satyrn/tree/master/examples ",
+                               "syntax can be seen at "
+                               "https://github.com/CharlesAverill/satyrn/tree/master/examples \n\t\t"
+                               "A .satb, .py or .ipynb file is opened instead of executed",
             "quit": "Exits satyrn_python session"
         }
         output = ("------------------------------------------------------------------------\n"
@@ -587,97 +1463,127 @@ class Interpreter:
             output += "\t" + item[0] + " :\n\t\t" + item[1] + "\n\n"
         return output
 
-    def create_cell(self, command):
+    def create_cell(self, command, content=None):
         """
         :param command: command to be executed
+        :param content: Content of the cell. If None and the command asks for content, it is entered in a text editor
         """
-        with self.lock:
-            keywords = ["help", "quit", "cell", "link", "sever",
-                        "execute", "display", "remove", "reset_runtime",
-                        "edit", "swap", "list", "reset_graph", "merge", "save"]
-
-            if len(command) != 4:
-                print("create_cell takes 3 arguments: [name] [content_type] [add_content]")
-                return
+        if len(command) != 4:
+            print("create_cell takes 3 arguments: [name] [content_type] [add_content]")
+            return
 
-            name = command[1]
-            if name in keywords:
-                print("\"" + name + "\" is a restricted keyword and cannot be used for a cell name.")
-                return
+        name = command[1]
+        problem = check_cell_name(name)
+        if problem:
+            print(problem)
+            return
 
-            if ".satx" in name:
-                print("Cell names cannot include \".satx\"")
-                return
+        content_type = command[2]
 
-            content_type = command[2]
+        # The text editor stays open for as long as the user likes, so the graph isn't locked until it closes
+        if content is None:
             content = ""
-
             if "y" in command[3]:
-                if self.input_type == "file":
-                    temp = ""
-                    while ";" not in temp:
-                        content += temp
-                        temp = self.file.pop(0) + "\n"
-                else:
-                    ti = TextIO()
-                    content = ti.text_input().strip()
+                ti = TextIO()
+                content = ti.text_input().strip()
 
+        with self.editing():
             self.graph.add_cell(Cell(name, content_type, content.strip()))
 
     def edit_cell(self, command):
         """:param command: command to be executed."""
-        with self.lock:
-            if len(command) != 2:
-                print("edit takes 1 argument: [cell_name]")
-                return
+        if len(command) != 2:
+            print("edit takes 1 argument: [cell_name]")
+            return
 
-            target_cell = self.graph.get_cell(command[1])
-            old_content = target_cell.content
+        with self.lock.read():
+            old_content = self.graph.get_cell(command[1]).content
 
-            ti = TextIO()
-            new_content = ti.text_input(old_content).strip()
+        ti = TextIO()
+        new_content = ti.text_input(old_content).strip()
 
-            target_cell.content = new_content
+        with self.editing([command[1]]):
+            self.graph.get_cell(command[1]).content = new_content
 
     def set_cell_contents(self, command):
-        with self.lock:
+        with self.editing([command[1]]):
             target_cell = self.graph.get_cell(command[1])
             target_cell.content = command[2]
+            self.graph.version += 1
 
-    def rename_cell(self, command):
-        """:param command: command to be executed."""
-        with self.lock:
-            if len(command) != 3:
-                print("link takes 2 arguments: [original_cell_name] [new_cell_name]")
-                return
+    def editing(self, names=(), with_children=()):
+        """
+        Edits wait until no running execution has claimed the cells they change, see locks.
 
-            index = self.graph.names_to_indeces[command[1]]
-            og_name = self.graph.get_cell(command[1]).name
+        :param names: Names of the cells the edit changes, None if it changes every cell
+        :param with_children: Names of cells whose children the edit changes as well, e.g. cells that are removed
+        :return: Context manager with write access to the graph
+        """
+        def ready():
+            running = self.graph.running
+            if not running:
+                return True
+            if names is None:
+                return False
+
+            lookup = self.graph.names_to_indeces
+            for name in names:
+                if lookup.get(name.strip()) in running:
+                    return False
+            for name in with_children:
+                idx = lookup.get(name.strip())
+                if idx is not None and (idx in running or not running.isdisjoint(self.graph.graph.successors(idx))):
+                    return False
+            return True
+
+        return self.lock.write(ready)
+
+    def apply_batch(self, operations):
+        """
+        :param operations: List of operation dicts, see Graph.apply_batch
+        :return: (graph version after the batch, None or (position of the failed operation, reason))
+        """
+        names = []
+        with_children = []
+        for operation in operations:
+            kind = operation.get("op")
+            if kind in ("edit", "rename") and isinstance(operation.get("name"), str):
+                names.append(operation["name"])
+            elif kind in ("link", "sever") and isinstance(operation.get("second"), str):
+                names.append(operation["second"])
+            elif kind == "delete" and isinstance(operation.get("name"), str):
+                with_children.append(operation["name"])
+
+        with self.editing(names, with_children):
+            failure = self.graph.apply_batch(operations)
+            return self.graph.version, failure
 
-            self.graph.get_cell(og_name).name = command[2]
-            self.graph.names_to_indeces.update({command[2]: index})
-            del self.graph.names_to_indeces[og_name]
+    def rename_cell(self, command):
+        """:param command: command to be executed."""
+        if len(command) != 3:
+            print("link takes 2 arguments: [original_cell_name] [new_cell_name]")
+            return
 
-            for node, data in self.graph.graph.nodes(data=True):
-                if data['name'] == command[1]:
-                    data['name'] = command[2]
-                    break
+        with self.editing([command[1]]):
+            self.graph.rename_cell(command[1], command[2])
 
     def remove_cell(self, command):
         """:param command: command to be executed."""
         to_remove = command[1:]
-        for cell in to_remove:
-            i = self.graph.remove_cell(cell)
-            if i == -1:
-                return -1
+        with self.editing(with_children=to_remove):
+            for cell in to_remove:
+                i = self.graph.remove_cell(cell)
+                if i == -1:
+                    return -1
 
     def link(self, command):
         """:param command: command to be executed."""
-        with self.lock:
-            if len(command) != 3:
-                print("link takes 2 arguments: [cell_1] [cell_2]")
-                return
+        if len(command) != 3:
+            print("link takes 2 arguments: [cell_1] [cell_2]")
+            return
 
+        # Only the child's parents change
+        with self.editing([command[2]]):
             idx1 = self.graph.name_to_idx(command[1])
             idx2 = self.graph.name_to_idx(command[2])
 
@@ -689,17 +1595,20 @@ class Interpreter:
             print("sever takes 2 arguments: [cell_1] [cell_2]")
             return
 
-        name_1 = self.graph.name_to_idx(command[1])
-        name_2 = self.graph.name_to_idx(command[2])
+        with self.editing([command[2]]):
+            name_1 = self.graph.name_to_idx(command[1])
+            name_2 = self.graph.name_to_idx(command[2])
 
-        self.graph.sever_cells(name_1, name_2)
+            self.graph.sever_cells(name_1, name_2)
 
     def swap(self, command):
         """:param command: command to be executed."""
         if len(command) != 3:
             print("swap takes 2 arguments: [cell_1] [cell_2]")
             return
-        self.graph.swap_cells(command[1], command[2])
+
+        with self.editing(command[1:]):
+            self.graph.swap_cells(command[1], command[2])
 
     def merge(self, command):
         """:param command: command to be executed."""
@@ -707,97 +1616,197 @@ class Interpreter:
             print("merge takes 2-3 arguments: [cell_1] [cell_2] (new_name)")
             return
 
-        name_1 = self.graph.name_to_idx(command[1])
-        name_2 = self.graph.name_to_idx(command[2])
-
         if len(command) >= 4:
             newname = command[3]
         else:
             newname = command[1] + "_merged"
 
-        self.graph.merge_cells(name_1, name_2, newname)
+        # The second cell's children are relinked to the merged cell
+        with self.editing([command[1]], [command[2]]):
+            name_1 = self.graph.name_to_idx(command[1])
+            name_2 = self.graph.name_to_idx(command[2])
 
-    def execute(self, command):
-        """:param command: command to be executed."""
-        with self.lock:
-            if ">>" in command:
-                cells_list = command[1:-2]
-            else:
-                cells_list = command[1:]
-            if len(cells_list) >= 1:
-                try:
-                    self.graph.execute_linear_list_of_cells(cells_list)
-                except Exception as exception:
-                    print("There was an error executing one of the cells")
-                    print(exception)
-            else:
-                self.graph.bfs_traversal_execute()
+            self.graph.merge_cells(name_1, name_2, newname)
 
-    def display(self, command):
-        """:param command: command to be executed."""
-        if len(command) == 1:
-            self.graph.display()
+    @staticmethod
+    def pop_option(command, flags):
+        """
+        Removes a flag and the value following it from a command.
+
+        :param command: List of command params
+        :param flags: Tuple of equivalent spellings of the flag, e.g. ("-j", "--jobs")
+        :return: (value of the flag or None if it isn't present, command without the flag and its value)
+        """
+        for flag in flags:
+            if flag in command:
+                idx = command.index(flag)
+                if idx + 1 >= len(command):
+                    raise ValueError("/".join(flags) + " takes 1 argument")
+                return command[idx + 1], command[:idx] + command[idx + 2:]
+        return None, command
+
+    def execute(self, command, cancel=None):
+        """
+        :param command: command to be executed
+        :param cancel: Optional threading.Event that stops the execution from starting more cells once it is set
+        """
+        if ">>" in command:
+            cells_list = command[1:-2]
         else:
-            if len(command) != 2:
-                print("display takes 0 or 1 arguments: [name_of_cell_to_print]")
+            cells_list = command[1:]
+
+        try:
+            jobs, cells_list = self.pop_option(cells_list, ("-j", "--jobs"))
+            backend, cells_list = self.pop_option(cells_list, ("-b", "--backend"))
+        except ValueError as error:
+            print(error)
+            return
+
+        max_workers = self.max_workers
+        if jobs is not None:
+            if not jobs.isdigit() or int(jobs) < 1:
+                print("-j/--jobs must be a positive integer")
+                return
+            max_workers = int(jobs)
+
+        backend = backend or self.backend
+        if backend not in BACKENDS:
+            print("-b/--backend must be one of: " + ", ".join(BACKENDS))
+            return
+
+        incremental = "-i" in cells_list or "--incremental" in cells_list
+        up_to = "-u" in cells_list or "--up-to" in cells_list
+        cells_list = [c for c in cells_list if c not in ("-i", "--incremental", "-u", "--up-to")]
+
+        if up_to:
+            if not cells_list:
+                print("-u/--up-to takes at least 1 cell name")
                 return
+            self.graph.bfs_traversal_execute(max_workers, backend, incremental, cancel, targets=cells_list)
+        elif len(cells_list) >= 1:
+            try:
+                self.graph.execute_linear_list_of_cells(cells_list, cancel)
+            except Exception as exception:
+                print("There was an error executing one of the cells")
+                print(exception)
+        else:
+            self.graph.bfs_traversal_execute(max_workers, backend, incremental, cancel)
+
+    def display(self, command):
+        """:param command: command to be executed."""
+        with self.lock.read():
+            if len(command) == 1:
+                self.graph.display()
             else:
-                if not self.graph.get_cell(command[1]):
-                    print("Cell " + command[1] + " does not exist")
+                if len(command) != 2:
+                    print("display takes 0 or 1 arguments: [name_of_cell_to_print]")
                     return
-                code = self.graph.get_cell(command[1]).content.strip()
-                if code:
-                    print("\n```\n" + code + "\n```\n")
-                in_edges, out_edges = self.graph.get_in_out_edges(command[1])
-                if len(in_edges) > 0:
-                    print("In Edges:")
-                    for edge in in_edges:
-                        print(edge)
-                print()
-                if len(out_edges) > 0:
-                    print("Out Edges:")
-                    for edge in out_edges:
-                        print(edge)
+                else:
+                    if not self.graph.get_cell(command[1]):
+                        print("Cell " + command[1] + " does not exist")
+                        return
+                    code = self.graph.get_cell(command[1]).content.strip()
+                    if code:
+                        print("\n```\n" + code + "\n```\n")
+                    in_edges, out_edges = self.graph.get_in_out_edges(command[1])
+                    if len(in_edges) > 0:
+                        print("In Edges:")
+                        for edge in in_edges:
+                            print(edge)
                     print()
+                    if len(out_edges) > 0:
+                        print("Out Edges:")
+                        for edge in out_edges:
+                            print(edge)
+                        print()
+
+    def analyze(self, command):
+        """:param command: command to be executed."""
+        if len(command) != 1:
+            print("analyze takes 0 arguments")
+            return
+
+        with self.lock.read():
+            accesses, conflicts, suggestions = self.graph.analyze_access()
+
+        for idx, access in accesses.items():
+            name = self.graph.graph.nodes[idx]["name"]
+            print(name + ":")
+            print("\treads: " + ", ".join(sorted(access.reads)))
+            print("\twrites: " + ", ".join(sorted(access.writes)))
+            if access.mutates:
+                print("\tmodifies: " + ", ".join(sorted(access.mutates)))
+
+        for name, a, b, kind in conflicts:
+            print("Conflict (" + kind + ") on " + name + " between " + self.graph.graph.nodes[a]["name"] + " and " +
+                  self.graph.graph.nodes[b]["name"])
+
+        for parent, child, name in suggestions:
+            print("Suggested link: " + self.graph.graph.nodes[parent]["name"] + " " +
+                  self.graph.graph.nodes[child]["name"] + " (" + name + ")")
+
+    def profile(self, command):
+        """:param command: command to be executed."""
+        if len(command) > 2 or (len(command) == 2 and not command[1].isdigit()):
+            print("profile takes 1 optional argument: [number_of_cells]")
+            return
+
+        with self.lock.read():
+            report = self.graph.get_profile(int(command[1]) if len(command) == 2 else SLOWEST_LIMIT)
+
+        if not report["cells"]:
+            print("No cells have been executed")
+            return
+
+        print("{} cells, {:.3f}s wall time, {:.3f}s total duration, {:.3f}s CPU time".format(
+            report["cells"], report["wall_time"], report["total_duration"], report["total_cpu_time"]))
+
+        print("Slowest cells:")
+        for cell in report["slowest"]:
+            line = "\t{}: {:.3f}s, {:.3f}s CPU, {}".format(cell["name"], cell["duration"], cell["cpu_time"],
+                                                           cell["status"])
+            if cell["exception"]:
+                line += " (" + cell["exception"]["type"] + ": " + cell["exception"]["message"] + ")"
+            print(line)
+
+        path = report["critical_path"]
+        print("Critical path ({:.3f}s): {}".format(path["duration"], " -> ".join(path["cells"])))
+
+        parallelism = report["parallelism"]
+        print("Parallelism: {:.2f} achieved, {:.2f} possible, at most {} cells at once".format(
+            parallelism["achieved"], parallelism["possible"], parallelism["peak"]))
 
     def list_cells(self):
-        nodes, _, edge_names = self.graph.get_all_cells_edges()
+        with self.lock.read():
+            nodes, _, edge_names = self.graph.get_all_cells_edges()
         print("Cells:", nodes)
         print("Edges:", edge_names)
 
     def reset_runtime(self):
-        # Delete all runtime variables
-        with self.lock:
-            global exec_vars
-            exec_vars = {}
+        # Delete all runtime variables, once no execution is using them
+        with self.editing(None):
+            self.graph.reset_runtime()
 
     def reset_graph(self, ask=True):
         if ask:
             confirm = input(
                 "Are you sure you want to reset the graph? This will delete all nodes and variables. (y/n) ")
-            if "y" in confirm:
-                self.graph = Graph(self)
-                self.reset_runtime()
-                self.std_capture = StringIO()
-        else:
+            if "y" not in confirm:
+                return
+
+        with self.editing(None):
             self.graph = Graph(self)
             self.reset_runtime()
-            self.std_capture = StringIO()
+            self.std_capture = self.new_output_log()
 
     def save_graph(self, command):
         """:param command: command to be executed."""
         if len(command) != 2:
             print("save takes 1 argument1: [filename]")
             return
-        output_text = ""
-        if command[1].lower().endswith(".satx"):
-            output_text = self.graph.get_satx_as_txt()
-        elif command[1].lower().endswith(".py"):
-            output_text = self.graph.get_py_file()
-        elif command[1].lower().endswith(".ipynb"):
-            output_text = self.graph.get_ipynb_file()
-        with open(command[1], "w+") as file:
-            file.write(output_text)
+
+        with self.lock.read():
+            self.graph.save_graph(command[1])
 
     def command_switch(self, command):
 
@@ -843,6 +1852,12 @@ class Interpreter:
         elif command[0] == "list":
             self.list_cells()
 
+        elif command[0] == "analyze":
+            self.analyze(command)
+
+        elif command[0] == "profile":
+            self.profile(command)
+
         elif command[0] == "reset_runtime":
             self.reset_runtime()
 
@@ -852,7 +1867,10 @@ class Interpreter:
         elif command[0] == "save":
             self.save_graph(command)
 
-        elif ".satx" in command[0]:
+        elif command[0] == "convert":
+            self.convert(command)
+
+        elif ".satx" in command[0] or command[0].lower().endswith(EXTENSIONS):
             self.run_file(command)
 
         elif len(command[0]) > 0:
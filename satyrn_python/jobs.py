@@ -0,0 +1,142 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Background jobs.
+
+Executing a graph can take much longer than an HTTP client should wait for a response. The UI submits executions to a
+JobQueue instead, which runs them one at a time on its own thread and hands back a Job right away. Clients poll the
+Job's status and can cancel it.
+
+Cancelling is cooperative. Jobs are given a threading.Event that is set when they are cancelled. A queued job never
+starts. A running graph execution stops starting new cells, lets the cells that are already running finish, and marks
+the rest as cancelled. Python offers no safe way to interrupt a thread in the middle of a cell.
+"""
+
+# Statuses a Job goes through. Jobs end as succeeded, failed or cancelled
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+
+# Number of finished jobs that are remembered for status requests
+FINISHED_JOBS_KEPT = 100
+
+_job_ids = itertools.count(1)
+
+
+class Job:
+
+    def __init__(self, kind, function):
+        """
+        :param kind: What the job does, reported along with its status
+        :param function: Callable taking the job's cancel Event. Whatever it returns becomes the job's result
+        """
+        self.id = str(next(_job_ids))
+        self.kind = kind
+        self.function = function
+
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+
+    def run(self):
+        # Called by the JobQueue's thread
+        if self.cancelled.is_set():
+            self.finish("cancelled")
+            return
+
+        self.status = "running"
+        self.started = time.time()
+        try:
+            self.result = self.function(self.cancelled)
+        except Exception as exception:
+            self.error = str(exception)
+            self.finish("failed")
+            return
+
+        self.finish("cancelled" if self.cancelled.is_set() else "succeeded")
+
+    def finish(self, status):
+        self.status = status
+        self.finished = time.time()
+        self.done.set()
+
+    def cancel(self):
+        """:return: Whether the job was still queued or running, and so will stop."""
+        if self.done.is_set():
+            return False
+        self.cancelled.set()
+        return True
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the job has finished or `timeout` seconds pass.
+
+        :return: Whether the job has finished
+        """
+        return self.done.wait(timeout)
+
+    def to_dict(self):
+        """:return: Dict of the job's id, kind, status, timestamps, result and error."""
+        return {"id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+                "result": self.result,
+                "error": self.error}
+
+
+class JobQueue:
+
+    def __init__(self, kept=FINISHED_JOBS_KEPT):
+        """
+        Runs submitted jobs one at a time in the order they were submitted.
+
+        :param kept: Number of finished jobs to remember
+        """
+        self.kept = kept
+        # Job id to Job, oldest first
+        self.jobs = OrderedDict()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="satyrn-job")
+        self.lock = threading.Lock()
+
+    def submit(self, kind, function):
+        """
+        :param kind: What the job does
+        :param function: Callable taking the job's cancel Event
+        :return: The queued Job
+        """
+        job = Job(kind, function)
+
+        with self.lock:
+            self.jobs[job.id] = job
+            finished = [old.id for old in self.jobs.values() if old.done.is_set()]
+            for job_id in finished[:max(0, len(finished) - self.kept)]:
+                del self.jobs[job_id]
+
+        self.executor.submit(job.run)
+        return job
+
+    def get(self, job_id):
+        """:return: Job with id `job_id`, or None if there is none."""
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        """:return: List of all remembered jobs, oldest first."""
+        with self.lock:
+            return list(self.jobs.values())
+
+    def busy(self):
+        """:return: Whether any job is queued or running."""
+        with self.lock:
+            return any(not job.done.is_set() for job in self.jobs.values())
@@ -0,0 +1,161 @@
+import importlib
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where kernels are only recycled by number of runs
+    resource = None
+
+"""
+Pool of warm worker processes for the process backend.
+
+Starting a worker process and importing heavy modules like numpy or pandas in it can take much longer than the cells
+themselves. A KernelPool starts its kernels, one worker process each, as soon as it is created and has each of them
+import a list of modules right away, so by the time a cell runs the imports are done. Kernels are kept for as long as
+the pool exists and are shared by every execution, and by every session of a server.
+
+Each kernel runs one cell at a time. State left behind by cells, like modules they imported or memory they didn't give
+back, builds up over time, so a kernel is replaced by a fresh one after it has run `max_runs` cells, after its peak
+memory use passes `memory_limit`, or if its process dies. The replacement starts warming up right away.
+"""
+
+# Default number of cells a kernel runs before it is replaced
+KERNEL_MAX_RUNS = 100
+
+
+def preload(modules):
+    """
+    Imports modules so that cells importing them later don't wait. Modules that fail to import are skipped, the cells
+    that use them will report the error.
+
+    :param modules: Names of the modules
+    """
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+
+def peak_memory():
+    """:return: Peak memory use of the current process in bytes, or None if it can't be measured."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_in_kernel(function, args):
+    """:return: (what function(*args) returns, peak memory of the kernel afterwards). Runs in the kernel."""
+    return function(*args), peak_memory()
+
+
+class Kernel:
+
+    def __init__(self, modules):
+        """:param modules: Names of the modules to import as soon as the kernel's process starts."""
+        self.executor = ProcessPoolExecutor(max_workers=1, initializer=preload, initargs=(tuple(modules),))
+        self.runs = 0
+        # Submitting anything starts the process, which imports the modules while no cell is waiting for it
+        self.executor.submit(os.getpid)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class KernelPool:
+
+    def __init__(self, size, modules=(), max_runs=KERNEL_MAX_RUNS, memory_limit=None):
+        """
+        :param size: Number of kernels to start
+        :param modules: Names of the modules every kernel imports when it starts
+        :param max_runs: Number of cells a kernel runs before it is replaced, None to never replace kernels for this
+        :param memory_limit: Peak memory use in bytes past which a kernel is replaced, None for no limit
+        """
+        self.modules = tuple(modules)
+        self.max_runs = max_runs
+        self.memory_limit = memory_limit
+
+        self.lock = threading.Lock()
+        self.kernels = []
+        # Kernels that aren't running a cell
+        self.idle = queue.Queue()
+        self.closed = False
+
+        self.ensure(size)
+
+    def ensure(self, size):
+        """Starts kernels until the pool has at least `size` of them."""
+        with self.lock:
+            while len(self.kernels) < size:
+                kernel = Kernel(self.modules)
+                self.kernels.append(kernel)
+                self.idle.put(kernel)
+
+    def submit(self, function, *args):
+        """
+        Runs function(*args) in the next kernel that is free, waiting for one if they are all busy.
+
+        :return: Future of what the function returns
+        """
+        kernel = self.idle.get()
+        result = Future()
+
+        try:
+            inner = kernel.executor.submit(run_in_kernel, function, args)
+        except Exception as exception:
+            self.release(kernel, failed=True)
+            result.set_exception(exception)
+            return result
+
+        def done(inner):
+            exception = inner.exception()
+            if exception is not None:
+                self.release(kernel, failed=True)
+                result.set_exception(exception)
+                return
+
+            value, memory = inner.result()
+            self.release(kernel, memory=memory)
+            result.set_result(value)
+
+        inner.add_done_callback(done)
+        return result
+
+    def release(self, kernel, memory=None, failed=False):
+        """
+        Hands a kernel back to the pool after it has run a cell, replacing it if it is due.
+
+        :param kernel: Kernel that finished
+        :param memory: Kernel's peak memory use in bytes
+        :param failed: Whether the kernel's process failed
+        """
+        kernel.runs += 1
+        recycle = (failed or (self.max_runs is not None and kernel.runs >= self.max_runs) or
+                   (self.memory_limit is not None and memory is not None and memory >= self.memory_limit))
+
+        with self.lock:
+            if self.closed:
+                kernel.shutdown()
+                return
+
+            if recycle:
+                kernel.shutdown()
+                self.kernels.remove(kernel)
+                kernel = Kernel(self.modules)
+                self.kernels.append(kernel)
+
+        self.idle.put(kernel)
+
+    def shutdown(self):
+        """Stops every kernel, cells that are running finish first."""
+        with self.lock:
+            self.closed = True
+            for kernel in self.kernels:
+                kernel.shutdown()
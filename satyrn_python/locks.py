@@ -0,0 +1,94 @@
+import threading
+from contextlib import contextmanager
+
+"""
+Locking for the graph.
+
+Any number of threads may read the graph at once, and a thread that changes it has to wait until it is the only one
+using it. Executions never hold the lock while cells run. Instead, an execution claims the cells it is going to run
+(see Graph.running) and releases each one as soon as it has finished. An edit that would change a claimed cell waits
+for its claim to be released, while edits to every other cell and all reads go ahead during the execution.
+
+Threads waiting to change the graph keep new readers out, so a steady stream of reads can't starve them. Threads that
+are only waiting for a claim to be released don't, or every read would wait for the execution.
+"""
+
+
+class ReadWriteLock:
+
+    def __init__(self):
+        """Lock with shared read access and exclusive write access. The thread with write access may also read."""
+        self.condition = threading.Condition()
+        self.readers = 0
+        # Thread that has write access, and how many times it entered write()
+        self.writer = None
+        self.depth = 0
+        self.writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        """Context manager for shared access to the graph."""
+        me = threading.get_ident()
+
+        with self.condition:
+            if self.writer == me:
+                counted = False
+            else:
+                while self.writer is not None or self.writers_waiting:
+                    self.condition.wait()
+                self.readers += 1
+                counted = True
+
+        try:
+            yield
+        finally:
+            if counted:
+                with self.condition:
+                    self.readers -= 1
+                    if not self.readers:
+                        self.condition.notify_all()
+
+    @contextmanager
+    def write(self, ready=None):
+        """
+        Context manager for exclusive access to the graph.
+
+        :param ready: Optional callable that returns whether the change can be made yet. It is called with nobody else
+                      using the graph, and waited on until it returns True. Call update() to wake up the waiters when
+                      what it depends on changes. Ignored if the calling thread already has write access
+        """
+        me = threading.get_ident()
+
+        with self.condition:
+            if self.writer != me:
+                while True:
+                    if self.writer is None and not self.readers:
+                        if ready is None or ready():
+                            break
+                        self.condition.wait()
+                    else:
+                        self.writers_waiting += 1
+                        self.condition.wait()
+                        self.writers_waiting -= 1
+                self.writer = me
+            self.depth += 1
+
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.depth -= 1
+                if not self.depth:
+                    self.writer = None
+                    self.condition.notify_all()
+
+    def update(self, function):
+        """
+        Runs `function`, which changes something that the `ready` callables of waiting writers depend on, and wakes
+        those writers up.
+
+        :param function: Callable taking no arguments
+        """
+        with self.condition:
+            function()
+            self.condition.notify_all()
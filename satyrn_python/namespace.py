@@ -0,0 +1,202 @@
+"""
+Namespaces are layered, copy-on-write dicts of variables created by cells.
+
+Every execution of a cell gets a fresh Namespace layer that is chained to the namespace of its parent. The layer only
+holds the variables the cell assigned or deleted, anything else is looked up through the chain of parents when it is
+first missed. Creating a layer is O(1) regardless of how many variables exist, and sibling branches never see or
+overwrite each other's assignments.
+
+When a cell has more than one parent, its layer is chained to the first parent and the variables that each of the
+other parents' branches changed since the branches split are copied into it. Parents are merged in the order their
+links were created, and if two branches assigned the same variable the later parent wins. Finding the changes only
+walks the layers between the fan-in cell and the common ancestor, so merging costs O(changed variables) and not
+O(namespace size). Whether a layer is already visible from the fan-in cell is decided from its depth in the chain, so
+the merge never walks the parts of the chains that the branches share.
+
+A layer never changes once its cell finished executing, and cells only execute once all of their parents finished, so
+what a layer sees through its parents never changes either. Each layer caches the names it looked up through its
+parents, including misses like builtins, in every layer the lookup walked through. A name is looked up through any one
+layer at most once, and lookups stay O(1) however long the chain gets.
+
+Copy-on-write applies to names, not to objects: a list created by a parent and appended to in place by two branches is
+still shared between them.
+"""
+
+# Cached result of looking up a name that none of a layer's parents have
+_MISSING = object()
+
+# Result of looking up a name that isn't cached
+_UNRESOLVED = object()
+
+
+class Namespace(dict):
+
+    def __init__(self, parent=None, owner=None):
+        """
+        :param parent: Namespace to fall back on when a variable isn't in this layer
+        :param owner: Name of the cell that writes to this layer, used in merge messages
+        """
+        super().__init__()
+        self.parent = parent
+        self.owner = owner
+        # Variables deleted in this layer that would otherwise be visible through the parent
+        self.deleted = set()
+        # Number of layers above this one
+        self.depth = parent.depth + 1 if parent is not None else 0
+        # Values of variables as seen through the parents, _MISSING for those they don't have
+        self.resolved = {}
+
+    def __missing__(self, name):
+        # Called by exec on lookups that miss this layer
+        if name in self.deleted:
+            raise KeyError(name)
+
+        value = self.resolve(name)
+        if value is _MISSING:
+            raise KeyError(name)
+        return value
+
+    def resolve(self, name):
+        """:return: Value of `name` as seen through this layer's parents, or _MISSING if they don't have it."""
+        walked = []
+        value = _MISSING
+
+        layer = self
+        while layer.parent is not None:
+            cached = layer.resolved.get(name, _UNRESOLVED)
+            if cached is not _UNRESOLVED:
+                value = cached
+                break
+
+            walked.append(layer)
+            parent = layer.parent
+            if dict.__contains__(parent, name):
+                value = dict.__getitem__(parent, name)
+                break
+            if name in parent.deleted:
+                break
+            layer = parent
+
+        # None of the walked layers have or deleted `name` themselves, so they all see the same value
+        for layer in walked:
+            layer.resolved[name] = value
+        return value
+
+    def __delitem__(self, name):
+        if not self.has(name):
+            raise KeyError(name)
+
+        dict.pop(self, name, None)
+        if self.parent is not None and self.parent.has(name):
+            self.deleted.add(name)
+
+    def has(self, name):
+        """:return: Whether `name` is visible from this layer."""
+        try:
+            self[name]
+            return True
+        except KeyError:
+            return False
+
+    def chain(self):
+        """:return: List of layers from this one up to the base of the chain."""
+        layers = []
+        layer = self
+        while layer is not None:
+            layers.append(layer)
+            layer = layer.parent
+        return layers
+
+    def flatten(self):
+        """:return: Plain dict of every variable visible from this layer. This is O(namespace size)."""
+        flat = {}
+        for layer in reversed(self.chain()):
+            for name in layer.deleted:
+                flat.pop(name, None)
+            flat.update(layer)
+        return flat
+
+    def changes_since(self, stop_layers):
+        """
+        :param stop_layers: Set of ids of layers whose contents should be ignored
+        :return: (dict of variables assigned since the first stop layer, set of variables deleted since then)
+        """
+        changed = {}
+        deleted = set()
+
+        layer = self
+        while layer is not None and id(layer) not in stop_layers:
+            for name, value in layer.items():
+                if name not in changed and name not in deleted:
+                    changed[name] = value
+            for name in layer.deleted:
+                if name not in changed and not dict.__contains__(layer, name):
+                    deleted.add(name)
+            layer = layer.parent
+
+        changed.pop("__builtins__", None)
+        return changed, deleted
+
+    @classmethod
+    def fan_in(cls, parents, owner=None):
+        """
+        Creates a layer for a cell with one or more parents.
+
+        :param parents: List of parent Namespaces, in merge order
+        :param owner: Name of the cell that will write to the new layer
+        :return: (new Namespace, list of (variable, earlier owner, later owner) tuples for the variables that two
+                 branches wrote)
+        """
+        layer = cls(parents[0], owner)
+        conflicts = []
+
+        if len(parents) == 1:
+            return layer, conflicts
+
+        # Layers of the first parent's chain, nearest first, as far up as merges needed them
+        primary = [parents[0]]
+        # Ids of the layers of the branches merged so far that aren't on the first parent's chain
+        merged = set()
+
+        def visible(ancestor):
+            # Whether the contents of `ancestor` are already visible through the new layer's chain
+            if id(ancestor) in merged:
+                return True
+            steps = parents[0].depth - ancestor.depth
+            if steps < 0:
+                return False
+            while len(primary) <= steps:
+                primary.append(primary[-1].parent)
+            return primary[steps] is ancestor
+
+        # Who last wrote each variable
+        writers = None
+
+        for other in parents[1:]:
+            branch = []
+            common = other
+            while common is not None and not visible(common):
+                branch.append(common)
+                common = common.parent
+
+            stop = {id(common)} if common is not None else set()
+            changed, deleted = other.changes_since(stop)
+
+            if writers is None:
+                # Only the first merge needs the primary branch's own changes, later merges record into `writers`
+                primary_changed, primary_deleted = parents[0].changes_since(stop)
+                writers = {name: parents[0].owner for name in set(primary_changed) | primary_deleted}
+
+            for name in set(changed) | deleted:
+                if name in writers:
+                    conflicts.append((name, writers[name], other.owner))
+                writers[name] = other.owner
+
+            for name in deleted:
+                dict.pop(layer, name, None)
+                layer.deleted.add(name)
+            layer.update(changed)
+
+            merged.update(id(ancestor) for ancestor in branch)
+
+        return layer, conflicts
@@ -0,0 +1,332 @@
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+
+from .satx import iter_lines
+
+"""
+Notebook formats other than .satx.
+
+.satb is an indexed binary format. A file starts with a fixed size header, followed by blocks of UTF-8 text (cell
+contents, cell outputs and a summary of the session output) and an index. The index is JSON and describes the graph:
+every cell's name, content type, position and recent execution durations along with the offset and length of its
+blocks, and every link. The header holds the offset and length of the current index:
+
+    magic (4 bytes) | format version (uint16) | index offset (uint64) | index length (uint64)
+
+Loading only reads the header and the index, the file stays memory-mapped and each cell reads its blocks the first
+time its content or output is used. Saving to the file a notebook was loaded from appends the blocks of cells that
+changed and a new index, then points the header at the new index. Blocks of unchanged cells are shared between the old
+and new index. Once most of the file is no longer referenced, it is rewritten from scratch.
+
+.py and .ipynb files are read into the same statements as parse_satx produces, so converting between any of the
+formats keeps cells, links, positions and execution durations. .ipynb files also keep each cell's output, and .satb
+files keep everything.
+
+In .py files each cell starts with a "# <name content_type>" comment, and positions, durations and links are kept in
+similar comments at the end. Lines of a cell that look like one of these comments are written with an extra "#", which
+is taken off again when the file is read.
+"""
+
+MAGIC = b"SATB"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHQQ")
+
+# Files smaller than this are never compacted
+COMPACT_MIN_BYTES = 1024 ** 2
+
+# Extensions of the formats save and load understand
+EXTENSIONS = (".satx", ".satb", ".py", ".ipynb")
+
+# Files written before the content type was part of the marker only have the name
+_PY_CELL = re.compile(r"^# <(\S+)(?: (python|markdown))?>$")
+_PY_LINK = re.compile(r"^# <link (\S+) (\S+)>$")
+_PY_POSITION = re.compile(r"^# <position (\S+) (\S+) (\S+)>$")
+_PY_DURATIONS = re.compile(r"^# <durations (\S+)((?: \S+)*)>$")
+_PY_EOF = "# <EOF>"
+_PY_MARKDOWN = "\"\"\""
+# Lines of cell contents that look like markers, or like escaped ones, are written with one more "#"
+_PY_MARKER_LIKE = re.compile(r"^#+ <.*>$")
+_PY_ESCAPED = re.compile(r"^##+ <.*>$")
+
+
+class BinaryNotebook:
+
+    def __init__(self, path):
+        """
+        An open .satb file that cells read their blocks from.
+
+        :param path: Path of the file
+        """
+        self.path = os.path.abspath(path)
+        self.file = open(self.path, "rb")
+        stat = os.fstat(self.file.fileno())
+        # Saving a new file to the same path replaces it, this tells the two apart
+        self.identity = (stat.st_dev, stat.st_ino)
+        self.map = None
+
+        self.lock = threading.Lock()
+
+        magic, version, index_offset, index_length = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(path + " is not a .satb file")
+        if version > FORMAT_VERSION:
+            raise ValueError(path + " was saved by a newer version of Satyrn")
+
+        self.index = json.loads(self.read((index_offset, index_length)))
+
+    def read(self, span):
+        """
+        :param span: (offset, length) of a block
+        :return: The block's text
+        """
+        offset, length = span
+        if not length:
+            return ""
+
+        with self.lock:
+            if self.map is None or len(self.map) < offset + length:
+                # The file grew since it was mapped
+                self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            return self.map[offset:offset + length].decode("utf-8")
+
+    def is_file(self, path):
+        """:return: Whether `path` is the file this notebook has open."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return (stat.st_dev, stat.st_ino) == self.identity
+
+
+def load_binary(graph, path):
+    """
+    Adds the cells and links of a .satb file to an empty graph. Cell contents and outputs are read when first used.
+
+    :param graph: Graph to fill
+    :param path: Path of the file
+    :return: The session output summary saved in the file
+    """
+    notebook = BinaryNotebook(path)
+    index = notebook.index
+
+    from .interpreter import Cell
+
+    for entry in index["cells"]:
+        cell = Cell(entry["name"], entry["content_type"], top_=entry["top"], left_=entry["left"])
+        cell.attach(notebook, entry["content"], entry["output"])
+        cell.durations = entry.get("durations", [])
+        graph.add_cell(cell)
+
+    for first, second in index["links"]:
+        graph.connect_cells(graph.names_to_indeces[first], graph.names_to_indeces[second])
+
+    graph.notebook = notebook
+    return notebook.read(index["output"])
+
+
+def save_binary(graph, path, output=""):
+    """
+    Saves a graph as a .satb file. If the graph was loaded from or last saved to `path`, only the blocks that changed
+    are written.
+
+    :param graph: Graph to save
+    :param path: Path of the file
+    :param output: Session output to save along with the graph
+    """
+    notebook = getattr(graph, "notebook", None)
+    cells = [graph.get_cell("", idx) for idx in graph.get_lookup_table()]
+    names = graph.get_lookup_table()
+    links = [[names[first], names[second]] for first, second in graph.graph.edges]
+
+    if notebook is not None and notebook.is_file(path):
+        # Blocks still stored in the file are reused
+        appended = bytearray()
+        start = os.path.getsize(path)
+        spans = []
+
+        def block(text):
+            data = text.encode("utf-8")
+            appended.extend(data)
+            return start + len(appended) - len(data), len(data)
+
+        for cell in cells:
+            stored = cell.store is notebook
+            content_span = cell.content_span if stored and cell.content_span else block(cell.content)
+            output_span = cell.output_span if stored and cell.output_span else block(cell.output)
+            spans.append((content_span, output_span))
+        output_span = block(output)
+
+        live = sum(span[1] for pair in spans for span in pair) + output_span[1]
+        total = start + len(appended)
+
+        if total < COMPACT_MIN_BYTES or total < 2 * live:
+            index = _index(cells, spans, links, output_span)
+            index_span = (total, len(index))
+
+            with open(path, "r+b") as file:
+                file.seek(start)
+                file.write(appended)
+                file.write(index)
+                file.flush()
+                os.fsync(file.fileno())
+                # The new index only takes effect once everything it points to is on disk
+                file.seek(0)
+                file.write(HEADER.pack(MAGIC, FORMAT_VERSION, *index_span))
+                file.flush()
+                os.fsync(file.fileno())
+
+            for cell, (content_span, output_span) in zip(cells, spans):
+                cell.attach(notebook, content_span, output_span, loaded=True)
+            return
+
+    _write_binary(graph, cells, links, path, output)
+
+
+def _index(cells, spans, links, output_span):
+    # JSON index of a .satb file
+    return json.dumps({"cells": [{"name": cell.name,
+                                  "content_type": cell.content_type,
+                                  "top": cell.top,
+                                  "left": cell.left,
+                                  "durations": cell.durations,
+                                  "content": content_span,
+                                  "output": output_span} for cell, (content_span, output_span) in zip(cells, spans)],
+                       "links": links,
+                       "output": output_span}).encode("utf-8")
+
+
+def _write_binary(graph, cells, links, path, output):
+    # Writes a complete .satb file next to `path` and moves it into place
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+
+    with os.fdopen(fd, "wb") as file:
+        file.write(b"\0" * HEADER.size)
+        position = HEADER.size
+        spans = []
+
+        def block(text):
+            nonlocal position
+            data = text.encode("utf-8")
+            file.write(data)
+            position += len(data)
+            return position - len(data), len(data)
+
+        for cell in cells:
+            spans.append((block(cell.content), block(cell.output)))
+        output_span = block(output)
+
+        index = _index(cells, spans, links, output_span)
+        file.write(index)
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, position, len(index)))
+
+    os.replace(tmp_path, path)
+
+    notebook = BinaryNotebook(path)
+    for cell, (content_span, output_span) in zip(cells, spans):
+        cell.attach(notebook, content_span, output_span, loaded=True)
+    graph.notebook = notebook
+
+
+def escape_py_line(line):
+    """:return: `line` of a cell's content as Graph.get_py_file writes it, so parse_py can't mistake it for a marker."""
+    return "#" + line if _PY_MARKER_LIKE.match(line) else line
+
+
+def parse_py(source):
+    """
+    :param source: String, file handle or any other iterable of lines of a .py file written by Graph.get_py_file
+    :return: Iterator over the same statements as satx.parse_satx
+    """
+    name = None
+    content_type = None
+    content = []
+    links = []
+
+    def finish():
+        quoted = len(content) > 1 and content[0] == _PY_MARKDOWN and content[-1] == _PY_MARKDOWN
+        if content_type == "markdown" or (content_type is None and quoted):
+            return "cell", ["cell", name, "markdown", "y:"], "\n".join(content[1:-1] if quoted else content)
+        return "cell", ["cell", name, "python", "y:"], "\n".join(content)
+
+    for line in iter_lines(source):
+        link = _PY_LINK.match(line)
+        position = _PY_POSITION.match(line)
+        durations = _PY_DURATIONS.match(line)
+
+        if link or position or durations or line == _PY_EOF:
+            if name is not None:
+                yield finish()
+                name = None
+            if link:
+                links.append(("command", ["link", link.group(1), link.group(2)]))
+            elif position:
+                yield "position", position.group(1), position.group(2), position.group(3)
+            elif durations:
+                yield "durations", durations.group(1), [float(token) for token in durations.group(2).split()]
+            continue
+
+        cell = _PY_CELL.match(line)
+        if cell:
+            if name is not None:
+                yield finish()
+            name, content_type = cell.groups()
+            content = []
+        elif name is not None:
+            content.append(line[1:] if _PY_ESCAPED.match(line) else line)
+
+    if name is not None:
+        yield finish()
+
+    # Links come after positions in the file, but need every cell to exist, which they do by now
+    yield from links
+
+
+def parse_ipynb(source):
+    """
+    :param source: String or file handle of an .ipynb file
+    :return: Iterator over the same statements as satx.parse_satx. Each cell's output is yielded as
+             ("cell_output", name, text)
+    """
+    import nbformat
+
+    if isinstance(source, str):
+        nb = nbformat.reads(source, as_version=4)
+    else:
+        nb = nbformat.read(source, as_version=4)
+
+    names = []
+    for number, cell in enumerate(nb.cells):
+        name = cell.metadata.get("name", "cell" + str(number))
+        names.append(name)
+        content_type = "python" if cell.cell_type == "code" else "markdown"
+        yield "cell", ["cell", name, content_type, "y:"], cell.source
+
+        position = cell.metadata.get("satyrn", {})
+        if "top" in position and "left" in position:
+            yield "position", name, position["left"], position["top"]
+        if position.get("durations"):
+            yield "durations", name, position["durations"]
+
+        output = "".join(item.get("text", "") for item in cell.get("outputs", [])
+                         if item.get("output_type") == "stream")
+        if output:
+            yield "cell_output", name, output
+
+    satyrn = nb.metadata.get("satyrn", {})
+    if "links" in satyrn:
+        for first, second in satyrn["links"]:
+            yield "command", ["link", first, second]
+    else:
+        # Notebooks from elsewhere run top to bottom
+        for first, second in zip(names, names[1:]):
+            yield "command", ["link", first, second]
+
+    if satyrn.get("output"):
+        yield "output", satyrn["output"]
@@ -0,0 +1,284 @@
+import itertools
+import mmap
+import sys
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+"""
+Output handling.
+
+The OutputLog collects everything cells print during a session, and lets clients read it incrementally. Text is stored
+UTF-8 encoded and offsets into the log count bytes, so reading whatever was written after a given offset only touches
+the bytes after it instead of the whole log. Every log has an id that changes whenever the log is replaced, so a client
+holding an offset into an old log knows to start over.
+
+Logs can grow to hundreds of MB, so only the most recent bytes are kept in memory. Whenever more than the spill
+threshold is held, it is appended to a temporary spill file, and reads of older output go through a memory map of that
+file. Only the first and last SUMMARY_SIZE bytes of a log are ever needed all at once, which is what summary() returns
+and what gets saved in .satx files.
+
+Each Cell also keeps its own output in a RingBuffer, which only holds the most recent characters up to a limit.
+
+Cells run concurrently, so swapping sys.stdout with redirect_stdout can't tell their output apart. Instead, the
+StreamRouter is installed as sys.stdout once, and every thread tells it where its own writes should go.
+"""
+
+# Default number of characters of output each cell keeps
+CELL_OUTPUT_LIMIT = 1000000
+
+# Default number of bytes of a log kept in memory before they are written to the spill file
+SPILL_THRESHOLD = 8 * 1024 ** 2
+
+# Default number of bytes returned by one read of a log
+PAGE_SIZE = 1024 ** 2
+
+# Number of bytes from each end of a log that make up its summary
+SUMMARY_SIZE = 64 * 1024
+
+_log_ids = itertools.count(1)
+
+
+def _char_boundary(data, end):
+    # Moves `end` back to the start of the UTF-8 character that data[end] belongs to, so slices never split one
+    start = max(0, end - 3)
+    while end > start and data[end] & 0xC0 == 0x80:
+        end -= 1
+    return end
+
+
+class OutputLog:
+
+    def __init__(self, spill_threshold=SPILL_THRESHOLD):
+        """
+        Thread-safe, append-only text buffer. Can be used in place of a StringIO with redirect_stdout.
+
+        :param spill_threshold: Number of bytes kept in memory before they are written to a spill file
+        """
+        self.id = str(next(_log_ids))
+        self.spill_threshold = spill_threshold
+
+        # The first bytes of the log, kept for summary(). A few extra are kept to find where a character ends
+        self.head = bytearray()
+        # Bytes after those in the spill file
+        self.tail = bytearray()
+        self.spill_file = None
+        self.spilled = 0
+        # Memory map of the spill file, remapped when reads need more than it covers
+        self.map = None
+        self.length = 0
+
+        self.changed = threading.Condition()
+
+    def write(self, text):
+        """:param text: Text to append to the log."""
+        if not text:
+            return 0
+
+        data = text.encode("utf-8", "surrogateescape")
+
+        with self.changed:
+            if len(self.head) < SUMMARY_SIZE + 4:
+                self.head += data[:SUMMARY_SIZE + 4 - len(self.head)]
+            self.tail += data
+            self.length += len(data)
+
+            if len(self.tail) > self.spill_threshold:
+                self._spill()
+
+            self.changed.notify_all()
+
+        return len(text)
+
+    def _spill(self):
+        # Moves everything in memory to the end of the spill file, called with the lock held
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(prefix="satyrn-output-")
+        self.spill_file.write(self.tail)
+        self.spill_file.flush()
+        self.spilled += len(self.tail)
+        self.tail = bytearray()
+
+    def flush(self):
+        # Nothing is buffered
+        pass
+
+    def _read_bytes(self, start, end):
+        # Bytes start:end of the log, called with the lock held
+        parts = []
+
+        if start < self.spilled:
+            if self.map is None or len(self.map) < min(end, self.spilled):
+                if self.map is not None:
+                    self.map.close()
+                self.map = mmap.mmap(self.spill_file.fileno(), self.spilled, access=mmap.ACCESS_READ)
+            parts.append(self.map[start:min(end, self.spilled)])
+
+        if end > self.spilled:
+            parts.append(bytes(self.tail[max(start, self.spilled) - self.spilled:end - self.spilled]))
+
+        return b"".join(parts)
+
+    def getvalue(self):
+        """:return: Everything written to the log. This reads the whole spill file, prefer read() or summary()."""
+        with self.changed:
+            return self._read_bytes(0, self.length).decode("utf-8", "replace")
+
+    def read(self, offset=0, limit=None):
+        """
+        :param offset: Number of bytes the reader already has
+        :param limit: Maximum number of bytes to return, None returns everything after `offset`
+        :return: (text written after `offset`, offset to read from next time)
+        """
+        with self.changed:
+            offset = max(0, min(offset, self.length))
+            end = self.length if limit is None else min(self.length, offset + limit)
+
+            if end < self.length:
+                # Look one byte past the page, the next read picks up any character the page would have split
+                data = self._read_bytes(offset, end + 1)
+                cut = _char_boundary(data, end - offset)
+                if cut == 0:
+                    # The page is smaller than its first character, return the whole character instead
+                    data = self._read_bytes(offset, min(self.length, offset + 4))
+                    cut = 1
+                    while cut < len(data) and data[cut] & 0xC0 == 0x80:
+                        cut += 1
+                end = offset + cut
+                data = data[:cut]
+            else:
+                data = self._read_bytes(offset, end)
+
+            return data.decode("utf-8", "replace"), end
+
+    def summary(self):
+        """:return: The first and last SUMMARY_SIZE bytes of the log, or all of it if it is short."""
+        with self.changed:
+            if self.length <= 2 * SUMMARY_SIZE:
+                return self._read_bytes(0, self.length).decode("utf-8", "replace")
+
+            head = bytes(self.head[:_char_boundary(self.head, SUMMARY_SIZE)])
+            tail = self._read_bytes(self.length - SUMMARY_SIZE, self.length)
+            while tail and tail[0] & 0xC0 == 0x80:
+                tail = tail[1:]
+
+            omitted = self.length - len(head) - len(tail)
+            return (head.decode("utf-8", "replace") +
+                    "\n... [" + str(omitted) + " bytes of output omitted] ...\n" +
+                    tail.decode("utf-8", "replace"))
+
+    def wait(self, offset, timeout=None):
+        """
+        Blocks until the log is longer than `offset` or `timeout` seconds pass.
+
+        :return: Whether there is new text to read
+        """
+        with self.changed:
+            return self.changed.wait_for(lambda: self.length > offset, timeout)
+
+
+class RingBuffer:
+
+    def __init__(self, limit=CELL_OUTPUT_LIMIT):
+        """
+        Thread-safe text buffer that only keeps the last `limit` characters written to it.
+
+        :param limit: Maximum number of characters to keep
+        """
+        self.limit = limit
+        self.chunks = deque()
+        self.length = 0
+        # Number of characters that were written but are no longer kept
+        self.dropped = 0
+
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        """:param text: Text to append to the buffer."""
+        with self.lock:
+            self.chunks.append(text)
+            self.length += len(text)
+
+            while self.length > self.limit:
+                extra = self.length - self.limit
+                if len(self.chunks[0]) <= extra:
+                    removed = self.chunks.popleft()
+                else:
+                    removed = self.chunks[0][:extra]
+                    self.chunks[0] = self.chunks[0][extra:]
+                self.length -= len(removed)
+                self.dropped += len(removed)
+
+        return len(text)
+
+    def flush(self):
+        # Nothing is buffered
+        pass
+
+    def getvalue(self):
+        """:return: The characters the buffer kept."""
+        with self.lock:
+            return "".join(self.chunks)
+
+    def clear(self):
+        # Forget everything written so far
+        with self.lock:
+            self.chunks.clear()
+            self.length = 0
+            self.dropped = 0
+
+
+class StreamRouter:
+
+    def __init__(self, fallback):
+        """
+        File-like object that sends each thread's writes to the targets that thread chose with route().
+
+        :param fallback: Stream for threads that haven't chosen any targets, usually the original sys.stdout
+        """
+        self.fallback = fallback
+        self.local = threading.local()
+
+    def __getattr__(self, name):
+        # encoding, isatty and friends come from the real stream
+        return getattr(self.fallback, name)
+
+    def write(self, text):
+        targets = getattr(self.local, "targets", None)
+        if targets is None:
+            return self.fallback.write(text)
+        for target in targets:
+            target.write(text)
+        return len(text)
+
+    def flush(self):
+        targets = getattr(self.local, "targets", None)
+        for target in (self.fallback,) if targets is None else targets:
+            target.flush()
+
+    def current_targets(self):
+        """:return: Tuple of streams that the calling thread's writes go to."""
+        targets = getattr(self.local, "targets", None)
+        return (self.fallback,) if targets is None else targets
+
+    @contextmanager
+    def route(self, *targets):
+        """:param targets: Streams that the calling thread's writes go to until the context exits."""
+        previous = getattr(self.local, "targets", None)
+        self.local.targets = targets
+        try:
+            yield
+        finally:
+            self.local.targets = previous
+
+
+def install_router():
+    """
+    Makes sure sys.stdout is a StreamRouter, wrapping whatever sys.stdout currently is.
+
+    :return: The installed StreamRouter
+    """
+    if not isinstance(sys.stdout, StreamRouter):
+        sys.stdout = StreamRouter(sys.stdout)
+    return sys.stdout
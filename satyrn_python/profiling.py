@@ -0,0 +1,114 @@
+import traceback
+
+"""
+Execution profiling.
+
+Every cell execution records on its Cell how long it took on the wall clock and on the CPU, when it started and
+finished, and the exception it raised, if any. build_profile turns the cells of a graph's latest execution into a
+report of:
+    slowest - the cells that took longest
+    critical_path - the chain of linked cells with the largest total duration. No schedule can finish the execution
+                    faster than this chain takes
+    parallelism - how many cells ran at once on average (total duration over the wall time of the execution), compared
+                  with how many the links allow (total duration over the critical path's duration), and the most cells
+                  that were running at the same moment
+"""
+
+# Default number of cells listed as the slowest
+SLOWEST_LIMIT = 10
+
+
+def describe_exception(exception):
+    """
+    :param exception: Exception raised by a cell
+    :return: Dict with the exception's type, message and formatted traceback, safe to pickle and serialize as JSON
+    """
+    return {"type": type(exception).__name__,
+            "message": str(exception),
+            "traceback": "".join(traceback.format_exception(type(exception), exception, exception.__traceback__))}
+
+
+def cell_profile(cell):
+    """:return: Dict of the timings and outcome of `cell`'s latest execution."""
+    return {"name": cell.name,
+            "status": cell.status,
+            "duration": cell.duration,
+            "cpu_time": cell.cpu_time,
+            "started": cell.started,
+            "finished": cell.finished,
+            "exception": cell.exception}
+
+
+def critical_path(graph, order):
+    """
+    :param graph: networkx DiGraph with a Cell in each node's "data" attribute
+    :param order: Nodes to consider, in topological order. Links to other nodes are ignored
+    :return: (list of the nodes on the path with the largest total duration, that duration)
+    """
+    # Duration of the longest path ending at each node, and the node before it on that path
+    finish = {}
+    previous = {}
+
+    for node in order:
+        best = None
+        for parent in graph.predecessors(node):
+            if parent in finish and (best is None or finish[parent] > finish[best]):
+                best = parent
+        previous[node] = best
+        finish[node] = (finish[best] if best is not None else 0) + (graph.nodes[node]["data"].duration or 0)
+
+    if not finish:
+        return [], 0
+
+    node = max(finish, key=finish.get)
+    length = finish[node]
+    path = []
+    while node is not None:
+        path.append(node)
+        node = previous[node]
+
+    return path[::-1], length
+
+
+def peak_concurrency(cells):
+    """:return: Largest number of `cells` whose executions overlapped at any moment."""
+    # Finishes sort before starts at the same moment, so back to back cells don't count as overlapping
+    events = sorted([(cell.started, 1) for cell in cells] + [(cell.finished, -1) for cell in cells])
+    running = peak = 0
+    for _, change in events:
+        running += change
+        peak = max(peak, running)
+    return peak
+
+
+def finished_in(cell, run):
+    """:return: Whether `cell` finished running in execution number `run`, and not just started it."""
+    return cell.run == run and cell.finished is not None and cell.finished >= cell.started
+
+
+def build_profile(graph, limit=SLOWEST_LIMIT):
+    """
+    :param graph: Graph to profile, only cells that finished running in its latest execution are included
+    :param limit: Number of cells to list as the slowest
+    :return: Dict with the report, see the module docstring
+    """
+    nodes = [idx for idx in graph.get_lookup_table() if finished_in(graph.graph.nodes[idx]["data"], graph.runs)]
+    cells = [graph.graph.nodes[idx]["data"] for idx in nodes]
+
+    total = sum(cell.duration for cell in cells)
+    wall_time = max(cell.finished for cell in cells) - min(cell.started for cell in cells) if cells else 0
+    path, length = critical_path(graph.graph, graph.topology.sorted(nodes))
+
+    slowest = sorted(cells, key=lambda cell: cell.duration, reverse=True)[:limit]
+
+    return {"cells": len(cells),
+            "wall_time": wall_time,
+            "total_duration": total,
+            "total_cpu_time": sum(cell.cpu_time for cell in cells),
+            "slowest": [cell_profile(cell) for cell in slowest],
+            "failed": [cell_profile(cell) for cell in cells if cell.status == "failed"],
+            "critical_path": {"cells": [graph.graph.nodes[idx]["name"] for idx in path],
+                              "duration": length},
+            "parallelism": {"achieved": total / wall_time if wall_time else 1.0,
+                            "possible": total / length if length else 1.0,
+                            "peak": peak_concurrency(cells)}}
@@ -0,0 +1,109 @@
+import io
+
+"""
+Parsing of .satx files.
+
+A .satx file is a list of interpreter commands, one per line. Cells with content span several lines:
+
+    cell [name] [content_type] y:
+    [content, any number of lines]
+    ;
+
+The content ends at the first line that ends with ";". Older files put the ";" at the end of the last line of code, as
+in "print(1);", and that line is kept without it.
+
+Saved notebooks may end with sections written by the UI: the output of the last execution between DCO_START and
+DCO_END, the canvas position of each cell between POSITIONING_START and POSITIONING_END, and how long each cell's latest
+executions took, in seconds, between DURATIONS_START and DURATIONS_END.
+
+parse_satx reads lines one at a time and yields one statement per command, cell or section, so loading is linear in
+the size of the file and works directly on file handles without reading them into memory first. Statements are tuples:
+    ("command", tokens)
+    ("cell", tokens, content) - content is None for cells that were declared without content
+    ("output", text)
+    ("position", name, left, top)
+    ("durations", name, list of seconds)
+"""
+
+DCO_START = "<!--SATYRN_DCO_START-->"
+DCO_END = "<!--SATYRN_DCO_END-->"
+POSITIONING_START = "<!--SATYRN_POSITIONING_START-->"
+POSITIONING_END = "<!--SATYRN_POSITIONING_END-->"
+DURATIONS_START = "<!--SATYRN_DURATIONS_START-->"
+DURATIONS_END = "<!--SATYRN_DURATIONS_END-->"
+
+# Ending of the line that ends the content of a cell
+CONTENT_END = ";"
+
+
+def iter_lines(source):
+    """
+    :param source: String, file handle or any other iterable of lines
+    :return: Iterator over the lines of `source`, without line endings
+    """
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    for line in source:
+        yield line.rstrip("\r\n")
+
+
+def _read_until(lines, end):
+    # Collects lines up to, but not including, the first one that is exactly `end`
+    collected = []
+    for line in lines:
+        if line.strip() == end:
+            break
+        collected.append(line)
+    return collected
+
+
+def _read_content(lines):
+    # Collects the lines of a cell's content up to the line that ends it, see CONTENT_END
+    collected = []
+    for line in lines:
+        if line.rstrip().endswith(CONTENT_END):
+            last = line.rstrip()[:-len(CONTENT_END)]
+            if last.strip():
+                collected.append(last)
+            break
+        collected.append(line)
+    return collected
+
+
+def parse_satx(source):
+    """
+    :param source: String, file handle or any other iterable of lines in the .satx format
+    :return: Iterator over the statements in `source`
+    """
+    lines = iter_lines(source)
+
+    for line in lines:
+        if DCO_START in line:
+            yield "output", "\n".join(_read_until(lines, DCO_END))
+            continue
+
+        if POSITIONING_START in line:
+            for position in _read_until(lines, POSITIONING_END):
+                tokens = position.split()
+                if len(tokens) == 3:
+                    yield "position", tokens[0], tokens[1], tokens[2]
+            continue
+
+        if DURATIONS_START in line:
+            for durations in _read_until(lines, DURATIONS_END):
+                tokens = durations.split()
+                if tokens:
+                    yield "durations", tokens[0], [float(token) for token in tokens[1:]]
+            continue
+
+        tokens = line.split()
+        if not tokens:
+            continue
+
+        if tokens[0] == "cell":
+            content = None
+            if len(tokens) == 4 and "y" in tokens[3]:
+                content = "\n".join(_read_content(lines))
+            yield "cell", tokens, content
+        else:
+            yield "command", tokens
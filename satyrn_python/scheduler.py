@@ -0,0 +1,108 @@
+import heapq
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+"""
+The Scheduler runs a set of cells in dependency order. Instead of executing the graph one BFS level at a time, every
+cell keeps a count of unfinished parents and is started the moment that count reaches zero. Each cell runs exactly once,
+no matter how many paths lead to it, and a slow cell only holds back its own descendants.
+
+When more cells are ready than there are workers, the ones with the highest priority start first. Graph executions use
+each cell's bottom level as its priority: its expected duration plus the longest expected duration of any path from it
+to the end of the graph. Starting the cells at the head of the longest remaining chains first (list scheduling, as in
+HLFET) keeps a long chain from being started last, when everything else is already done and it runs alone.
+"""
+
+
+def bottom_levels(graph, order, cost):
+    """
+    :param graph: networkx DiGraph
+    :param order: Nodes to consider, in topological order. Edges to other nodes are ignored
+    :param cost: Dict of node to its expected duration
+    :return: Dict of node to its expected duration plus the largest total expected duration of a path to a descendant
+    """
+    levels = {}
+    for node in reversed(order):
+        below = [levels[child] for child in graph.successors(node) if child in levels]
+        levels[node] = cost[node] + (max(below) if below else 0)
+    return levels
+
+
+class Scheduler:
+
+    def __init__(self, graph, max_workers=None):
+        """
+        :param graph: networkx DiGraph to schedule
+        :param max_workers: Maximum number of cells running at the same time. None lets the thread pool decide
+        """
+        self.graph = graph
+        # Same default as ThreadPoolExecutor
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+
+    def run(self, nodes, run_node, on_start=None, exclusive=None, priority=None, cancel=None):
+        """
+        Execute `nodes` in dependency order. Edges to or from nodes outside of `nodes` are ignored.
+
+        :param nodes: Iterable of node indices to execute
+        :param run_node: Callable taking a node index, executed once per node
+        :param on_start: Optional callable taking a node index, called from the scheduling thread before a node starts
+        :param exclusive: Optional dict of node index to a set of node indices it must never run at the same time as
+        :param priority: Optional dict of node index to a number, ready nodes with higher numbers start first. Ties,
+                         and every node if this is None, start in the graph's node order
+        :param cancel: Optional threading.Event. Once it is set no more nodes are started, and run returns when the
+                       running ones finish
+        :return: Set of the nodes that were never started because of `cancel`
+        """
+        nodes = set(nodes)
+        if not nodes:
+            return set()
+
+        rank = {n: i for i, n in enumerate(n for n in self.graph.nodes if n in nodes)}
+        waiting_on = {n: sum(1 for p in self.graph.predecessors(n) if p in nodes) for n in nodes}
+
+        def key(n):
+            return (-priority[n] if priority else 0, rank[n], n)
+
+        ready = [key(n) for n in rank if waiting_on[n] == 0]
+        heapq.heapify(ready)
+
+        started = set()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+
+            while ready or running:
+                if cancel is not None and cancel.is_set():
+                    ready = []
+                    if not running:
+                        break
+
+                # Only hand the pool as much work as it can start, so that on_start reflects the real start order
+                held_back = []
+                while ready and len(running) < self.max_workers:
+                    n = heapq.heappop(ready)[-1]
+                    if exclusive and exclusive.get(n, set()) & set(running.values()):
+                        held_back.append(key(n))
+                        continue
+                    if on_start:
+                        on_start(n)
+                    started.add(n)
+                    running[pool.submit(run_node, n)] = n
+                for entry in held_back:
+                    heapq.heappush(ready, entry)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    n = running.pop(future)
+                    # Cells handle their own exceptions, anything raised here is a bug and should surface
+                    future.result()
+
+                    for child in self.graph.successors(n):
+                        if child not in nodes:
+                            continue
+                        waiting_on[child] -= 1
+                        if waiting_on[child] == 0:
+                            heapq.heappush(ready, key(child))
+
+        return nodes - started
@@ -0,0 +1,341 @@
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict
+
+from .jobs import JobQueue
+from .output import install_router
+
+"""
+Sessions let one server host many notebooks.
+
+Each Session has its own Interpreter, so its own graph, variables and output log, and its own JobQueue, so executions
+in different sessions run at the same time. The SessionManager creates sessions the first time their id is used and
+keeps them in least recently used order.
+
+Sessions cost memory for as long as they exist, so the manager limits them in three ways:
+    idle_timeout - Sessions that haven't been used for this long, and aren't executing, are closed
+    max_sessions - When a new session would go over this number, the least recently used idle session is closed
+    memory_limit - When the variables of all sessions add up to more than this, the least recently used sessions that
+                   aren't executing lose their variables, as if their runtime had been reset. Their cells are kept
+
+Closing a session loses its notebook unless the manager has a directory to keep notebooks in. The notebook is then
+saved there as a .satb file when the session closes and opened again the next time its id is used.
+
+The size of a session's variables is estimated with sys.getsizeof, following containers and object attributes. Large
+containers are sampled, so the estimate is cheap but approximate, and memory held by extension objects that don't
+report it is missed.
+"""
+
+# Session that requests which don't name one use. It is never closed
+DEFAULT_SESSION = "default"
+
+# Seconds a session may go unused before it is closed
+IDLE_TIMEOUT = 60 * 60
+
+# Seconds between checks for idle sessions
+SWEEP_INTERVAL = 60
+
+# Number of items measured in each container when estimating memory, larger containers are scaled up from them
+SIZE_SAMPLE = 100
+
+# Number of levels of nested containers followed when estimating memory
+SIZE_DEPTH = 20
+
+_session_id = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def valid_session_id(session_id):
+    """:return: Whether `session_id` may name a session. Ids are used in file names, so few characters are allowed."""
+    return isinstance(session_id, str) and bool(_session_id.match(session_id))
+
+
+def estimate_size(value, seen, depth=0):
+    """
+    :param value: Object to measure
+    :param seen: Set of ids of objects already measured, which are not counted again
+    :param depth: Number of containers `value` is nested in, objects nested more than SIZE_DEPTH deep aren't followed
+    :return: Estimated number of bytes used by `value` and the objects it refers to
+    """
+    # Modules are shared by every session
+    if id(value) in seen or isinstance(value, types.ModuleType):
+        return 0
+    seen.add(id(value))
+
+    try:
+        size = sys.getsizeof(value)
+    except TypeError:
+        return 0
+
+    if depth >= SIZE_DEPTH or isinstance(value, (str, bytes, bytearray, int, float, complex, bool, type(None))):
+        return size
+
+    if isinstance(value, dict):
+        # Keys and values are sampled in pairs
+        items = itertools.chain.from_iterable(value.items())
+        length = 2 * len(value)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = value
+        length = len(value)
+    elif hasattr(value, "__dict__") and not isinstance(value, (type, types.FunctionType)):
+        items = vars(value).values()
+        length = len(items)
+    else:
+        return size
+
+    items = list(itertools.islice(items, 2 * SIZE_SAMPLE if isinstance(value, dict) else SIZE_SAMPLE))
+    if not items:
+        return size
+
+    measured = sum(estimate_size(item, seen, depth + 1) for item in items)
+    return size + measured * length // len(items)
+
+
+class Session:
+
+    def __init__(self, session_id, interpreter):
+        """
+        :param session_id: Id the session is known by
+        :param interpreter: Interpreter holding the session's notebook
+        """
+        self.id = session_id
+        self.interpreter = interpreter
+        self.jobs = JobQueue()
+        self.created = time.time()
+        self.last_used = self.created
+        # Estimated bytes used by the session's variables, updated by SessionManager.check_memory
+        self.memory = 0
+
+    def busy(self):
+        """:return: Whether the session has an execution running or queued."""
+        return self.interpreter.graph.executing or self.jobs.busy()
+
+    def measure(self):
+        """:return: Estimated number of bytes used by the session's variables, None if an execution is using them."""
+        graph = self.interpreter.graph
+        seen = set()
+
+        # Executions start with write access to the graph, so none can start while this reads the variables
+        with self.interpreter.lock.read():
+            if graph.executing:
+                return None
+            layers = [graph.runtime] + list(graph.namespaces.values())
+            return sum(estimate_size(value, seen) for layer in layers for value in list(layer.values()))
+
+    def clear(self):
+        """
+        Deletes the session's variables, keeping its cells.
+
+        :return: Whether the variables were deleted. They aren't while an execution is using them
+        """
+        graph = self.interpreter.graph
+
+        with self.interpreter.lock.write():
+            if graph.executing:
+                return False
+            graph.reset_runtime()
+            return True
+
+    def to_dict(self):
+        """:return: Dict of the session's id, filename, timestamps, whether it is busy and its estimated memory."""
+        return {"id": self.id,
+                "filename": self.interpreter.filename,
+                "created": self.created,
+                "last_used": self.last_used,
+                "busy": self.busy(),
+                "memory": self.memory}
+
+
+class SessionManager:
+
+    def __init__(self, factory, idle_timeout=IDLE_TIMEOUT, max_sessions=None, memory_limit=None, directory=None,
+                 default=None):
+        """
+        :param factory: Callable taking no arguments that returns the Interpreter for a new session
+        :param idle_timeout: Seconds a session may go unused before it is closed, None to keep sessions until they are
+                             closed explicitly
+        :param max_sessions: Maximum number of sessions, None for no limit
+        :param memory_limit: Bytes the variables of all sessions may use, None for no limit
+        :param directory: Directory to save the notebooks of closed sessions in, None to discard them
+        :param default: Interpreter for the default session. If None, it is made by `factory`
+        """
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.memory_limit = memory_limit
+        self.directory = os.path.abspath(os.path.expanduser(directory)) if directory else None
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        # Session id to Session, least recently used first
+        self.sessions = OrderedDict()
+        # Ids of closed sessions whose notebooks are being saved, to Events that are set once they are
+        self.saving = {}
+        self.sessions[DEFAULT_SESSION] = Session(DEFAULT_SESSION, default if default is not None else factory())
+
+        self.stopped = threading.Event()
+        if idle_timeout is not None:
+            threading.Thread(target=self.sweep_loop, name="satyrn-sessions", daemon=True).start()
+
+    def path(self, session_id):
+        """:return: Path the notebook of session `session_id` is saved to when it closes."""
+        return os.path.join(self.directory, session_id + ".satb")
+
+    def get(self, session_id, create=True):
+        """
+        :param session_id: Id of the session, see valid_session_id
+        :param create: Whether to create the session if it doesn't exist
+        :return: The Session, or None if it doesn't exist and can't be created
+        """
+        with self.lock:
+            session = self._touch(session_id)
+            if session is not None or not create:
+                return session
+            if self._full() and not self._idle():
+                return None
+            saving = self.saving.get(session_id)
+
+        # Creating a session and opening its notebook can take a while, requests for other sessions don't wait for it
+        if saving is not None:
+            saving.wait()
+        session = Session(session_id, self.factory())
+        if self.directory and os.path.isfile(self.path(session_id)):
+            with install_router().route(session.interpreter.std_capture):
+                session.interpreter.load_notebook(self.path(session_id), run_commands=False)
+
+        evicted = None
+        with self.lock:
+            existing = self._touch(session_id)
+            if existing is not None:
+                # Another request created the session in the meantime
+                session.jobs.executor.shutdown(wait=False)
+                return existing
+
+            if self._full():
+                idle = self._idle()
+                if not idle:
+                    return None
+                evicted = self._remove(idle[0].id)
+
+            self.sessions[session_id] = session
+
+        if evicted is not None:
+            self._finish(evicted)
+        return session
+
+    def _touch(self, session_id):
+        # Called with the lock held, returns the session and marks it as the most recently used
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.last_used = time.time()
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def _full(self):
+        # Called with the lock held
+        return self.max_sessions is not None and len(self.sessions) >= self.max_sessions
+
+    def _idle(self):
+        # Called with the lock held, returns the sessions that may be closed, least recently used first
+        return [old for old in self.sessions.values() if old.id != DEFAULT_SESSION and not old.busy()]
+
+    def list(self):
+        """:return: List of all sessions, least recently used first."""
+        with self.lock:
+            return list(self.sessions.values())
+
+    def close(self, session_id):
+        """
+        Closes a session, saving its notebook if the manager has a directory for them.
+
+        :param session_id: Id of the session
+        :return: Whether the session existed and was closed. The default session and busy sessions are never closed
+        """
+        with self.lock:
+            session = self._remove(session_id)
+        if session is None:
+            return False
+
+        self._finish(session)
+        return True
+
+    def _remove(self, session_id):
+        # Called with the lock held, returns the removed session or None if it can't be closed. _finish completes the
+        # closing without the lock
+        session = self.sessions.get(session_id)
+        if session is None or session_id == DEFAULT_SESSION or session.busy():
+            return None
+
+        del self.sessions[session_id]
+        if self.directory:
+            # The session's notebook is only opened again once it has been saved
+            self.saving[session_id] = threading.Event()
+        return session
+
+    def _finish(self, session):
+        # Saves the notebook of a session removed by _remove and stops its jobs
+        if self.directory:
+            try:
+                session.interpreter.graph.save_graph(self.path(session.id))
+            except Exception as exception:
+                print("Could not save the notebook of session " + session.id + ": " + str(exception))
+
+            with self.lock:
+                self.saving.pop(session.id).set()
+
+        session.jobs.executor.shutdown(wait=False)
+
+    def close_idle(self):
+        """Closes the sessions that have been unused for longer than the idle timeout."""
+        if self.idle_timeout is None:
+            return
+
+        cutoff = time.time() - self.idle_timeout
+        with self.lock:
+            stale = [session.id for session in self.sessions.values() if session.last_used < cutoff]
+            closed = [self._remove(session_id) for session_id in stale]
+
+        for session in closed:
+            if session is not None:
+                self._finish(session)
+
+    def check_memory(self):
+        """
+        Measures the variables of every session, and if together they use more than the memory limit, clears the
+        variables of the least recently used sessions that aren't executing until they don't.
+        """
+        if self.memory_limit is None:
+            return
+
+        sessions = self.list()
+        for session in sessions:
+            # Sessions that are executing keep their last measurement
+            memory = session.measure()
+            if memory is not None:
+                session.memory = memory
+
+        total = sum(session.memory for session in sessions)
+        for session in sessions:
+            if total <= self.memory_limit:
+                break
+            if not session.memory or not session.clear():
+                continue
+
+            session.interpreter.std_capture.write("Variables were cleared to keep the server under its memory limit\n")
+            total -= session.memory
+            session.memory = 0
+
+    def sweep_loop(self):
+        # Runs on a daemon thread for as long as the manager exists
+        while not self.stopped.wait(SWEEP_INTERVAL):
+            self.close_idle()
+
+    def stop(self):
+        """Stops checking for idle sessions."""
+        self.stopped.set()
@@ -68,6 +68,7 @@ function reload_context_menu(lang){
     $(iframe).find('li[data-action="link_cell"]').text(lang.context_link);
     $(iframe).find('li[data-action="destroy_cell"]').text(lang.context_destroy);
     $(iframe).find('li[data-action="individual_execute"]').text(lang.context_execute);
+    $(iframe).find('li[data-action="execute_up_to"]').text(lang.context_execute_up_to);
     $(iframe).find('li[data-action="dupe_cell"]').text(lang.context_dupe);
 }
 
@@ -145,6 +146,7 @@ function on_page_load(){
                     for(var i = 0; i < names.length; i++){
                         create_cell($("iframe").contents(), names[i], contents[i], content_types[i], tops[i], lefts[i]);
                     }
+                    update_node_layers();
 
                     $("#file-input").val(null);
 
@@ -184,23 +186,18 @@ var just_finished = false;
 var codemirrors = [];
 
 function update_node_layers(){
-    for(var i = 0; i < cell_names.length; i++){
-        var n = cell_names[i];
-
-        layer = " "
-
-        $.ajax({
-            type : "POST",
-            url : "/get_layer/",
-            dataType: "json",
-            data: JSON.stringify({"cell_name": clicked_textarea}),
-            contentType: "application/json",
-            complete: function(){
-                is_executing = true;
-                just_finished = false;
+    // Each cell's label shows its layer, the length of the longest chain of links from the root to it
+    $.ajax({
+        type : "GET",
+        url : "/get_layers/",
+        dataType: "json",
+        success: function (layers) {
+            var doc = $("#canvas").contents();
+            for(var name in layers){
+                doc.find("[id='graph_level" + name + "']").text("[" + layers[name] + "]");
             }
-        });
-    }
+        }
+    });
 }
 
 function setup_keyboard_shortcuts(doc){
@@ -214,7 +211,8 @@ function setup_keyboard_shortcuts(doc){
             dataType: "json",
             data: JSON.stringify({"cell_name": clicked_textarea}),
             contentType: "application/json",
-            complete: function(){
+            complete: function(o){
+                track_job(o);
                 is_executing = true;
                 just_finished = false;
             }
@@ -246,7 +244,7 @@ function setup_keyboard_shortcuts(doc){
         });
     });
     $(doc).bind("keyup", "Ctrl+c", function(){
-        console.log("Interrupt");
+        cancel_job();
     });
     $(doc).bind("keyup", "Ctrl+d", function(){
         $.ajax({
@@ -304,6 +302,13 @@ function updateDCO(appended_string){
        textarea.scrollTop(textarea[0].scrollHeight - textarea.height());
 }
 
+function appendDCO(appended_string){
+    var textarea = $("#dynamic_code_output")
+    textarea.val(textarea.val() + appended_string);
+    if(textarea.length)
+       textarea.scrollTop(textarea[0].scrollHeight - textarea.height());
+}
+
 function add_codemirror_editor(doc, ta_id, value="\n\n", contentType){
     var cm = CodeMirror(doc.querySelector(ta_id), {
         lineNumbers: true,
@@ -477,6 +482,7 @@ $(window).load(function () {
                 for(var i = 0; i < names.length; i++){
                     create_cell($("iframe").contents(), names[i], contents[i], content_types[i], tops[i], lefts[i]);
                 }
+                update_node_layers();
 
                 $.ajax({
                     type : "GET",
@@ -525,6 +531,7 @@ function on_iframe_load(){
     $(iframe).find('li[data-action="link_cell"]').text(lang.context_link);
     $(iframe).find('li[data-action="destroy_cell"]').text(lang.context_destroy);
     $(iframe).find('li[data-action="individual_execute"]').text(lang.context_execute);
+    $(iframe).find('li[data-action="execute_up_to"]').text(lang.context_execute_up_to);
     $(iframe).find('li[data-action="dupe_cell"]').text(lang.context_dupe);
 
     $(doc).delegate("textarea", "keydown", function(e) {
@@ -693,7 +700,22 @@ function on_iframe_load(){
                     dataType: "json",
                     data: JSON.stringify({"cell_name": right_clicked_cell}),
                     contentType: "application/json",
-                    complete: function(){
+                    complete: function(o){
+                        track_job(o);
+                        is_executing = true;
+                        just_finished = false;
+                    }
+                });
+                break;
+            case "execute_up_to":
+                $.ajax({
+                    type : "POST",
+                    url : "/execute_up_to/",
+                    dataType: "json",
+                    data: JSON.stringify({"cell_name": right_clicked_cell}),
+                    contentType: "application/json",
+                    complete: function(o){
+                        track_job(o);
                         is_executing = true;
                         just_finished = false;
                     }
@@ -1052,7 +1074,8 @@ $(document).on("click", "a, li", function(){
                 dataType: "json",
                 data: JSON.stringify({"cell_name": clicked_textarea}),
                 contentType: "application/json",
-                complete: function(){
+                complete: function(o){
+                    track_job(o);
                     is_executing = true;
                     just_finished = false;
                 }
@@ -1131,6 +1154,26 @@ var started_ta_edit = false;
 //bool for if user is linking one cell to another
 var attempting_to_link = false;
 
+// Id of the latest execution job, executions run in the background on the server
+var current_job = null;
+
+function track_job(o){
+    if(o.responseJSON && o.responseJSON["id"]){
+        current_job = o.responseJSON["id"];
+    }
+}
+
+function cancel_job(){
+    if(current_job === null){
+        return;
+    }
+    $.ajax({
+        type : "POST",
+        url : "/jobs/" + current_job + "/cancel/",
+        dataType: "json"
+    });
+}
+
 function bfs_execute(){
     is_executing = true;
     just_finished = false;
@@ -1138,35 +1181,51 @@ function bfs_execute(){
     $.ajax({
         type : "POST",
         url : "/bfs_execute/",
-        success: function (success) {
-            if(success == "500"){
+        dataType: "json",
+        complete: function (o) {
+            if(o.status != 200){
                 is_executing = false;
                 just_finished = false;
                 $("#execution_status").hide();
                 alert(lang.execution_error);
             }
+            else{
+                track_job(o);
+            }
         }
     });
 }
 
+var graph_version = 0;
+
 function update_positions(){
+    // Every position goes to the server in a single batch
+    var operations = [];
     $("#canvas").contents().find(".ui-draggable").each( function(){
         var cell_name = $(this).attr("class").substring(0, $(this).attr("class").indexOf("ui-draggable"));
-        var top = $(this).css("top");
-        var left = $(this).css("left");
 
-        $.ajax({
-            type : "POST",
-            url : "/update_position/",
-            data : JSON.stringify({
-                "cell_name": cell_name,
-                "top" : top,
-                "left" : left
-            }),
-            dataType: "json",
-            contentType: "application/json",
+        operations.push({
+            "op": "move",
+            "name": cell_name.trim(),
+            "top": $(this).css("top"),
+            "left": $(this).css("left")
         });
     });
+
+    if(operations.length === 0){
+        return;
+    }
+
+    $.ajax({
+        type : "POST",
+        url : "/batch/",
+        data : JSON.stringify({"operations": operations}),
+        dataType: "json",
+        contentType: "application/json",
+        success: function (data) {
+            graph_version = data["version"];
+        }
+    });
 };
 
 const throttle = (callback, delay) => {
@@ -1210,32 +1269,46 @@ const debounce = (func, wait) => {
     };
 };
 
+// Only new output is requested, dco_log changes whenever the server starts a new output log
+var dco_offset = 0;
+var dco_log = null;
+
+function poll_output(on_done){
+    $.ajax({
+        type : "GET",
+        url : "/output_since/",
+        data : {"offset": dco_offset, "log": dco_log},
+        dataType: "json",
+        success: function (data) {
+            if(data["reset"] || dco_log === null){
+                updateDCO(data["output"]);
+            }
+            else if(data["output"].length > 0){
+                appendDCO(data["output"]);
+            }
+            dco_log = data["log"];
+            dco_offset = data["offset"];
+
+            if(data["more"]){
+                // Output is sent in pages, keep asking until caught up
+                poll_output(on_done);
+            }
+            else if(data["done"] && on_done){
+                on_done();
+            }
+        }
+    });
+}
+
 var throttle_func = throttle(function() {
     if(is_executing){
-        $.ajax({
-            type : "GET",
-            url : "/dynamic_cell_output/",
-            success: function (data) {
-                if(data.includes("<!--SATYRN_DONE_EXECUTING-->")){
-                    is_executing = false;
-                    just_finished = true;
-                    data = data.substring(28);
-                }
-                updateDCO(data);
-            }
+        poll_output(function(){
+            is_executing = false;
+            just_finished = true;
         });
     }
     else if(just_finished){
-        $.ajax({
-            type : "GET",
-            url : "/dynamic_cell_output/",
-            success: function (data) {
-                if(data.includes("<!--SATYRN_DONE_EXECUTING-->")){
-                    data = data.substring(28);
-                }
-                updateDCO(data);
-            }
-        });
+        poll_output();
         just_finished = false;
         is_executing = false;
     }
@@ -1243,30 +1316,13 @@ var throttle_func = throttle(function() {
 
 var debounce_func = debounce(function(){
     if(is_executing){
-        $.ajax({
-            type : "GET",
-            url : "/dynamic_cell_output/",
-            success: function (data) {
-                if(data.includes("<!--SATYRN_DONE_EXECUTING-->")){
-                    is_executing = false;
-                    just_finished = true;
-                    data = data.substring(28);
-                }
-                updateDCO(data);
-            }
+        poll_output(function(){
+            is_executing = false;
+            just_finished = true;
         });
     }
     else if(just_finished){
-        $.ajax({
-            type : "GET",
-            url : "/dynamic_cell_output/",
-            success: function (data) {
-                if(data.includes("<!--SATYRN_DONE_EXECUTING-->")){
-                    data = data.substring(28);
-                }
-                updateDCO(data);
-            }
-        });
+        poll_output();
         just_finished = false;
         is_executing = false;
         $("#execution_status").hide();
@@ -0,0 +1,106 @@
+"""
+The TopologicalOrder keeps a topological order of a graph up to date while edges are inserted, using the dynamic
+topological sort algorithm by Pearce and Kelly.
+
+Every node has a position, and every edge points from a lower position to a higher one. Inserting an edge that already
+agrees with the order costs O(1). Otherwise only the region between the two endpoints is searched: forward from the new
+child over nodes positioned before the new parent, and backward from the new parent over nodes positioned after the
+new child. If the forward search reaches the parent the edge would close a cycle. If not, the nodes found are shuffled
+within the positions they already held. Removing nodes and edges never invalidates the order.
+"""
+
+
+class TopologicalOrder:
+
+    def __init__(self, graph):
+        """:param graph: networkx DiGraph whose order is kept. Nodes and edges must be reported through this class."""
+        self.graph = graph
+        # Node to position, positions are unique but not necessarily contiguous
+        self.position = {}
+        self.next_position = 0
+
+    def add_node(self, node):
+        """:param node: Node that was just added to the graph, it has no edges yet so it can go last."""
+        self.position[node] = self.next_position
+        self.next_position += 1
+
+    def remove_node(self, node):
+        """:param node: Node that was removed from the graph."""
+        self.position.pop(node, None)
+
+    def _forward(self, start, upper_bound):
+        # Nodes reachable from start that are positioned before upper_bound
+        seen = {start}
+        stack = [start]
+        while stack:
+            for child in self.graph.successors(stack.pop()):
+                if child not in seen and self.position[child] <= upper_bound:
+                    seen.add(child)
+                    stack.append(child)
+        return seen
+
+    def _backward(self, start, lower_bound):
+        # Nodes that reach start that are positioned after lower_bound
+        seen = {start}
+        stack = [start]
+        while stack:
+            for parent in self.graph.predecessors(stack.pop()):
+                if parent not in seen and self.position[parent] > lower_bound:
+                    seen.add(parent)
+                    stack.append(parent)
+        return seen
+
+    def would_create_cycle(self, parent, child):
+        """
+        :param parent: Node the edge would start at
+        :param child: Node the edge would end at
+        :return: Whether the edge parent -> child would close a cycle
+        """
+        if parent == child:
+            return True
+        if parent not in self.position or child not in self.position:
+            return False
+        if self.position[parent] < self.position[child]:
+            return False
+        return parent in self._forward(child, self.position[parent])
+
+    def add_edge(self, parent, child):
+        """
+        Updates the order for the edge parent -> child. Call this before adding the edge to the graph.
+
+        :param parent: Node the edge starts at
+        :param child: Node the edge ends at
+        :return: False if the edge would close a cycle, in which case nothing changes
+        """
+        if parent == child:
+            return False
+
+        lower = self.position[child]
+        upper = self.position[parent]
+
+        if upper < lower:
+            return True
+
+        forward = self._forward(child, upper)
+        if parent in forward:
+            return False
+        backward = self._backward(parent, lower)
+
+        # Everything that reaches the parent goes before everything the child reaches, in the positions they held
+        by_position = self.position.__getitem__
+        nodes = sorted(backward, key=by_position) + sorted(forward, key=by_position)
+        positions = sorted(self.position[node] for node in nodes)
+
+        for node, position in zip(nodes, positions):
+            self.position[node] = position
+
+        return True
+
+    def sorted(self, nodes=None):
+        """
+        :param nodes: Iterable of nodes, defaults to every node
+        :return: List of the nodes in topological order
+        """
+        if nodes is None:
+            nodes = self.position
+        return sorted(nodes, key=self.position.__getitem__)
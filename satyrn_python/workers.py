@@ -0,0 +1,95 @@
+import pickle
+import sys
+import time
+import types
+from contextlib import redirect_stdout
+from io import StringIO
+
+from .profiling import describe_exception
+
+try:
+    # cloudpickle can serialize functions and classes defined inside of cells, plain pickle cannot
+    import cloudpickle as serializer
+except ImportError:
+    serializer = pickle
+
+"""
+Helpers for running cells in worker processes.
+
+A worker never sees the parent's namespace directly. Instead, the parent sends a snapshot in which every variable is
+pickled on its own, the worker executes the cell against a rebuilt namespace, and only the variables that the cell
+created, changed or deleted are sent back. Modules are sent by name and re-imported on the other side. Variables that
+can't be pickled are left out of the snapshot and reported back to the user.
+"""
+
+
+def snapshot_namespace(namespace):
+    """
+    :param namespace: dict of variables created by cells
+    :return: (snapshot, names of variables that could not be pickled)
+    """
+    snapshot = {}
+    skipped = []
+
+    for name, value in dict(namespace).items():
+        if name == "__builtins__":
+            continue
+        if isinstance(value, types.ModuleType):
+            snapshot[name] = ("module", value.__name__)
+            continue
+        try:
+            snapshot[name] = ("value", serializer.dumps(value))
+        except Exception:
+            skipped.append(name)
+
+    return snapshot, skipped
+
+
+def restore_namespace(snapshot):
+    """
+    :param snapshot: Output of snapshot_namespace
+    :return: dict of live variables
+    """
+    namespace = {}
+
+    for name, (kind, payload) in snapshot.items():
+        if kind == "module":
+            __import__(payload)
+            namespace[name] = sys.modules[payload]
+        else:
+            namespace[name] = pickle.loads(payload)
+
+    return namespace
+
+
+def execute_in_worker(cell_name, content, snapshot):
+    """
+    Executes a cell's content in the current process. Intended to be submitted to a process pool.
+
+    :param cell_name: Name of the cell, used in error messages
+    :param content: Python code to execute
+    :param snapshot: Output of snapshot_namespace for the variables the cell can see
+    :return: (snapshot of changed variables, names of deleted variables, names of unsendable variables, stdout,
+              profiling.describe_exception of the exception the cell raised or None, CPU seconds the cell took)
+    """
+    namespace = restore_namespace(snapshot)
+    output = StringIO()
+    error = None
+    cpu_started = time.process_time()
+
+    with redirect_stdout(output):
+        try:
+            exec(content, namespace)
+        except Exception as exception:
+            print("Exception occurred in cell " + cell_name)
+            print(exception)
+            error = describe_exception(exception)
+
+    cpu_time = time.process_time() - cpu_started
+
+    # Anything that could not be pickled was created by this cell, since the snapshot only holds picklable values
+    after, skipped = snapshot_namespace(namespace)
+    delta = {name: entry for name, entry in after.items() if snapshot.get(name) != entry}
+    removed = [name for name in snapshot if name not in namespace]
+
+    return delta, removed, skipped, output.getvalue(), error, cpu_time
@@ -0,0 +1,57 @@
+import asyncio
+import json
+
+from satyrn_python.app import create_app
+from satyrn_python.asgi import ASGIAdapter
+from satyrn_python.interpreter import Interpreter
+
+
+async def call(adapter, method, path, body=b""):
+    """:return: (status, body) of the response of `adapter` to a request."""
+    scope = {"type": "http", "method": method, "path": path, "query_string": b"", "http_version": "1.1",
+             "headers": [(b"content-type", b"application/json")]}
+    sent = False
+    response = {"status": None, "body": b""}
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # The client stays connected
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        else:
+            response["body"] += message.get("body", b"")
+
+    await adapter(scope, receive, send)
+    return response["status"], response["body"]
+
+
+def test_open_streams_dont_hold_threads():
+    interpreter = Interpreter()
+    interpreter.run_string("cell slow python y:\nimport time\ntime.sleep(1.5)\n;\n")
+    adapter = ASGIAdapter(create_app(interpreter, "english"), threads=2)
+
+    async def run():
+        status, _ = await call(adapter, "POST", "/bfs_execute/", b"{}")
+        assert status == 200
+
+        streams = [asyncio.ensure_future(call(adapter, "GET", "/output_stream/")) for _ in range(6)]
+        await asyncio.sleep(0.2)
+
+        # Answered while every stream is still open and waiting for the execution to finish
+        status, body = await asyncio.wait_for(call(adapter, "GET", "/graph_version/"), 0.5)
+        assert status == 200 and json.loads(body)
+        assert not any(stream.done() for stream in streams)
+
+        for status, body in await asyncio.wait_for(asyncio.gather(*streams), 10):
+            assert status == 200 and b'"done": true' in body
+
+    try:
+        asyncio.run(run())
+    finally:
+        adapter.executor.shutdown()
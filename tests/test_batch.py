@@ -0,0 +1,19 @@
+from satyrn_python.app import create_app
+from satyrn_python.interpreter import Interpreter
+
+
+def test_malformed_batches_are_rejected():
+    client = create_app(Interpreter(), "english").test_client()
+
+    for payload in ({}, {"operations": "create"}, ["create"]):
+        response = client.post("/batch/", json=payload)
+        assert response.status_code == 400
+        assert response.get_json()["failed"] is None
+
+    response = client.post("/batch/", json={"operations": [{"op": "create"}, "delete"]})
+    assert response.status_code == 400
+    assert response.get_json()["failed"] == 1
+
+    response = client.post("/batch/", json={"operations": [{"op": "create"}]})
+    assert response.get_json()["success"]
+    assert len(response.get_json()["created"]) == 1
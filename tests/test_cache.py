@@ -0,0 +1,38 @@
+from satyrn_python.interpreter import Interpreter
+from satyrn_python.output import OutputLog, install_router
+
+NOTEBOOK = """cell a python y:
+d = {}
+lst = []
+;
+cell b python y:
+d['x'] = 1
+lst.append(2)
+;
+cell c python y:
+print(d, lst)
+;
+link a b
+link b c
+"""
+
+
+def run(cache_dir):
+    """:return: Dict of cell name to (status, output) after executing NOTEBOOK with a fresh Interpreter."""
+    interpreter = Interpreter(cache_dir=cache_dir)
+    with install_router().route(OutputLog()):
+        interpreter.run_string(NOTEBOOK)
+        interpreter.graph.bfs_traversal_execute(1)
+
+    return {name: (interpreter.graph.get_cell(name).status, interpreter.graph.get_cell(name).output)
+            for name in ("a", "b", "c")}
+
+
+def test_cache_keeps_changes_to_inherited_objects(tmp_path):
+    first = run(str(tmp_path))
+    second = run(str(tmp_path))
+
+    assert first["c"][1] == second["c"][1] == "{'x': 1} [2]\n"
+    assert second["a"][0] == "cached"
+    # b changes objects created by a, which replaying b from the cache would lose
+    assert second["b"][0] == "succeeded"
@@ -0,0 +1,37 @@
+import os
+
+from satyrn_python.interpreter import Cell, Interpreter
+from satyrn_python.output import OutputLog, install_router
+
+
+def round_trip(tmp_path, cells):
+    """
+    :param tmp_path: Directory to save the notebook in
+    :param cells: List of (name, content type, content) of the cells to save
+    :return: Dict of cell name to (content type, content) after saving the cells to a .py file and opening it again
+    """
+    path = os.path.join(str(tmp_path), "notebook.py")
+
+    with install_router().route(OutputLog()):
+        interpreter = Interpreter()
+        for name, content_type, content in cells:
+            interpreter.graph.add_cell(Cell(name, content_type, content))
+        interpreter.graph.save_graph(path)
+
+        loaded = Interpreter()
+        loaded.load_notebook(path)
+
+    return {name: (loaded.graph.get_cell(name).content_type, loaded.graph.get_cell(name).content)
+            for name in loaded.graph.get_all_cells_edges()[0]}
+
+
+def test_py_keeps_python_cells_wrapped_in_quotes(tmp_path):
+    content = '"""\nx = 1\n"""'
+    assert round_trip(tmp_path, [("docs", "python", content)]) == {"docs": ("python", content)}
+
+
+def test_py_keeps_marker_like_lines(tmp_path):
+    content = "x = 1\n# <step>\n## <step>\n# <link a b>\n# <position a 1 2>\n# <durations a 0.5>\n# <EOF>\ny = 2"
+    markdown = "# <title>\ntext"
+    assert round_trip(tmp_path, [("code", "python", content), ("notes", "markdown", markdown)]) == {
+        "code": ("python", content), "notes": ("markdown", markdown)}
@@ -0,0 +1,22 @@
+import os
+
+from satyrn_python.satx import parse_satx
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+
+def test_content_ending_with_semicolon_on_the_last_line():
+    with open(os.path.join(EXAMPLES, "recursive.satx")) as source:
+        statements = list(parse_satx(source))
+
+    assert statements == [("cell", ["cell", "a", "python", "y:"], "print(1)"),
+                          ("cell", ["cell", "b", "python", "y:"], "print(2)"),
+                          ("cell", ["cell", "c", "python", "y:"], "print(3)"),
+                          ("command", ["link", "a", "b"]),
+                          ("command", ["link", "b", "c"]),
+                          ("command", ["link", "c", "a"])]
+
+
+def test_content_ending_with_semicolon_line():
+    statements = list(parse_satx("cell a python y:\nx = 1\n  y = 2  \n;\nlink a b\n"))
+    assert statements == [("cell", ["cell", "a", "python", "y:"], "x = 1\n  y = 2  "), ("command", ["link", "a", "b"])]
@@ -0,0 +1,67 @@
+import threading
+
+from satyrn_python.app import create_app
+from satyrn_python.interpreter import Interpreter
+from satyrn_python.sessions import SessionManager
+
+
+def test_check_memory_during_a_job():
+    manager = SessionManager(Interpreter, idle_timeout=None, memory_limit=1)
+    session = manager.get("busy")
+    graph = session.interpreter.graph
+    session.interpreter.run_string("cell make python y:\nitems = {}\n;\n"
+                                   "cell grow python y:\nfor k in range(200000):\n    items[k] = [k]\n;\n"
+                                   "link make grow\n")
+    graph.bfs_traversal_execute(1, targets=["make"])
+
+    # Only grow runs, filling the dict that make's variables hold while the memory checks measure them
+    job = session.jobs.submit("execute", lambda cancel: graph.bfs_traversal_execute(1, incremental=True))
+    checks = 0
+    while not job.done.is_set():
+        manager.check_memory()
+        checks += 1
+
+    assert checks > 1
+    assert job.status == "succeeded" and job.error is None
+    assert graph.get_cell("grow").status == "succeeded"
+
+    manager.check_memory()
+    assert not graph.namespaces
+
+
+def test_clients_only_see_their_own_session():
+    app = create_app(Interpreter(), "english", factory=Interpreter, idle_timeout=None)
+    client = app.test_client()
+
+    assert client.get("/session/?session=alice").get_json()["id"] == "alice"
+    assert client.get("/session/?session=bob").get_json()["id"] == "bob"
+
+    assert client.post("/session/close/").text == "500"
+    assert client.post("/session/close/?session=alice").text == "200"
+    assert client.get("/session/?session=bob").get_json()["id"] == "bob"
+
+
+def test_creating_a_session_does_not_block_others():
+    started = threading.Event()
+    release = threading.Event()
+
+    def factory():
+        if threading.current_thread().name == "slow":
+            started.set()
+            release.wait(10)
+        return Interpreter()
+
+    manager = SessionManager(factory, idle_timeout=None)
+    manager.get("fast")
+    creating = threading.Thread(target=manager.get, args=("slow",), name="slow")
+    creating.start()
+    started.wait(10)
+
+    # The manager isn't locked while the slow session is created
+    assert manager.get("fast") is not None
+    assert manager.close("fast")
+    assert manager.get("slow", create=False) is None
+
+    release.set()
+    creating.join(10)
+    assert manager.get("slow", create=False) is not None